@@ -9,6 +9,13 @@ __version__ = "0.1.0"
 __author__ = "Proxmon Team"
 __description__ = "A Proxmox monitoring tool with Textual-based TUI"
 
-from .main import ProxmonApp, toggle_vm
+__all__ = ["ProxmonApp", "toggle_vm"]
 
-__all__ = ["ProxmonApp", "toggle_vm"]
\ No newline at end of file
+
+def __getattr__(name):
+    # Importing the package stays cheap; the TUI is only loaded when used.
+    if name in __all__:
+        from . import main
+
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""Bulk guest power actions with task tracking.
+
+Proxmox answers a start, shutdown or reboot request with the UPID of the
+task doing the work. A BulkAction submits the requests for many guests
+concurrently, at most ``ACTION_PARALLELISM`` at a time, then follows the
+returned tasks through ``/nodes/{node}/tasks/{upid}/status``: each poll
+fetches the status of every unfinished task of a cluster in one batch
+(``get_many``) until all of them have stopped or ``TASK_TIMEOUT`` passes.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from urllib.parse import quote
+
+from .utils import get_client
+
+ACTION_PARALLELISM = int(os.getenv("ACTION_PARALLELISM", 8))
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", 1))
+TASK_TIMEOUT = float(os.getenv("TASK_TIMEOUT", 300))
+
+ACTIONS = ("start", "shutdown", "reboot", "stop")
+# Task states; everything but "running" is final.
+PENDING, RUNNING, OK, FAILED, TIMEOUT = "pending", "running", "ok", "failed", "timeout"
+
+
+def resolve_action(guest, action):
+    """Turn ``toggle`` into start or shutdown depending on the guest's status."""
+    if action == "toggle":
+        return "shutdown" if guest["status"] == "running" else "start"
+    if action not in ACTIONS:
+        raise ValueError(f"unknown action {action!r}")
+    return action
+
+
+def action_path(guest, action):
+    guesttype = "qemu" if guest["type"].lower() == "vm" else "lxc"
+    return f"/nodes/{guest['node']}/{guesttype}/{guest['vmid']}/status/{action}"
+
+
+def upid_node(upid):
+    """Node a task runs on; UPIDs look like ``UPID:<node>:<pid>:...``."""
+    return upid.split(":")[1]
+
+
+def task_status_path(upid):
+    return f"/nodes/{upid_node(upid)}/tasks/{quote(upid, safe='')}/status"
+
+
+@dataclass
+class ActionTask:
+    """One guest's part of a bulk action."""
+
+    guest: dict
+    action: str
+    upid: str | None = None
+    state: str = PENDING
+    error: str | None = None
+
+    @property
+    def label(self):
+        return f"{self.guest['name']} ({self.guest['vmid']})"
+
+
+class BulkAction:
+    """Run one power action on many guests and track the resulting tasks."""
+
+    def __init__(self, guests, action, parallelism=ACTION_PARALLELISM,
+                 poll_interval=TASK_POLL_INTERVAL, timeout=TASK_TIMEOUT):
+        self.action = action
+        self.tasks = [ActionTask(guest, resolve_action(guest, action)) for guest in guests]
+        self.parallelism = max(1, parallelism)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def counts(self):
+        counts = dict.fromkeys((PENDING, RUNNING, OK, FAILED, TIMEOUT), 0)
+        for task in self.tasks:
+            counts[task.state] += 1
+        return counts
+
+    @property
+    def done(self):
+        return all(task.state not in (PENDING, RUNNING) for task in self.tasks)
+
+    def summary(self):
+        counts = self.counts()
+        parts = [f"{counts[OK]}/{len(self.tasks)} done"]
+        parts += [f"{counts[state]} {state}" for state in (RUNNING, PENDING, FAILED, TIMEOUT) if counts[state]]
+        return f"{self.action}: " + ", ".join(parts)
+
+    def submit(self, on_update=None):
+        """POST every action, ``parallelism`` at a time, and record the UPIDs."""
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="proxmon-action") as pool:
+            futures = {
+                pool.submit(get_client(task.guest["cluster"]).post, action_path(task.guest, task.action)): task
+                for task in self.tasks
+            }
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    task.upid = future.result()
+                    task.state = RUNNING if task.upid else OK
+                except Exception as e:
+                    task.state, task.error = FAILED, str(e)
+                if on_update is not None:
+                    on_update(self)
+
+    def poll(self):
+        """Fetch the status of every running task, one batch per cluster."""
+        by_cluster = {}
+        for task in self.tasks:
+            if task.state == RUNNING:
+                by_cluster.setdefault(task.guest["cluster"], []).append(task)
+        for cluster, tasks in by_cluster.items():
+            results = get_client(cluster).get_many(
+                (task_status_path(task.upid) for task in tasks), return_exceptions=True
+            )
+            for task, status in zip(tasks, results):
+                # A failed status request is retried on the next poll.
+                if isinstance(status, Exception) or status.get("status") != "stopped":
+                    continue
+                exitstatus = status.get("exitstatus", "")
+                if exitstatus == "OK" or exitstatus.startswith("WARNINGS"):
+                    task.state = OK
+                else:
+                    task.state, task.error = FAILED, exitstatus or "unknown error"
+
+    def run(self, on_update=None):
+        """Submit the actions and wait for their tasks; blocks, so call it from a worker."""
+        self.submit(on_update)
+        deadline = time.monotonic() + self.timeout
+        while not self.done:
+            if time.monotonic() >= deadline:
+                for task in self.tasks:
+                    if task.state == RUNNING:
+                        task.state = TIMEOUT
+                break
+            time.sleep(self.poll_interval)
+            self.poll()
+            if on_update is not None:
+                on_update(self)
+        return self
@@ -0,0 +1,292 @@
+"""Threshold alerts evaluated against the live snapshots.
+
+Rules are read from a TOML file (``ALERT_RULES``), one ``[[rule]]`` table
+each::
+
+    [[rule]]
+    name = "runaway guest"
+    metric = "cpu"          # see GUEST_METRICS and NODE_METRICS
+    op = ">"
+    value = 90
+    for = 60                # seconds the condition must hold (default 0)
+    match = "tag:prod"      # guests: a filter query; nodes: a name prefix
+    severity = "error"      # information, warning or error
+    command = "notify-send 'proxmon alert'"
+    webhook = "http://127.0.0.1:9000/alert"
+
+An AlertEngine keeps the last metric values of every guest and node and
+only re-evaluates those whose values changed; conditions waiting for
+their ``for`` window are tracked separately, so they fire on time even
+when the value stays the same. Firing and resolving return AlertEvents;
+``dispatch`` runs a rule's command and webhook for one in the background.
+"""
+
+import json
+import logging
+import operator
+import os
+import shlex
+import subprocess
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from .instrument import timer
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES = os.getenv("ALERT_RULES", "~/.config/proxmon/alerts.toml")
+ALERT_HOOK_TIMEOUT = float(os.getenv("ALERT_HOOK_TIMEOUT", 10))
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+SEVERITIES = ("information", "warning", "error")
+# Metric units: % for cpu/mem/load/disk, MB/s for the rates, °C.
+GUEST_METRICS = ("cpu", "mem", "netin", "netout", "diskread", "diskwrite", "status")
+NODE_METRICS = ("cpu", "load", "mem", "disk", "temperature")
+FIRING, RESOLVED = "firing", "resolved"
+
+
+def _percent(part, total):
+    return part / total * 100 if total else 0.0
+
+
+def guest_metrics(guest, rates=None):
+    """Alert metrics of a guest status entry; rates are None until known."""
+    rates = rates or {}
+    return {
+        "cpu": (guest.get("cpu") or 0) * 100,
+        "mem": _percent(guest.get("mem") or 0, guest.get("maxmem") or 0),
+        **{c: rates.get(c) for c in ("netin", "netout", "diskread", "diskwrite")},
+        "status": guest.get("status"),
+    }
+
+
+def node_metrics(status, temperature=None):
+    """Alert metrics of a node status, plus its CPU temperature if known."""
+    memory = status.get("memory") or {}
+    rootfs = status.get("rootfs") or {}
+    cores = (status.get("cpuinfo") or {}).get("cores") or 0
+    loadavg = status.get("loadavg") or [0]
+    metrics = {
+        "cpu": (status.get("cpu") or 0) * 100,
+        "load": _percent(float(loadavg[0]), cores),
+        "mem": _percent(memory.get("used") or 0, memory.get("total") or 0),
+        "disk": _percent(rootfs.get("used") or 0, rootfs.get("total") or 0),
+        "temperature": None,
+    }
+    if temperature and temperature.get("CPU") is not None:
+        metrics["temperature"] = float(temperature["CPU"])
+    return metrics
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    metric: str
+    op: str
+    value: float | str
+    duration: float = 0.0
+    scope: str = "guest"
+    match: str = ""
+    severity: str = "warning"
+    command: str | None = None
+    webhook: str | None = None
+
+    def test(self, value):
+        if value is None:
+            return False
+        try:
+            return OPERATORS[self.op](value, self.value)
+        except TypeError:
+            return False
+
+    def describe(self, value):
+        shown = f"{value:.1f}" if isinstance(value, float) else value
+        held = f" for {self.duration:g}s" if self.duration else ""
+        return f"{self.metric} {shown} {self.op} {self.value}{held}"
+
+
+@dataclass(frozen=True)
+class AlertEvent:
+    rule: Rule
+    key: tuple
+    state: str
+    value: object
+    since: float
+    timestamp: float
+
+
+def parse_rule(data, where):
+    """Build a Rule from one ``[[rule]]`` table; raises ValueError when invalid."""
+    data = dict(data)
+    if "for" in data:
+        try:
+            data["duration"] = float(data.pop("for"))
+        except (TypeError, ValueError):
+            raise ValueError(f"{where}: 'for' must be a number of seconds") from None
+    unknown = data.keys() - Rule.__dataclass_fields__.keys()
+    if unknown:
+        raise ValueError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+    for required in ("name", "metric", "op", "value"):
+        if required not in data:
+            raise ValueError(f"{where}: missing '{required}'")
+    rule = Rule(**data)
+    if rule.scope not in ("guest", "node"):
+        raise ValueError(f"{where}: scope must be 'guest' or 'node'")
+    if rule.metric not in (GUEST_METRICS if rule.scope == "guest" else NODE_METRICS):
+        raise ValueError(f"{where}: unknown {rule.scope} metric '{rule.metric}'")
+    if rule.op not in OPERATORS:
+        raise ValueError(f"{where}: op must be one of {' '.join(OPERATORS)}")
+    if rule.severity not in SEVERITIES:
+        raise ValueError(f"{where}: severity must be one of {', '.join(SEVERITIES)}")
+    if rule.duration < 0:
+        raise ValueError(f"{where}: 'for' must not be negative")
+    return rule
+
+
+def load_rules(path=ALERT_RULES):
+    """Read the rules file; a missing file means no rules."""
+    path = os.path.expanduser(path)
+    try:
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    except FileNotFoundError:
+        return []
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError(f"{path}: {e}") from None
+    return [parse_rule(data, f"{path}: rule {i + 1}") for i, data in enumerate(config.get("rule", []))]
+
+
+class AlertEngine:
+    """Evaluates rules incrementally and tracks which alerts are firing."""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self._rules = {
+            scope: [(i, r) for i, r in enumerate(self.rules) if r.scope == scope]
+            for scope in ("guest", "node")
+        }
+        self._metrics = {
+            scope: tuple(sorted({r.metric for _, r in rules})) for scope, rules in self._rules.items()
+        }
+        self._last = {}
+        # (rule index, key) -> time the condition started to hold
+        self._pending = {}
+        self.firing = {}
+
+    def wants(self, scope):
+        return bool(self._rules[scope])
+
+    def firing_keys(self, scope):
+        return {key for (i, key) in self.firing if self.rules[i].scope == scope}
+
+    def evaluate(self, ts, scope, items, select=None):
+        """Evaluate ``(key, metrics)`` pairs sampled at ``ts``; returns AlertEvents.
+
+        ``select(query)`` returns the keys a guest rule's ``match`` selects.
+        """
+        rules = self._rules[scope]
+        if not rules:
+            return []
+        with timer(f"alerts {scope}"):
+            return self._evaluate(ts, scope, rules, items, select)
+
+    def _evaluate(self, ts, scope, rules, items, select):
+        names = self._metrics[scope]
+        selected = {
+            i: set(select(rule.match)) for i, rule in rules if rule.match and select is not None
+        }
+        events = []
+        for key, metrics in items:
+            values = tuple(metrics.get(name) for name in names)
+            if self._last.get((scope, key)) == values:
+                continue
+            self._last[(scope, key)] = values
+            for i, rule in rules:
+                state = (i, key)
+                if i in selected:
+                    applies = key in selected[i]
+                elif rule.match and scope == "node":
+                    applies = key[-1].startswith(rule.match)
+                else:
+                    applies = True
+                value = metrics.get(rule.metric)
+                if applies and rule.test(value):
+                    self._pending.setdefault(state, ts)
+                    if state in self.firing:
+                        self.firing[state] = value
+                    continue
+                self._pending.pop(state, None)
+                if self.firing.pop(state, None) is not None:
+                    events.append(AlertEvent(rule, key, RESOLVED, value, ts, ts))
+        for state, since in self._pending.items():
+            i, key = state
+            rule = self.rules[i]
+            if rule.scope == scope and state not in self.firing and ts - since >= rule.duration:
+                value = dict(zip(names, self._last[(scope, key)]))[rule.metric]
+                self.firing[state] = value
+                events.append(AlertEvent(rule, key, FIRING, value, since, ts))
+        return events
+
+    def retain(self, scope, keys):
+        """Forget guests or nodes no longer present, resolving their alerts silently."""
+        keys = set(keys)
+        for scoped in [k for k in self._last if k[0] == scope and k[1] not in keys]:
+            del self._last[scoped]
+        for states in (self._pending, self.firing):
+            for state in [s for s in states if self.rules[s[0]].scope == scope and s[1] not in keys]:
+                del states[state]
+
+
+_hooks = None
+
+
+def dispatch(event, label):
+    """Run the event rule's command and webhook on a background thread."""
+    global _hooks
+    rule = event.rule
+    if not rule.command and not rule.webhook:
+        return
+    if _hooks is None:
+        _hooks = ThreadPoolExecutor(max_workers=2, thread_name_prefix="proxmon-alert")
+    _hooks.submit(_run_hooks, event, label)
+
+
+def _run_hooks(event, label):
+    rule = event.rule
+    payload = {
+        "rule": rule.name,
+        "state": event.state,
+        "severity": rule.severity,
+        "target": label,
+        "key": list(event.key),
+        "metric": rule.metric,
+        "value": event.value,
+        "threshold": rule.value,
+        "since": event.since,
+        "timestamp": event.timestamp,
+    }
+    if rule.command:
+        env = dict(os.environ, **{f"PROXMON_ALERT_{k.upper()}": str(v) for k, v in payload.items()})
+        try:
+            subprocess.run(
+                shlex.split(rule.command), env=env, timeout=ALERT_HOOK_TIMEOUT, check=False,
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except (OSError, subprocess.SubprocessError):
+            logger.exception("Alert command for %s failed", rule.name)
+    if rule.webhook:
+        import requests
+
+        try:
+            requests.post(rule.webhook, data=json.dumps(payload), timeout=ALERT_HOOK_TIMEOUT,
+                          headers={"Content-Type": "application/json"})
+        except requests.RequestException:
+            logger.exception("Alert webhook for %s failed", rule.name)
@@ -0,0 +1,145 @@
+"""Proxmox VE API client with a persistent, pooled HTTP session."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrument import endpoint, timer
+
+
+class ProxmoxClient:
+    """Thin wrapper around a keep-alive ``requests.Session`` for the PVE API.
+
+    All calls share one connection pool, so repeated requests to port 8006
+    reuse established TCP/TLS connections instead of handshaking each time.
+    Idempotent requests are retried with exponential backoff on connection
+    errors and 5xx responses.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        token_id,
+        token_secret,
+        verify=True,
+        timeout=(3.05, 10),
+        retries=3,
+        backoff=0.3,
+        pool_size=16,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._executor = None
+
+        # Imported here so that starting the UI does not wait for requests.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Authorization"] = (
+            f"PVEAPIToken={token_id}={token_secret}"
+        )
+        self.session.verify = verify
+        if not verify:
+            requests.packages.urllib3.disable_warnings(
+                requests.packages.urllib3.exceptions.InsecureRequestWarning
+            )
+
+    def url(self, path):
+        """Build an absolute API URL; full URLs are passed through unchanged."""
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/api2/json/{path.lstrip('/')}"
+
+    def request(self, method, path, **kwargs):
+        """Send a request and return the ``data`` member of the response."""
+        kwargs.setdefault("timeout", self.timeout)
+        with timer(f"api {method} {endpoint(path)}"):
+            response = self.session.request(method, self.url(path), **kwargs)
+            response.raise_for_status()
+            return response.json()["data"]
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, data=None):
+        return self.request("POST", path, data=data)
+
+    def get_many(self, paths, return_exceptions=False):
+        """Fetch several endpoints concurrently; results keep the input order.
+
+        With ``return_exceptions`` a failed request yields its exception in
+        place of a result instead of raising.
+        """
+        paths = list(paths)
+        fetch = self._get_or_exception if return_exceptions else self.get
+        if len(paths) <= 1:
+            return [fetch(path) for path in paths]
+        return list(self.executor.map(fetch, paths))
+
+    def _get_or_exception(self, path):
+        try:
+            return self.get(path)
+        except Exception as e:
+            return e
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="proxmon-api"
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
+
+class AsyncProxmoxClient:
+    """asyncio front-end for a ProxmoxClient.
+
+    Requests run on the client's worker pool and share its connection pool,
+    so up to ``pool_size`` fetches can be in flight at once without
+    blocking the event loop.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def request(self, method, path, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.client.executor,
+            lambda: self.client.request(method, path, **kwargs),
+        )
+
+    async def get(self, path, params=None):
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path, data=None):
+        return await self.request("POST", path, data=data)
+
+    async def get_many(self, paths, return_exceptions=False):
+        """Fetch several endpoints at once; results keep the input order."""
+        return await asyncio.gather(
+            *(self.get(path) for path in paths), return_exceptions=return_exceptions
+        )
@@ -0,0 +1,278 @@
+"""Benchmark suite running proxmon's data paths against fake servers.
+
+``proxmon bench`` starts a fake Proxmox API and SSH daemon (fake.py) with
+the requested guest count, latency and jitter, then times the work behind
+each refresh: the guest list collection and table rows, a task log poll
+and the re-fetch of one guest it triggers (events.py), node status,
+drilldown and temperature sensors, IP discovery cold and warm
+(find_vm_ip_address), the selected guest's detail with and without RRD
+data, and chart rendering (draw_vertical_bar_chart and the chart
+renderers). The app itself is then driven headlessly under
+``App.run_test()``: a guest list applied through ``render_table`` (the
+DataTable diff, sort and index query), and a row selection with the
+detail poll update_rrd_data triggers and its render. For every step it
+reports the median and worst wall time and the API requests and SSH
+commands it caused.
+
+Settings are read from the environment when proxmon is imported, so the
+measurements run in a child process configured for the fake servers.
+
+Results can be saved as a baseline and later runs compared against it;
+a step regresses when it gets more than ``--tolerance`` slower (and at
+least ``NOISE_FLOOR_MS``), or makes more requests or SSH commands.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+NOISE_FLOOR_MS = 2.0
+
+
+def _stats(url):
+    import requests
+
+    return requests.get(url, timeout=5).json()["data"]
+
+
+def measure(name, func, rounds, stats_url, setup=None):
+    """Run ``func`` ``rounds`` times and summarise time and upstream calls."""
+    times, requests_made, ssh_commands = [], [], []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        before = _stats(stats_url)
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+        after = _stats(stats_url)
+        requests_made.append(after["total"] - before["total"])
+        ssh_commands.append(after["ssh"] - before["ssh"])
+    return name, {
+        "median_ms": round(statistics.median(times), 3),
+        "max_ms": round(max(times), 3),
+        "requests": statistics.median(requests_made),
+        "ssh": statistics.median(ssh_commands),
+    }
+
+
+def run_steps(rounds, stats_url):
+    """Measure every step; runs in the child process."""
+    from .charts import ChartRenderer
+    from .collector import (
+        collect_guest_detail,
+        collect_guests,
+        collect_node_detail,
+        collect_nodes,
+        collect_temperature,
+    )
+    from .events import TaskFollower, refresh_guests
+    from .history import HISTORY_DEPTH
+    from .main import CHART_WIDTH, CHARTS, guest_row
+    from .utils import (
+        default_cluster,
+        draw_vertical_bar_chart,
+        find_vm_ip_address,
+        get_config_cache,
+        get_ip_discovery,
+        guest_key,
+    )
+
+    cluster = default_cluster()
+    guests = collect_guests(cluster).guests
+    ip_table = find_vm_ip_address(guests)
+    selected = next(g for g in guests if g["type"] == "VM" and g["status"] == "running")
+    series = [(i * 7919) % 100 for i in range(HISTORY_DEPTH)]
+    renderers = [ChartRenderer(height=8, width=CHART_WIDTH, **options) for _, _, options in CHARTS]
+    follower = TaskFollower(cluster)
+    follower.poll()
+    guest_list = collect_guests(cluster)
+
+    def reset_ip_caches():
+        get_config_cache(cluster).invalidate()
+        get_ip_discovery(cluster).invalidate()
+
+    steps = [
+        ("guest_list", lambda: collect_guests(cluster), None),
+        ("table_rows", lambda: [guest_row(g, ip_table.get(guest_key(g), {})) for g in guests], None),
+        ("task_events", follower.poll, None),
+        ("guest_refresh", lambda: refresh_guests(guest_list, {selected["vmid"]}), None),
+        ("node_status", lambda: list(collect_nodes(cluster)), None),
+        ("node_detail", lambda: collect_node_detail(cluster, selected["node"]), None),
+        ("sensors", collect_temperature, None),
+        ("addresses_cold", lambda: find_vm_ip_address(guests), reset_ip_caches),
+        ("addresses_warm", lambda: find_vm_ip_address(guests), None),
+        ("detail_rrd", lambda: collect_guest_detail(
+            selected["vmid"], "vm", selected["name"], "hour", node=selected["node"], cluster=cluster
+        ), None),
+        ("detail", lambda: collect_guest_detail(
+            selected["vmid"], "vm", selected["name"], node=selected["node"], cluster=cluster
+        ), None),
+        ("draw_vertical_bar_chart", lambda: draw_vertical_bar_chart(series, height=8, chart_width=CHART_WIDTH), None),
+        ("render_charts", lambda: [r.render(series) for r in renderers], None),
+    ]
+    return dict(measure(name, func, rounds, stats_url, setup) for name, func, setup in steps)
+
+
+def run_app_steps(rounds, stats_url):
+    """Measure the app's render paths under App.run_test(); runs in the child process."""
+    import asyncio
+    import dataclasses
+
+    from textual.widgets import DataTable
+    from textual.widgets.data_table import RowKey
+
+    from .main import ProxmonApp, row_key
+
+    async def drive():
+        app = ProxmonApp()
+        async with app.run_test(size=(200, 60)) as pilot:
+            # Let the first polls land, then stop polling so only the
+            # measured calls touch the app and the fake API.
+            await pilot.pause(1)
+            app.timer.stop()
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            table = app.query_one("#vm_table", DataTable)
+            guest_list = next(iter(app._guest_lists.values()))
+            selected = next(g for g in guest_list.guests if g["type"] == "VM" and g["status"] == "running")
+            key = row_key(selected)
+            pending = []
+
+            def fresh_guest_list():
+                pending[:] = [dataclasses.replace(guest_list, timestamp=time.time())]
+
+            def select_guest():
+                # What selecting a row does, with the detail poll that
+                # update_rrd_data triggers run inline instead of on a worker.
+                app.on_data_table_row_selected(
+                    DataTable.RowSelected(table, table.get_row_index(key), RowKey(key))
+                )
+                app.render_guest_detail(app._collect_detail())
+
+            steps = [
+                ("render_table", lambda: app.render_table(pending[0]), fresh_guest_list),
+                ("select_guest", select_guest, None),
+            ]
+            return dict(measure(name, func, rounds, stats_url, setup) for name, func, setup in steps)
+
+    return asyncio.run(drive())
+
+
+def run(guests=100, nodes=1, latency=0.0, jitter=0.0, rounds=5):
+    """Start the fake servers, run the steps in a child process and return the results."""
+    from .fake import STATS_PATH, FakeCluster, FakeProxmoxAPI, FakeSSH
+
+    cluster = FakeCluster(guests=guests, nodes=nodes)
+    ssh = FakeSSH(cluster, latency=latency).start()
+    api = FakeProxmoxAPI(cluster, latency=latency, jitter=jitter, ssh=ssh).start()
+    env = dict(
+        os.environ,
+        PROXMOX_HOST=api.url,
+        TOKEN_ID="bench@pve!bench",
+        TOKEN_SECRET="bench",
+        NODE="",
+        CLUSTERS="",
+        NO_SSL_CHECK="true",
+        SSH_HOST="127.0.0.1",
+        SSH_PORT=str(ssh.port),
+        SSH_USER="root",
+        SSH_PASSWORD="bench",
+        SSH_NODE="",
+        SENSOR_SOURCE="ssh",
+        HISTORY_DB="",
+        ALERT_RULES="",
+        # The app saves its snapshot on exit; keep the user's cache intact.
+        SNAPSHOT_CACHE=os.devnull,
+    )
+    try:
+        child = subprocess.run(
+            [sys.executable, "-m", "proxmon.bench", "--worker", "--rounds", str(rounds),
+             "--stats-url", api.url + STATS_PATH],
+            env=env, capture_output=True, text=True, check=False,
+        )
+    finally:
+        api.stop()
+        ssh.stop()
+    if child.returncode != 0:
+        raise RuntimeError(f"benchmark worker failed:\n{child.stderr}")
+    return {
+        "params": {"guests": guests, "nodes": nodes, "latency": latency, "jitter": jitter},
+        "results": json.loads(child.stdout.strip().splitlines()[-1]),
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Return a description of every step that regressed against ``baseline``."""
+    regressions = []
+    for name, base in baseline["results"].items():
+        current = results["results"].get(name)
+        if current is None:
+            continue
+        slower = current["median_ms"] - base["median_ms"]
+        if slower > NOISE_FLOOR_MS and current["median_ms"] > base["median_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: {base['median_ms']:.1f} -> {current['median_ms']:.1f} ms")
+        for counter in ("requests", "ssh"):
+            if current[counter] > base[counter]:
+                regressions.append(f"{name}: {base[counter]:g} -> {current[counter]:g} {counter}")
+    return regressions
+
+
+def report(results):
+    params = results["params"]
+    print(
+        f"{params['guests']} guests on {params['nodes']} node(s), "
+        f"latency {params['latency'] * 1000:.0f} ms ± {params['jitter'] * 1000:.0f} ms"
+    )
+    print(f"{'step':<26}{'median ms':>12}{'max ms':>10}{'requests':>10}{'ssh':>6}")
+    for name, r in results["results"].items():
+        print(f"{name:<26}{r['median_ms']:>12.2f}{r['max_ms']:>10.2f}{r['requests']:>10g}{r['ssh']:>6g}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="proxmon bench", description="Benchmark proxmon against a fake Proxmox API")
+    parser.add_argument("--guests", type=int, default=100, help="number of fake guests (default 100)")
+    parser.add_argument("--nodes", type=int, default=1, help="number of fake nodes (default 1)")
+    parser.add_argument("--latency", type=float, default=0.0, help="API/SSH latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random latency jitter in ms")
+    parser.add_argument("--rounds", type=int, default=5, help="runs per step (default 5)")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to FILE")
+    parser.add_argument("--save-baseline", metavar="FILE", help="store the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="fail if slower than this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown (default 0.2 = 20%%)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stats-url", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        results = run_steps(args.rounds, args.stats_url)
+        results.update(run_app_steps(args.rounds, args.stats_url))
+        print(json.dumps(results))
+        return 0
+
+    results = run(args.guests, args.nodes, args.latency / 1000, args.jitter / 1000, args.rounds)
+    report(results)
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["params"] != results["params"]:
+            print(f"warning: baseline was recorded with {baseline['params']}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
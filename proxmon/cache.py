@@ -0,0 +1,135 @@
+"""Caches for slowly changing guest data."""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+NET_KEY = re.compile(r"^net\d+$")
+logger = logging.getLogger(__name__)
+
+MAC_PATTERN = re.compile(r"[0-9A-Fa-f]{2}(?::[0-9A-Fa-f]{2}){5}")
+
+# Fields of a guest list entry that change whenever the guest's config does.
+FINGERPRINT_FIELDS = ("type", "node", "name", "maxcpu", "cpus", "maxmem", "maxdisk", "tags", "lock")
+
+
+def parse_net_macs(config):
+    """Return ``{iface: MAC}`` for every ``netN`` entry of a guest config."""
+    macs = {}
+    for key in sorted(config, key=lambda k: (len(k), k)):
+        if NET_KEY.match(key):
+            match = MAC_PATTERN.search(str(config[key]))
+            if match:
+                macs[key] = match.group(0).upper()
+    return macs
+
+
+def guest_fingerprint(guest):
+    return tuple(guest.get(f) for f in FINGERPRINT_FIELDS)
+
+
+class ConfigCache:
+    """TTL/LRU cache of guest configs keyed by vmid.
+
+    Entries are invalidated when they expire, when the guest disappears
+    from the guest list or its list entry changes in a way that implies a
+    config edit. The parsed ``netN`` MAC addresses are kept alongside each
+    config and only re-parsed when the config ``digest`` changes, so
+    steady-state refreshes cost no requests and no parsing.
+
+    ``fetch_many(paths, return_exceptions=True)`` fetches a batch; a
+    config that fails to load (a 404, or a 500 during a migration) is
+    left out and fetched again on the next call.
+    """
+
+    def __init__(self, fetch_many, ttl=600, maxsize=1024):
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, vmid, now):
+        entry = self._entries.get(vmid)
+        if entry is None or now - entry["fetched"] > self.ttl:
+            return None
+        self._entries.move_to_end(vmid)
+        return entry
+
+    def _store(self, vmid, config, now):
+        previous = self._entries.get(vmid)
+        digest = config.get("digest")
+        if previous is not None and digest and previous["config"].get("digest") == digest:
+            macs = previous["macs"]
+        else:
+            macs = parse_net_macs(config)
+        self._entries[vmid] = {"config": config, "macs": macs, "fetched": now}
+        self._entries.move_to_end(vmid)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def sync(self, guests):
+        """Drop entries for guests that vanished or whose list entry changed."""
+        with self._lock:
+            seen = {}
+            for guest in guests:
+                vmid = guest["vmid"]
+                seen[vmid] = guest_fingerprint(guest)
+                if self._fingerprints.get(vmid, seen[vmid]) != seen[vmid]:
+                    self._entries.pop(vmid, None)
+            for vmid in set(self._entries) - set(seen):
+                del self._entries[vmid]
+            self._fingerprints = seen
+
+    def get_many(self, guests):
+        """Return ``{vmid: entry}`` for the given ``(vmid, config_path)`` pairs.
+
+        Missing or expired configs are fetched together in one batch;
+        guests whose config could not be fetched are left out.
+        """
+        return self._load(guests)[0]
+
+    def _load(self, guests):
+        """get_many(), plus ``{vmid: exception}`` for the failed fetches."""
+        now = time.monotonic()
+        result = {}
+        errors = {}
+        missing = []
+        with self._lock:
+            for vmid, path in guests:
+                entry = self._fresh(vmid, now)
+                if entry is None:
+                    missing.append((vmid, path))
+                else:
+                    result[vmid] = entry
+        if missing:
+            configs = self.fetch_many([path for _, path in missing], return_exceptions=True)
+            with self._lock:
+                for (vmid, path), config in zip(missing, configs):
+                    if isinstance(config, Exception):
+                        logger.warning("Fetching %s failed: %s", path, config)
+                        errors[vmid] = config
+                        continue
+                    self._store(vmid, config, now)
+                    result[vmid] = self._entries[vmid]
+        return result, errors
+
+    def get(self, vmid, path):
+        result, errors = self._load([(vmid, path)])
+        if vmid in errors:
+            raise errors[vmid]
+        return result[vmid]["config"]
+
+    def macs(self, guests):
+        """Return ``{vmid: {iface: MAC}}`` for the given guests."""
+        return {vmid: entry["macs"] for vmid, entry in self.get_many(guests).items()}
+
+    def invalidate(self, vmid=None):
+        with self._lock:
+            if vmid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(vmid, None)
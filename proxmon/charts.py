@@ -0,0 +1,116 @@
+"""Text chart rendering for the guest detail panels."""
+
+BLOCKS = " ▁▂▃▄▅▆▇█"
+# Braille dot bits for the left and right column of a cell, bottom row first.
+BRAILLE_LEFT = (0x40, 0x04, 0x02, 0x01)
+BRAILLE_RIGHT = (0x80, 0x20, 0x10, 0x08)
+
+
+def downsample(values, width, agg="avg"):
+    """Reduce ``values`` to at most ``width`` points, one per chart column.
+
+    Each column aggregates a contiguous bucket with min, max or avg. The
+    per-bucket work is done by the builtins on slices, so the Python-level
+    loop runs once per column regardless of the history length.
+    """
+    n = len(values)
+    if n <= width:
+        return list(values)
+    reducer = {"min": min, "max": max}.get(agg)
+    points = []
+    for column in range(width):
+        bucket = values[column * n // width:(column + 1) * n // width]
+        if reducer is not None:
+            points.append(reducer(bucket))
+        else:
+            points.append(sum(bucket) / len(bucket))
+    return points
+
+
+class ChartRenderer:
+    """Renders a series as a bar or braille chart with a labelled y axis.
+
+    A renderer keeps its per-column level buffer between frames, so one
+    instance per panel avoids reallocating on every refresh.
+
+    Styles:
+        blocks: bars with 1/8 cell vertical resolution using block glyphs.
+        braille: a dot plot with 2 points per cell and 4 rows per cell.
+        anything else: bars filled with that character (whole cells).
+    """
+
+    def __init__(self, height=8, width=90, value_width=5, decimal_places=1,
+                 color="white", style="blocks", agg="avg"):
+        self.height = height
+        self.width = width
+        self.value_width = value_width
+        self.decimal_places = decimal_places
+        self.color = color
+        self.style = style
+        self.agg = agg
+        self._levels = []
+
+    def _scale(self, points, steps):
+        """Map points onto integer levels 1..steps, reusing the level buffer."""
+        lo = min(points)
+        span = max(points) - lo
+        factor = (steps - 1) / span if span > 0 else 0
+        levels = self._levels
+        del levels[len(points):]
+        levels.extend([0] * (len(points) - len(levels)))
+        for i, value in enumerate(points):
+            levels[i] = 1 + int((value - lo) * factor)
+        return lo, span, levels
+
+    def _bar_rows(self, levels, sub_steps, glyphs):
+        rows = []
+        for row in range(self.height - 1, -1, -1):
+            base = row * sub_steps
+            rows.append("".join(
+                glyphs[min(max(level - base, 0), sub_steps)] for level in levels
+            ))
+        return rows
+
+    def _braille_rows(self, levels):
+        cells = (len(levels) + 1) // 2
+        grid = [[0] * cells for _ in range(self.height)]
+        for i, level in enumerate(levels):
+            level -= 1
+            row, dot = divmod(level, 4)
+            bits = BRAILLE_RIGHT if i % 2 else BRAILLE_LEFT
+            grid[self.height - 1 - row][i // 2] |= bits[dot]
+        return ["".join(chr(0x2800 + bits) for bits in line) for line in grid]
+
+    def render(self, data):
+        """Return the chart for ``data`` as a Rich markup string."""
+        if self.style == "braille":
+            points = downsample(data, self.width * 2, self.agg)
+            steps = self.height * 4
+        elif self.style == "blocks":
+            points = downsample(data, self.width, self.agg)
+            steps = self.height * 8
+        else:
+            points = downsample(data, self.width, self.agg)
+            steps = self.height
+
+        axis = f"{' ' * self.value_width} ╰" + "─" * self.width
+        if not points:
+            blank = f"{' ' * self.value_width} ┤ "
+            lines = [blank] * (self.height - 1) + [f"{blank}No data", axis]
+            return f"[{self.color}]" + "\n".join(lines) + f"[/{self.color}]"
+
+        lo, span, levels = self._scale(points, steps)
+        if self.style == "braille":
+            rows = self._braille_rows(levels)
+        elif self.style == "blocks":
+            rows = self._bar_rows(levels, 8, BLOCKS)
+        else:
+            rows = self._bar_rows(levels, 1, (" ", self.style))
+
+        fmt = f">{self.value_width}.{self.decimal_places}f"
+        lines = []
+        for i, row in enumerate(rows):
+            value = lo + span * (self.height - 1 - i) / (self.height - 1) if self.height > 1 else lo
+            lines.append(f"{value:{fmt}} ┤ {row}")
+        lines.append(axis)
+        return f"[{self.color}]" + "\n".join(lines) + f"[/{self.color}]"
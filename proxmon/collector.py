@@ -0,0 +1,223 @@
+"""Data collection layer.
+
+Collectors perform all blocking I/O (Proxmox API and SSH) and return
+immutable snapshots. They never touch the UI, so they can run on worker
+threads and hand their results back to the app as messages.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+
+from .utils import (
+    COLLECT_PARALLELISM,
+    get_client,
+    get_nodes,
+    get_data_from_proxapi,
+    get_guests_snapshot,
+    find_vm_ip_address,
+    get_cached_vm_config,
+    get_vm_data,
+    get_rrd_data,
+)
+from .sensors import read_sensors
+
+logger = logging.getLogger(__name__)
+
+_pool = ThreadPoolExecutor(max_workers=COLLECT_PARALLELISM, thread_name_prefix="proxmon-collect")
+
+
+@dataclass(frozen=True)
+class GuestListSnapshot:
+    """Status of every monitored guest of one cluster.
+
+    ``changed`` lists the vmids re-fetched after task events (see
+    events.py); the other guests are as of the last full poll. It is None
+    for a full poll.
+    """
+
+    cluster: str
+    guests: tuple
+    timestamp: float = field(default_factory=time.time)
+    changed: tuple | None = None
+
+
+@dataclass(frozen=True)
+class AddressSnapshot:
+    """MAC/IP addresses of the guests, keyed by vmid."""
+
+    ip_table: dict
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True)
+class NodeSnapshot:
+    """Status of one node; empty for nodes that are offline."""
+
+    cluster: str
+    node: str
+    online: bool
+    status: dict
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True)
+class NodeDetailSnapshot:
+    """Storage pools, physical disks, network interfaces and guest
+    interface counters of one node; parts that failed to load are empty."""
+
+    cluster: str
+    node: str
+    storage: tuple
+    disks: tuple
+    network: tuple
+    netstat: tuple
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True)
+class TemperatureSnapshot:
+    """Sensor temperatures of the SSH node in °C, ``CPU`` first (see sensors.py)."""
+
+    temperature: dict | None
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True)
+class GuestDetailSnapshot:
+    """Current status and config of a single guest."""
+
+    vmid: int
+    vm_type: str
+    name: str
+    cluster: str
+    node: str
+    data: dict
+    config: dict
+    rrd: tuple = ()
+    rrd_timeframe: str | None = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def collect_guests(cluster):
+    """Collect the status of every guest of a cluster."""
+    return GuestListSnapshot(cluster=cluster, guests=tuple(get_guests_snapshot(cluster=cluster)))
+
+
+def collect_addresses(guests):
+    """Collect guest IP addresses; guest configs come from the config cache."""
+    return AddressSnapshot(ip_table=find_vm_ip_address(list(guests)))
+
+
+def collect_nodes(cluster):
+    """Collect the status of every node of a cluster.
+
+    Node statuses are fetched concurrently and yielded as they arrive,
+    so one slow node does not hold back the others.
+    """
+    futures = {}
+    for node in get_nodes(cluster):
+        name = node["node"]
+        if node.get("status") != "online":
+            yield NodeSnapshot(cluster=cluster, node=name, online=False, status={})
+            continue
+        future = _pool.submit(get_data_from_proxapi, f"/nodes/{name}/status", cluster)
+        futures[future] = name
+    for future in as_completed(futures):
+        try:
+            status = future.result()
+        except Exception:
+            logger.exception("Fetching status of node %s failed", futures[future])
+            continue
+        yield NodeSnapshot(cluster=cluster, node=futures[future], online=True, status=status)
+
+
+NODE_DETAIL_ENDPOINTS = ("storage", "disks/list", "network", "netstat")
+
+
+def collect_node_detail(cluster, node):
+    """Collect the drilldown data of one node in one concurrent batch.
+
+    A failing endpoint (e.g. disks/list without Sys.Audit) only leaves
+    its part empty.
+    """
+    results = get_client(cluster).get_many(
+        (f"/nodes/{node}/{endpoint}" for endpoint in NODE_DETAIL_ENDPOINTS), return_exceptions=True
+    )
+    parts = []
+    for endpoint, result in zip(NODE_DETAIL_ENDPOINTS, results):
+        if isinstance(result, Exception):
+            logger.warning("Fetching %s of node %s failed: %s", endpoint, node, result)
+            result = None
+        parts.append(tuple(result or ()))
+    return NodeDetailSnapshot(cluster, node, *parts)
+
+
+def collect_temperature():
+    """Collect every temperature sensor of the SSH node."""
+    return TemperatureSnapshot(temperature=read_sensors())
+
+
+def collect_guest_detail(vmid, vm_type, name="", rrd_timeframe=None, node=None, cluster=None):
+    """Collect status and config of one guest concurrently.
+
+    If ``rrd_timeframe`` is given, the guest's RRD history for that
+    timeframe is fetched alongside.
+    """
+    data = _pool.submit(get_vm_data, vmid, vm_type, node, cluster)
+    config = _pool.submit(get_cached_vm_config, vmid, vm_type, node, cluster)
+    rrd = ()
+    if rrd_timeframe:
+        try:
+            rrd = tuple(get_rrd_data(
+                vmid, vm_type, timeframe=rrd_timeframe, node=node, cluster=cluster
+            ))
+        except Exception:
+            logger.exception("Fetching %s RRD data for %s failed", rrd_timeframe, vmid)
+            rrd_timeframe = None
+    return GuestDetailSnapshot(
+        vmid=vmid,
+        vm_type=vm_type,
+        name=name,
+        cluster=cluster,
+        node=node,
+        data=data.result(),
+        config=config.result(),
+        rrd=rrd,
+        rrd_timeframe=rrd_timeframe,
+    )
+
+
+SNAPSHOT_TYPES = {
+    cls.__name__: cls
+    for cls in (
+        GuestListSnapshot,
+        AddressSnapshot,
+        NodeSnapshot,
+        NodeDetailSnapshot,
+        TemperatureSnapshot,
+        GuestDetailSnapshot,
+    )
+}
+
+
+def snapshot_to_dict(snapshot):
+    """Convert a snapshot into JSON-compatible data, tagged with its kind."""
+    data = {f.name: getattr(snapshot, f.name) for f in fields(snapshot)}
+    if isinstance(snapshot, AddressSnapshot):
+        data["ip_table"] = [[*key, info] for key, info in snapshot.ip_table.items()]
+    data["kind"] = type(snapshot).__name__
+    return data
+
+
+def snapshot_from_dict(data):
+    """Rebuild a snapshot from snapshot_to_dict() output."""
+    data = dict(data)
+    cls = SNAPSHOT_TYPES[data.pop("kind")]
+    if cls is AddressSnapshot:
+        data["ip_table"] = {(c, v): info for c, v, info in data["ip_table"]}
+    for name in ("guests", "rrd", "storage", "disks", "network", "netstat", "changed"):
+        if data.get(name) is not None:
+            data[name] = tuple(data[name])
+    return cls(**data)
@@ -0,0 +1,365 @@
+"""Headless collector daemon and the thin client used to attach to it.
+
+``proxmon collect`` polls the Proxmox API and SSH once, through the same
+collectors and scheduler as the TUI, and publishes the snapshots as
+newline-delimited JSON over a Unix socket or a localhost TCP port. Any
+number of ``proxmon --attach`` viewers can then share that one poller.
+
+Protocol, one JSON object per line:
+
+* daemon -> client: snapshot_to_dict() output. Guest lists are sent in
+  full when a client connects and as ``GuestListDelta`` messages
+  (changed guests and removed vmids, plus the ``refreshed`` vmids when
+  only those were re-fetched after task events) afterwards. Guest detail snapshots
+  only go to clients watching that guest.
+* client -> daemon: ``{"watch": {...}}`` naming the guest whose details
+  the client shows, the chart zoom and whether it still needs the hour
+  RRD backfill; ``{"watch": null}`` stops watching.
+"""
+
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .collector import (
+    AddressSnapshot,
+    GuestDetailSnapshot,
+    GuestListSnapshot,
+    NodeSnapshot,
+    TemperatureSnapshot,
+    collect_addresses,
+    collect_guest_detail,
+    collect_guests,
+    collect_nodes,
+    collect_temperature,
+    snapshot_from_dict,
+    snapshot_to_dict,
+)
+from .events import POLL_GUESTS_FALLBACK, follow_guests, followers, rebase
+from .scheduler import Scheduler
+from .utils import CLUSTERS, COLLECT_PARALLELISM
+
+logger = logging.getLogger(__name__)
+
+# An empty PROXMON_SOCKET (as in .env-example) means the default too.
+DEFAULT_ADDRESS = os.getenv("PROXMON_SOCKET") or os.path.join(
+    tempfile.gettempdir(), f"proxmon-{os.getuid()}.sock"
+)
+RRD_REFRESH_INTERVAL = 60
+TICK = 0.25
+# Clients that fall this far behind are disconnected rather than buffered.
+MAX_CLIENT_BUFFER = 16 * 1024 * 1024
+
+
+def parse_address(address):
+    """Return ("tcp", host, port) for host:port, else ("unix", path)."""
+    address = address or DEFAULT_ADDRESS
+    if address.startswith("unix:"):
+        return ("unix", address[5:])
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return ("tcp", host or "127.0.0.1", int(port))
+    return ("unix", address)
+
+
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.watch = None
+        self.rrd_sent = {}
+
+
+class CollectorDaemon:
+    """Polls every cluster once and fans the snapshots out to clients."""
+
+    def __init__(self, address=None, record=None):
+        self.address = parse_address(address)
+        self.recorder = None
+        if record:
+            from .recording import SnapshotRecorder
+
+            self.recorder = SnapshotRecorder(record)
+        self.scheduler = Scheduler(self._submit)
+        self.clients = set()
+        self.guest_lists = {}
+        self.nodes = {}
+        self.addresses = None
+        self.temperature = None
+        self.rrd_cache = {}
+        # Whether the unix socket file is ours to remove on exit.
+        self._bound = False
+        self.loop = None
+        self.pool = ThreadPoolExecutor(
+            max_workers=COLLECT_PARALLELISM, thread_name_prefix="proxmon-daemon"
+        )
+        self.followers = followers()
+        for cluster in CLUSTERS:
+            self.scheduler.add(
+                f"guests:{cluster}", partial(collect_guests, cluster),
+                interval=POLL_GUESTS_FALLBACK if self.followers else None,
+            )
+            self.scheduler.add(f"node:{cluster}", partial(collect_nodes, cluster))
+            if cluster in self.followers:
+                self.scheduler.add(f"events:{cluster}", partial(self._follow_tasks, cluster))
+        self.scheduler.add("addresses", self._collect_addresses)
+        self.scheduler.add("temperature", collect_temperature)
+        self.scheduler.add("detail", self._collect_details)
+
+    def _submit(self, source):
+        emit = lambda snapshot: self.loop.call_soon_threadsafe(self.publish, snapshot)
+        self.loop.run_in_executor(self.pool, self.scheduler.run, source, emit)
+
+    def _follow_tasks(self, cluster):
+        return follow_guests(
+            self.followers[cluster], self.guest_lists.get(cluster),
+            partial(self.scheduler.trigger, f"guests:{cluster}"),
+        )
+
+    def _collect_addresses(self):
+        guests = [g for s in self.guest_lists.values() for g in s.guests]
+        return collect_addresses(guests) if guests else None
+
+    def _collect_details(self):
+        """Poll every watched guest once, however many clients watch it."""
+        watched = {}
+        for client in list(self.clients):
+            if client.watch:
+                w = client.watch
+                watched.setdefault((w["cluster"], w["vmid"]), []).append(w)
+        for (cluster, vmid), watches in watched.items():
+            w = watches[0]
+            wanted = {"hour" if not x.get("seeded") else x.get("zoom", "live") for x in watches}
+            wanted.discard("live")
+            stale = [
+                tf for tf in sorted(wanted)
+                if time.time() - self.rrd_cache.get((cluster, vmid, tf), (0, ()))[0] > RRD_REFRESH_INTERVAL
+            ]
+            yield collect_guest_detail(
+                vmid, w["type"], w.get("name", ""), stale[0] if stale else None,
+                node=w["node"], cluster=cluster,
+            )
+
+    def publish(self, snapshot):
+        """Record a snapshot and send it, or a delta, to the clients."""
+        if isinstance(snapshot, GuestListSnapshot):
+            # Task events only re-fetch some guests; keep the others current.
+            snapshot = rebase(snapshot, self.guest_lists.get(snapshot.cluster))
+        if self.recorder is not None:
+            self.recorder.record(snapshot)
+        if isinstance(snapshot, GuestListSnapshot):
+            previous = self.guest_lists.get(snapshot.cluster)
+            self.guest_lists[snapshot.cluster] = snapshot
+            if previous is None:
+                # The first run of "addresses" found no guests to resolve.
+                self.scheduler.trigger("addresses")
+            message = guest_list_delta(previous, snapshot)
+        elif isinstance(snapshot, GuestDetailSnapshot):
+            self._publish_detail(snapshot)
+            return
+        else:
+            if isinstance(snapshot, NodeSnapshot):
+                self.nodes[(snapshot.cluster, snapshot.node)] = snapshot
+            elif isinstance(snapshot, AddressSnapshot):
+                self.addresses = snapshot
+            elif isinstance(snapshot, TemperatureSnapshot):
+                self.temperature = snapshot
+            message = snapshot_to_dict(snapshot)
+        data = encode(message)
+        for client in list(self.clients):
+            self._send(client, data)
+
+    def _publish_detail(self, snapshot):
+        key = (snapshot.cluster, snapshot.vmid)
+        now = time.time()
+        if snapshot.rrd_timeframe:
+            self.rrd_cache[(*key, snapshot.rrd_timeframe)] = (now, snapshot.rrd)
+        for client in list(self.clients):
+            w = client.watch
+            if not w or (w["cluster"], w["vmid"]) != key:
+                continue
+            timeframe = "hour" if not w.get("seeded") else w.get("zoom", "live")
+            fetched, rrd = self.rrd_cache.get((*key, timeframe), (0, ()))
+            detail = dataclasses.replace(snapshot, rrd=(), rrd_timeframe=None)
+            if rrd and client.rrd_sent.get(timeframe, 0) < fetched:
+                detail = dataclasses.replace(snapshot, rrd=rrd, rrd_timeframe=timeframe)
+                client.rrd_sent[timeframe] = fetched
+                if timeframe == "hour":
+                    w["seeded"] = True
+            self._send(client, encode(snapshot_to_dict(detail)))
+
+    def _send(self, client, data):
+        transport = client.writer.transport
+        if transport.is_closing():
+            self.clients.discard(client)
+            return
+        if transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            logger.warning("Dropping slow client")
+            transport.abort()
+            self.clients.discard(client)
+            return
+        client.writer.write(data)
+
+    async def _handle(self, reader, writer):
+        client = _Client(writer)
+        for snapshot in self.guest_lists.values():
+            writer.write(encode(snapshot_to_dict(snapshot)))
+        for snapshot in (*self.nodes.values(), self.addresses, self.temperature):
+            if snapshot is not None:
+                writer.write(encode(snapshot_to_dict(snapshot)))
+        self.clients.add(client)
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if "watch" in request:
+                    client.watch = request["watch"]
+                    client.rrd_sent = {}
+                    self.scheduler.trigger("detail")
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        if self.address[0] == "unix":
+            path = self.address[1]
+            if os.path.exists(path):
+                if socket_in_use(path):
+                    raise OSError(f"A collector is already listening on {path}")
+                os.unlink(path)
+            # Create the socket owner-only from the start: a chmod after
+            # binding leaves a window in which other users could connect.
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self._handle, path=path)
+            finally:
+                os.umask(umask)
+            self._bound = True
+        else:
+            server = await asyncio.start_server(self._handle, self.address[1], self.address[2])
+        logger.info("Collector listening on %s", self.address)
+        async with server:
+            while True:
+                self.scheduler.tick()
+                await asyncio.sleep(TICK)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self._bound and os.path.exists(self.address[1]):
+                os.unlink(self.address[1])
+            if self.recorder is not None:
+                self.recorder.close()
+
+
+def socket_in_use(path):
+    """Whether a process is accepting connections on a unix socket file."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        # Refused or not a socket: left behind by a collector that died.
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def guest_list_delta(previous, snapshot):
+    """Full guest list message, or only the changes since ``previous``."""
+    if previous is None:
+        return snapshot_to_dict(snapshot)
+    before = {g["vmid"]: g for g in previous.guests}
+    after = {g["vmid"]: g for g in snapshot.guests}
+    message = {
+        "kind": "GuestListDelta",
+        "cluster": snapshot.cluster,
+        "timestamp": snapshot.timestamp,
+        "changed": [g for vmid, g in after.items() if before.get(vmid) != g],
+        "removed": [vmid for vmid in before if vmid not in after],
+    }
+    if snapshot.changed is not None:
+        message["refreshed"] = list(snapshot.changed)
+    return message
+
+
+def read_messages(lines):
+    """Yield the snapshots encoded in protocol lines, applying guest list deltas."""
+    guest_lists = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        if message["kind"] == "GuestListDelta":
+            guests = guest_lists.setdefault(message["cluster"], {})
+            for vmid in message["removed"]:
+                guests.pop(vmid, None)
+            for guest in message["changed"]:
+                guests[guest["vmid"]] = guest
+            refreshed = message.get("refreshed")
+            yield GuestListSnapshot(
+                cluster=message["cluster"],
+                guests=tuple(guests[v] for v in sorted(guests)),
+                timestamp=message["timestamp"],
+                changed=tuple(refreshed) if refreshed is not None else None,
+            )
+            continue
+        snapshot = snapshot_from_dict(message)
+        if isinstance(snapshot, GuestListSnapshot):
+            guest_lists[snapshot.cluster] = {g["vmid"]: g for g in snapshot.guests}
+        yield snapshot
+
+
+class SnapshotClient:
+    """Connection from a viewer to a collector daemon.
+
+    Iterating yields snapshots as they arrive, with guest list deltas
+    already applied. ``watch`` may be called from another thread.
+    """
+
+    def __init__(self, address=None, timeout=10):
+        kind, *target = parse_address(address)
+        if kind == "unix":
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(target[0])
+        else:
+            self.sock = socket.create_connection(tuple(target), timeout=timeout)
+        self.sock.settimeout(None)
+        self._file = self.sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def watch(self, guest):
+        """Ask the daemon for details of ``guest`` (a dict), or None to stop."""
+        with self._lock:
+            self.sock.sendall(encode({"watch": guest}))
+
+    def __iter__(self):
+        yield from read_messages(self._file)
+
+    def close(self):
+        try:
+            # shutdown() also wakes up a thread blocked reading snapshots.
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+        except OSError:
+            pass
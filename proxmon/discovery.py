@@ -0,0 +1,226 @@
+"""Guest IP address discovery.
+
+Addresses are looked up per guest by a chain of providers, stopping at
+the first one that finds an address:
+
+1. GuestAgentProvider: the QEMU guest agent (``network-get-interfaces``)
+   of running VMs that have the agent enabled,
+2. LxcInterfacesProvider: the ``interfaces`` endpoint of running
+   containers,
+3. NeighborProvider: the node's neighbour table (``ip -j neigh`` over
+   SSH), matched by MAC, for guests the API could not resolve.
+
+The first two need nothing but the API, so SSH is only used for guests
+without an agent. Results are cached per guest for ``IP_DISCOVERY_TTL``
+seconds, or until the guest is started, stopped, migrated or gets a new
+NIC. Guests whose agent does not answer are not asked again for
+``IP_DISCOVERY_RETRY`` seconds.
+"""
+
+import ipaddress
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+IP_DISCOVERY_TTL = float(os.getenv("IP_DISCOVERY_TTL", 300))
+IP_DISCOVERY_RETRY = float(os.getenv("IP_DISCOVERY_RETRY", 600))
+
+
+def usable_ips(addresses):
+    """Drop loopback, link-local and malformed addresses; IPv4 first, no duplicates."""
+    found = []
+    for address in addresses:
+        try:
+            ip = ipaddress.ip_address(str(address).split("/")[0].split("%")[0])
+        except ValueError:
+            continue
+        if ip.is_loopback or ip.is_link_local or ip.is_multicast or ip.is_unspecified:
+            continue
+        if ip not in found:
+            found.append(ip)
+    return [str(ip) for ip in sorted(found, key=lambda ip: ip.version)]
+
+
+def agent_enabled(config):
+    """Whether a VM config enables the QEMU guest agent (``agent: 1`` or ``enabled=1``)."""
+    options = str(config.get("agent", "0")).split(",")
+    return options[0] == "1" or "enabled=1" in options
+
+
+class ApiProvider:
+    """Provider querying one API endpoint per guest, concurrently."""
+
+    name = "api"
+    retry = IP_DISCOVERY_RETRY
+
+    def __init__(self, client):
+        self.client = client
+
+    def supports(self, guest):
+        raise NotImplementedError
+
+    def path(self, guest):
+        raise NotImplementedError
+
+    def parse(self, data):
+        """Return ``{MAC: [ip, ...]}`` from an endpoint response."""
+        raise NotImplementedError
+
+    def fetch(self, guests):
+        results = self.client.get_many((self.path(g) for g in guests), return_exceptions=True)
+        found = {}
+        for guest, data in zip(guests, results):
+            if isinstance(data, Exception):
+                logger.debug("%s lookup of %s failed: %s", self.name, guest["vmid"], data)
+                continue
+            found[guest["vmid"]] = self.parse(data)
+        return found
+
+
+class GuestAgentProvider(ApiProvider):
+    name = "agent"
+
+    def supports(self, guest):
+        return guest["type"] == "VM" and agent_enabled(guest["config"])
+
+    def path(self, guest):
+        return f"/nodes/{guest['node']}/qemu/{guest['vmid']}/agent/network-get-interfaces"
+
+    def parse(self, data):
+        found = {}
+        for iface in (data or {}).get("result", []):
+            mac = iface.get("hardware-address")
+            if mac:
+                ips = [a.get("ip-address") for a in iface.get("ip-addresses", [])]
+                found.setdefault(mac.upper(), []).extend(ips)
+        return {mac: usable_ips(ips) for mac, ips in found.items()}
+
+
+class LxcInterfacesProvider(ApiProvider):
+    name = "lxc"
+
+    def supports(self, guest):
+        return guest["type"] == "LXC"
+
+    def path(self, guest):
+        return f"/nodes/{guest['node']}/lxc/{guest['vmid']}/interfaces"
+
+    def parse(self, data):
+        found = {}
+        for iface in data or []:
+            mac = iface.get("hwaddr")
+            if mac:
+                ips = f"{iface.get('inet', '')} {iface.get('inet6', '')}".replace(",", " ").split()
+                found.setdefault(mac.upper(), []).extend(ips)
+        return {mac: usable_ips(ips) for mac, ips in found.items()}
+
+
+class NeighborProvider:
+    """Node neighbour table, shared by all guests and fetched once per lookup."""
+
+    name = "neigh"
+    retry = 0
+
+    def __init__(self, run):
+        # run() returns the output of ``ip -j neigh`` on the node.
+        self.run = run
+
+    def supports(self, guest):
+        return True
+
+    def fetch(self, guests):
+        entries = json.loads(self.run())
+        by_mac = {}
+        for entry in entries:
+            mac = entry.get("lladdr")
+            if mac and not {"FAILED", "INCOMPLETE"} & set(entry.get("state", [])):
+                by_mac.setdefault(mac.upper(), []).append(entry.get("dst"))
+        return {
+            g["vmid"]: {mac: usable_ips(by_mac.get(mac, [])) for mac in g["macs"].values()}
+            for g in guests
+        }
+
+
+class IPDiscovery:
+    """Resolves guest IPs through ``providers``, caching the results.
+
+    ``discover`` takes guest list entries extended with their ``config``
+    and ``macs`` (``{netN: MAC}``) and returns, per vmid, the primary
+    ``mac``/``ip`` plus every NIC under ``interfaces`` with all of its
+    addresses.
+    """
+
+    def __init__(self, providers, ttl=IP_DISCOVERY_TTL):
+        self.providers = providers
+        self.ttl = ttl
+        self._results = {}
+        self._skip = {}
+
+    def discover(self, guests):
+        now = time.monotonic()
+        table = {}
+        pending = []
+        for guest in guests:
+            fingerprint = (guest["status"], guest["node"], tuple(guest["macs"].items()))
+            cached = self._results.get(guest["vmid"])
+            if cached is not None and cached[0] > now and cached[1] == fingerprint:
+                table[guest["vmid"]] = cached[2]
+            elif guest["status"] != "running":
+                table[guest["vmid"]] = self._entry(guest, {}, None)
+                self._results[guest["vmid"]] = (now + self.ttl, fingerprint, table[guest["vmid"]])
+            else:
+                pending.append((guest, fingerprint))
+
+        resolved = {}
+        for provider in self.providers:
+            todo = [
+                g for g, _ in pending
+                if g["vmid"] not in resolved
+                and provider.supports(g)
+                and self._skip.get((provider.name, g["vmid"]), 0) <= now
+            ]
+            if not todo:
+                continue
+            try:
+                results = provider.fetch(todo)
+            except Exception as e:
+                logger.warning("IP discovery via %s failed: %s", provider.name, e)
+                continue
+            for guest in todo:
+                found = results.get(guest["vmid"], {})
+                if any(found.get(mac) for mac in guest["macs"].values()):
+                    resolved[guest["vmid"]] = (found, provider.name)
+                elif provider.retry:
+                    self._skip[(provider.name, guest["vmid"])] = now + provider.retry
+
+        for guest, fingerprint in pending:
+            found, source = resolved.get(guest["vmid"], ({}, None))
+            table[guest["vmid"]] = self._entry(guest, found, source)
+            if source is not None:
+                self._results[guest["vmid"]] = (now + self.ttl, fingerprint, table[guest["vmid"]])
+
+        for vmid in set(self._results) - set(table):
+            del self._results[vmid]
+        self._skip = {k: until for k, until in self._skip.items() if until > now and k[1] in table}
+        return table
+
+    @staticmethod
+    def _entry(guest, found, source):
+        interfaces = {}
+        for iface, mac in guest["macs"].items():
+            ips = found.get(mac, [])
+            interfaces[iface] = {"mac": mac, "ip": ips[0] if ips else "N/A", "ips": ips}
+        primary = next(
+            (i for i in interfaces.values() if i["ip"] != "N/A"), next(iter(interfaces.values()))
+        )
+        return {"mac": primary["mac"], "ip": primary["ip"], "interfaces": interfaces, "source": source}
+
+    def invalidate(self, vmid=None):
+        if vmid is None:
+            self._results.clear()
+            self._skip.clear()
+        else:
+            self._results.pop(vmid, None)
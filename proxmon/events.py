@@ -0,0 +1,166 @@
+"""Event-driven guest updates from the Proxmox task log.
+
+Every guest state change goes through a task: qmstart, vzshutdown, a
+migration or a backup. A TaskFollower reads the cluster task log every
+``POLL_EVENTS`` seconds and reports the guests whose tasks started or
+finished since the previous read. Only those guests are then re-fetched
+(``follow_guests``) and merged into the last guest list. The table thus
+follows a start or stop within about a second. The full guest list,
+which also refreshes every guest's usage, is polled every
+``POLL_GUESTS_FALLBACK`` seconds.
+
+The cluster log (``/cluster/tasks``) covers every node in one request.
+When the token may not read it, the follower switches to the node task
+logs, fetched concurrently from a ``since`` cursor with a ``limit``. The
+cursor stays at the oldest still-running task, so its end is seen too.
+Tasks that may add, remove or move guests (create, clone, restore,
+migrate, destroy, template), unknown guests and a full window trigger a
+full guest list poll instead.
+"""
+
+import dataclasses
+import logging
+import os
+
+from .collector import GuestListSnapshot
+from .utils import CLUSTERS, get_client, get_guest_statuses, get_nodes
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS = os.getenv("TASK_EVENTS", "true").lower() in ("true", "1", "yes", "on")
+POLL_GUESTS_FALLBACK = float(os.getenv("POLL_GUESTS_FALLBACK", 30))
+TASK_LOG_LIMIT = int(os.getenv("TASK_LOG_LIMIT", 50))
+# Task types containing one of these may change which guests exist where.
+STRUCTURAL_TASKS = ("create", "clone", "restore", "migrate", "destroy", "template")
+
+
+class TaskFollower:
+    """Follows the task log of one cluster."""
+
+    def __init__(self, cluster, limit=TASK_LOG_LIMIT):
+        self.cluster = cluster
+        self.limit = limit
+        self.cluster_log = True
+        self.since = None
+        self._nodes = None
+        # upid -> whether the task had finished when last seen
+        self._seen = None
+
+    def _node_logs(self):
+        from requests import HTTPError
+
+        client = get_client(self.cluster)
+        if self._nodes is None:
+            self._nodes = [n["node"] for n in get_nodes(self.cluster) if n.get("status") == "online"]
+        # Without a cursor yet, the latest tasks give one in the nodes' clock.
+        query = f"source=all&limit={self.limit}" + (f"&since={int(self.since)}" if self.since else "")
+        results = client.get_many(
+            (f"/nodes/{node}/tasks?{query}" for node in self._nodes), return_exceptions=True
+        )
+        tasks, full = [], False
+        for node, result in zip(self._nodes, results):
+            if isinstance(result, HTTPError):
+                logger.warning("Reading the task log of %s failed: %s", node, result)
+                continue
+            if isinstance(result, Exception):
+                # The node list may be out of date; read it again next time.
+                self._nodes = None
+                raise result
+            tasks.extend(result)
+            # A full window not reaching back to the cursor may have cut tasks off.
+            if len(result) >= self.limit and self.since:
+                full = full or min(t.get("starttime") or 0 for t in result) > self.since
+        return tasks, full
+
+    def _fetch(self):
+        from requests import HTTPError
+
+        if self.cluster_log:
+            try:
+                return get_client(self.cluster).get("/cluster/tasks"), False
+            except HTTPError as e:
+                logger.info("Cannot read the cluster task log (%s), following the node task logs", e)
+                self.cluster_log = False
+        return self._node_logs()
+
+    def poll(self):
+        """Return ``(vmids, full)``: guests touched by tasks that started or
+        finished since the last poll, and whether the whole guest list must
+        be polled. The first poll only reads the current position.
+        """
+        tasks, full = self._fetch()
+        first = self._seen is None
+        seen = {}
+        touched = set()
+        for task in tasks:
+            upid = task.get("upid")
+            if not upid:
+                continue
+            finished = bool(task.get("endtime"))
+            seen[upid] = finished
+            if first or self._seen.get(upid) == finished:
+                continue
+            if any(word in task.get("type", "") for word in STRUCTURAL_TASKS):
+                full = True
+            vmid = str(task.get("id") or "")
+            if vmid.isdigit():
+                touched.add(int(vmid))
+        self._seen = seen
+        running = [t["starttime"] for t in tasks if not t.get("endtime") and t.get("starttime")]
+        newest = max((t.get("starttime") or 0 for t in tasks), default=None)
+        self.since = min(running) if running else newest or self.since
+        return touched, full and not first
+
+
+def refresh_guests(guest_list, vmids):
+    """``guest_list`` with the status of ``vmids`` re-fetched, or None if
+    one of them is not in it or could not be fetched (e.g. it moved)."""
+    by_vmid = {g["vmid"]: g for g in guest_list.guests}
+    if not vmids <= by_vmid.keys():
+        return None
+    changed = sorted(vmids)
+    statuses = get_guest_statuses((by_vmid[v] for v in changed), guest_list.cluster)
+    for vmid, status in zip(changed, statuses):
+        if isinstance(status, Exception):
+            logger.info("Re-fetching guest %s failed: %s", vmid, status)
+            return None
+        by_vmid[vmid] = status
+    return GuestListSnapshot(
+        cluster=guest_list.cluster,
+        guests=tuple(by_vmid[v] for v in sorted(by_vmid)),
+        changed=tuple(changed),
+    )
+
+
+def rebase(snapshot, base):
+    """Apply the re-fetched guests of a partial snapshot to ``base``, the
+    current guest list of its cluster, which may be newer than the list
+    the snapshot was built from."""
+    if snapshot.changed is None or base is None or base is snapshot:
+        return snapshot
+    changed = set(snapshot.changed)
+    refreshed = {g["vmid"]: g for g in snapshot.guests if g["vmid"] in changed}
+    return dataclasses.replace(snapshot, guests=tuple(refreshed.get(g["vmid"], g) for g in base.guests))
+
+
+def follow_guests(follower, guest_list, full_poll):
+    """Scheduler job: a partial GuestListSnapshot for the guests touched by
+    new tasks, or None. ``full_poll()`` is called when the whole list must
+    be polled instead, including when the task log cannot be read.
+    """
+    try:
+        vmids, full = follower.poll()
+    except Exception:
+        full_poll()
+        raise
+    if not vmids and not full:
+        return None
+    snapshot = None if full or guest_list is None else refresh_guests(guest_list, vmids)
+    if snapshot is None:
+        full_poll()
+    return snapshot
+
+
+def followers():
+    """A TaskFollower per configured cluster, or none when TASK_EVENTS is off."""
+    return {cluster: TaskFollower(cluster) for cluster in CLUSTERS} if TASK_EVENTS else {}
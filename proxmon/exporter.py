@@ -0,0 +1,211 @@
+"""Prometheus/OpenMetrics exporter.
+
+``proxmon --exporter`` polls guests, nodes and the node temperature with
+the same collectors and scheduler as the TUI and serves the latest values
+on ``/metrics``. The response body is rendered whenever a snapshot
+arrives, so a scrape only returns cached bytes: it never calls the
+Proxmox API and costs the same however many guests there are.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .collector import (
+    GuestListSnapshot,
+    NodeSnapshot,
+    TemperatureSnapshot,
+    collect_guests,
+    collect_nodes,
+    collect_temperature,
+)
+from .scheduler import Scheduler
+from .utils import CLUSTERS, COLLECT_PARALLELISM, SSH_NODE, default_cluster
+
+logger = logging.getLogger(__name__)
+
+EXPORTER_ADDRESS = os.getenv("EXPORTER_ADDRESS", "127.0.0.1:9221")
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+TICK = 0.25
+
+# (metric, type, help, guest field)
+GUEST_METRICS = (
+    ("proxmon_guest_cpu_ratio", "gauge", "CPU usage of the guest, 1 = one core", "cpu"),
+    ("proxmon_guest_cpus", "gauge", "Number of CPUs assigned to the guest", "cpus"),
+    ("proxmon_guest_memory_bytes", "gauge", "Memory used by the guest", "mem"),
+    ("proxmon_guest_memory_max_bytes", "gauge", "Memory assigned to the guest", "maxmem"),
+    ("proxmon_guest_disk_max_bytes", "gauge", "Disk size of the guest", "maxdisk"),
+    ("proxmon_guest_uptime_seconds", "gauge", "Uptime of the guest", "uptime"),
+    ("proxmon_guest_network_receive_bytes", "counter", "Bytes received by the guest", "netin"),
+    ("proxmon_guest_network_transmit_bytes", "counter", "Bytes sent by the guest", "netout"),
+    ("proxmon_guest_disk_read_bytes", "counter", "Bytes read from disk by the guest", "diskread"),
+    ("proxmon_guest_disk_written_bytes", "counter", "Bytes written to disk by the guest", "diskwrite"),
+)
+
+# (metric, help, path into the node status)
+NODE_METRICS = (
+    ("proxmon_node_cpu_ratio", "CPU usage of the node", ("cpu",)),
+    ("proxmon_node_cpus", "Number of CPUs of the node", ("cpuinfo", "cpus")),
+    ("proxmon_node_memory_total_bytes", "Total memory of the node", ("memory", "total")),
+    ("proxmon_node_memory_free_bytes", "Free memory of the node", ("memory", "free")),
+    ("proxmon_node_rootfs_total_bytes", "Size of the node root filesystem", ("rootfs", "total")),
+    ("proxmon_node_rootfs_used_bytes", "Used space of the node root filesystem", ("rootfs", "used")),
+    ("proxmon_node_uptime_seconds", "Uptime of the node", ("uptime",)),
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _sample(name, labels, value):
+    label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+    return f"{name}{{{label_text}}} {float(value)!r}"
+
+
+def _family(lines, name, kind, help_text, samples):
+    """Append one metric family; ``samples`` is a list of ``(labels, value)``."""
+    lines.append(f"# TYPE {name} {kind}")
+    lines.append(f"# HELP {name} {help_text}")
+    suffix = "_total" if kind == "counter" else ""
+    for labels, value in samples:
+        lines.append(_sample(name + suffix, labels, value))
+
+
+def _lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def render_metrics(guest_lists, nodes, temperature, sources=()):
+    """Render snapshots as an OpenMetrics text exposition."""
+    lines = []
+    guests = [g for snapshot in guest_lists.values() for g in snapshot.guests]
+    guest_labels = [
+        {
+            "cluster": g["cluster"],
+            "node": g["node"],
+            "vmid": g["vmid"],
+            "name": g.get("name", ""),
+            "type": g["type"].lower(),
+        }
+        for g in guests
+    ]
+    _family(lines, "proxmon_guest_up", "gauge", "Whether the guest is running",
+            [(labels, g.get("status") == "running") for g, labels in zip(guests, guest_labels)])
+    for name, kind, help_text, key in GUEST_METRICS:
+        _family(lines, name, kind, help_text, [
+            (labels, g[key]) for g, labels in zip(guests, guest_labels) if g.get(key) is not None
+        ])
+
+    node_labels = {key: {"cluster": key[0], "node": key[1]} for key in nodes}
+    _family(lines, "proxmon_node_up", "gauge", "Whether the node is online",
+            [(node_labels[key], n.online) for key, n in nodes.items()])
+    online = {key: n.status for key, n in nodes.items() if n.online}
+    _family(lines, "proxmon_node_load1", "gauge", "1 minute load average of the node", [
+        (node_labels[key], float(s["loadavg"][0])) for key, s in online.items() if s.get("loadavg")
+    ])
+    for name, help_text, path in NODE_METRICS:
+        _family(lines, name, "gauge", help_text, [
+            (node_labels[key], value)
+            for key, s in online.items()
+            if (value := _lookup(s, path)) is not None
+        ])
+
+    samples = []
+    if temperature is not None:
+        node = SSH_NODE or ""
+        for sensor, value in (temperature.temperature or {}).items():
+            try:
+                samples.append(({"cluster": default_cluster(), "node": node, "sensor": sensor}, float(value)))
+            except (TypeError, ValueError):
+                continue
+    _family(lines, "proxmon_node_temperature_celsius", "gauge", "Node sensor temperature", samples)
+
+    _family(lines, "proxmon_source_last_update_timestamp_seconds", "gauge",
+            "When a data source last delivered a snapshot",
+            [({"source": name}, ts) for name, ts in sources])
+    lines.append("# EOF")
+    return ("\n".join(lines) + "\n").encode()
+
+
+class MetricsExporter:
+    """Keeps the latest snapshots and serves them as metrics."""
+
+    def __init__(self, address=None):
+        host, _, port = (address or EXPORTER_ADDRESS).rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.scheduler = Scheduler(self._submit)
+        self.pool = ThreadPoolExecutor(
+            max_workers=COLLECT_PARALLELISM, thread_name_prefix="proxmon-exporter"
+        )
+        self.guest_lists = {}
+        self.nodes = {}
+        self.temperature = None
+        self.updated = {}
+        self._lock = threading.Lock()
+        self.body = render_metrics({}, {}, None)
+        for cluster in CLUSTERS:
+            self.scheduler.add(f"guests:{cluster}", partial(collect_guests, cluster))
+            self.scheduler.add(f"node:{cluster}", partial(collect_nodes, cluster))
+        self.scheduler.add("temperature", collect_temperature)
+
+    def _submit(self, source):
+        self.pool.submit(self.scheduler.run, source, partial(self.update, source.name))
+
+    def update(self, source, snapshot):
+        """Store a snapshot and re-render the cached response body."""
+        with self._lock:
+            if isinstance(snapshot, GuestListSnapshot):
+                self.guest_lists[snapshot.cluster] = snapshot
+            elif isinstance(snapshot, NodeSnapshot):
+                self.nodes[(snapshot.cluster, snapshot.node)] = snapshot
+            elif isinstance(snapshot, TemperatureSnapshot):
+                self.temperature = snapshot
+            self.updated[source] = snapshot.timestamp
+            self.body = render_metrics(
+                self.guest_lists, self.nodes, self.temperature, sorted(self.updated.items())
+            )
+
+    def _tick(self):
+        while True:
+            self.scheduler.tick()
+            time.sleep(TICK)
+
+    def handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.body
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("%s " + format, self.address_string(), *args)
+
+        return Handler
+
+    def run(self):
+        threading.Thread(target=self._tick, name="proxmon-exporter-tick", daemon=True).start()
+        server = ThreadingHTTPServer(self.address, self.handler())
+        logger.info("Serving metrics on http://%s:%d/metrics", *self.address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,462 @@
+"""Local stand-ins for a Proxmox API server and a node's SSH daemon.
+
+Used by the benchmark suite (bench.py), and handy for trying proxmon
+without a cluster. Both servers bind to 127.0.0.1 on a free port and run
+on daemon threads.
+"""
+
+import json
+import random
+import re
+import shlex
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import paramiko
+
+STATS_PATH = "/_fake/stats"
+ID_SEGMENT = re.compile(r"/(\d+|node\d+|UPID[^/]*)(?=/|$)")
+
+
+def guest_mac(vmid):
+    return "BC:24:11:{:02X}:{:02X}:{:02X}".format((vmid >> 16) & 255, (vmid >> 8) & 255, vmid & 255)
+
+
+def guest_ip(vmid):
+    return f"10.{(vmid >> 16) & 255}.{(vmid >> 8) & 255}.{vmid & 255}"
+
+
+class FakeCluster:
+    """Deterministic cluster state shared by the fake API and SSH servers.
+
+    Guests alternate between VMs and containers, every third guest is
+    stopped, and every fifth VM has no guest agent, so all IP discovery
+    paths are exercised.
+    """
+
+    def __init__(self, guests=100, nodes=1):
+        self.nodes = [f"node{i}" for i in range(1, nodes + 1)]
+        self.guests = [self._guest(i) for i in range(guests)]
+        self.by_vmid = {g["vmid"]: g for g in self.guests}
+        self.started = time.time()
+        self.task_duration = 2.0
+        self.tasks = {}
+
+    def _guest(self, i):
+        vmid = 100 + i
+        kind = "qemu" if i % 2 == 0 else "lxc"
+        return {
+            "id": f"{kind}/{vmid}",
+            "vmid": vmid,
+            "name": f"guest-{vmid}",
+            "type": kind,
+            "node": self.nodes[i % len(self.nodes)],
+            "status": "stopped" if i % 3 == 2 else "running",
+            "maxcpu": 2,
+            "maxmem": 2 << 30,
+            "maxdisk": 32 << 30,
+            "agent": i % 5 != 0,
+            "tags": ("web;prod", "db;prod", "dev", "")[i % 4],
+        }
+
+    def status(self, guest):
+        """Current usage of a guest; counters grow with time."""
+        elapsed = time.time() - self.started
+        running = guest["status"] == "running"
+        vmid = guest["vmid"]
+        data = {k: v for k, v in guest.items() if k != "agent"}
+        data.update(
+            cpu=(vmid % 17) / 100 if running else 0,
+            cpus=guest["maxcpu"],
+            mem=(vmid % 7 + 1) << 27 if running else 0,
+            disk=0,
+            netin=int(vmid * 1000 + elapsed * 50000) if running else 0,
+            netout=int(vmid * 500 + elapsed * 20000) if running else 0,
+            diskread=int(elapsed * 10000) if running else 0,
+            diskwrite=int(elapsed * 5000) if running else 0,
+            uptime=int(elapsed) if running else 0,
+        )
+        return data
+
+    def config(self, guest):
+        nic = "virtio" if guest["type"] == "qemu" else "name=eth0,hwaddr"
+        config = {
+            "name": guest["name"],
+            "cores": guest["maxcpu"],
+            "memory": guest["maxmem"] >> 20,
+            "net0": f"{nic}={guest_mac(guest['vmid'])},bridge=vmbr0",
+            "digest": f"{guest['vmid']:040x}",
+        }
+        if guest["type"] == "qemu":
+            config["agent"] = "1" if guest["agent"] else "0"
+        return config
+
+    def node_status(self, node):
+        return {
+            "cpu": 0.1,
+            "loadavg": ["0.50", "0.40", "0.30"],
+            "cpuinfo": {"cores": 8, "cpus": 16, "model": "Fake CPU"},
+            "memory": {"total": 64 << 30, "free": 32 << 30, "used": 32 << 30},
+            "rootfs": {"total": 100 << 30, "free": 60 << 30, "used": 40 << 30},
+            "uptime": int(time.time() - self.started) + 86400,
+            "pveversion": "pve-manager/8.2.4/fake",
+        }
+
+    def rrddata(self, guest, timeframe):
+        step = {"hour": 60, "day": 1800, "week": 10800, "month": 43200, "year": 604800}.get(timeframe, 60)
+        now = int(time.time()) // step * step
+        return [
+            {
+                "time": now - k * step,
+                "cpu": ((guest["vmid"] + k) % 20) / 100,
+                "mem": 1 << 29,
+                "maxmem": guest["maxmem"],
+                "netin": 50000.0,
+                "netout": 20000.0,
+                "diskread": 10000.0,
+                "diskwrite": 5000.0,
+            }
+            for k in range(70)
+        ]
+
+    def storage(self, node):
+        return [
+            {"storage": "local", "type": "dir", "content": "iso,vztmpl,backup", "active": 1, "enabled": 1,
+             "total": 100 << 30, "used": 40 << 30, "avail": 60 << 30},
+            {"storage": "local-zfs", "type": "zfspool", "content": "images,rootdir", "active": 1, "enabled": 1,
+             "total": 900 << 30, "used": len(self.guests) * (32 << 30) % (900 << 30), "avail": 100 << 30},
+        ]
+
+    def disks(self, node):
+        return [
+            {"devpath": "/dev/nvme0n1", "type": "nvme", "model": "Fake NVMe", "size": 1 << 40,
+             "used": "ZFS", "health": "PASSED", "wearout": 97},
+            {"devpath": "/dev/sda", "type": "hdd", "model": "Fake HDD", "size": 4 << 40,
+             "used": "LVM", "health": "PASSED", "wearout": "N/A"},
+        ]
+
+    def network(self, node):
+        return [
+            {"iface": "eno1", "type": "eth", "active": 1},
+            {"iface": "vmbr0", "type": "bridge", "active": 1, "cidr": "10.0.0.2/8", "bridge_ports": "eno1"},
+        ]
+
+    def netstat(self, node):
+        elapsed = time.time() - self.started
+        return [
+            {"vmid": str(g["vmid"]), "dev": f"tap{g['vmid']}i0",
+             "in": str(int(g["vmid"] * 1000 + elapsed * 50000)), "out": str(int(g["vmid"] * 500 + elapsed * 20000))}
+            for g in self.guests
+            if g["node"] == node and g["status"] == "running"
+        ]
+
+    def run_action(self, guest, action):
+        """Start a power action task; the guest changes state when it finishes."""
+        now = time.time()
+        kind = ("qm" if guest["type"] == "qemu" else "vz") + action
+        upid = f"UPID:{guest['node']}:{len(self.tasks):08X}:00000000:{int(now):08X}:" \
+               f"{kind}:{guest['vmid']}:root@pam:"
+        status = "stopped" if action in ("shutdown", "stop") else "running"
+        self.tasks[upid] = (now, now + self.task_duration, guest, status, kind)
+        return upid
+
+    def settle(self):
+        """Apply the outcome of every task that has finished by now."""
+        now = time.time()
+        for _, finish, guest, status, _ in self.tasks.values():
+            if finish <= now:
+                guest["status"] = status
+
+    def task_status(self, upid):
+        _, finish, _, _, _ = self.tasks[upid]
+        if time.time() < finish:
+            return {"upid": upid, "status": "running"}
+        return {"upid": upid, "status": "stopped", "exitstatus": "OK"}
+
+    def task_log(self, node=None, since=0, limit=None):
+        """Task log entries, newest first, like /cluster/tasks and /nodes/{node}/tasks."""
+        now = time.time()
+        entries = []
+        for upid, (start, finish, guest, _, kind) in self.tasks.items():
+            if (node and guest["node"] != node) or start < since:
+                continue
+            entry = {"upid": upid, "node": guest["node"], "type": kind, "id": str(guest["vmid"]),
+                     "user": "root@pam", "starttime": int(start)}
+            if finish <= now:
+                entry.update(endtime=int(finish), status="OK")
+            entries.append(entry)
+        entries.sort(key=lambda e: e["starttime"], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def neighbors(self):
+        return [
+            {"dst": guest_ip(g["vmid"]), "dev": "vmbr0", "lladdr": guest_mac(g["vmid"]).lower(), "state": ["REACHABLE"]}
+            for g in self.guests
+            if g["status"] == "running"
+        ]
+
+
+class FakeProxmoxAPI:
+    """Minimal read-mostly Proxmox API with configurable latency and jitter.
+
+    ``latency`` and ``jitter`` are in seconds; every response is delayed
+    by ``latency`` plus a uniform random offset of up to ``jitter``.
+    Requests are counted per endpoint, with ids replaced by ``*``; the
+    counts, and the number of commands run by ``ssh`` if given, are
+    served on ``STATS_PATH`` and reset with a POST to it.
+    """
+
+    def __init__(self, cluster, latency=0.0, jitter=0.0, ssh=None):
+        self.cluster = cluster
+        self.latency = latency
+        self.jitter = jitter
+        self.ssh = ssh
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def route(self, method, path, query):
+        c = self.cluster
+        c.settle()
+        if m := re.fullmatch(r"/nodes/[^/]+/(qemu|lxc)/(\d+)/status/(start|shutdown|reboot|stop)", path):
+            guest = c.by_vmid.get(int(m.group(2)))
+            if method != "POST" or guest is None:
+                raise LookupError(path)
+            return c.run_action(guest, m.group(3))
+        if method == "POST":
+            return None
+        if m := re.fullmatch(r"/nodes/[^/]+/tasks/([^/]+)/status", path):
+            upid = unquote(m.group(1))
+            if upid not in c.tasks:
+                raise LookupError(path)
+            return c.task_status(upid)
+        if path == "/cluster/tasks":
+            return c.task_log()
+        if m := re.fullmatch(r"/nodes/([^/]+)/tasks", path):
+            return c.task_log(m.group(1), int(query.get("since", 0)), int(query.get("limit", 50)))
+        if path == "/cluster/resources":
+            return [c.status(g) for g in c.guests]
+        if path == "/nodes":
+            return [{"node": n, "status": "online"} for n in c.nodes]
+        if m := re.fullmatch(r"/nodes/([^/]+)/status", path):
+            return c.node_status(m.group(1))
+        if m := re.fullmatch(r"/nodes/([^/]+)/(storage|disks/list|network|netstat)", path):
+            return getattr(c, m.group(2).split("/")[0])(m.group(1))
+        if m := re.fullmatch(r"/nodes/([^/]+)/(qemu|lxc)", path):
+            return [c.status(g) for g in c.guests if g["node"] == m.group(1) and g["type"] == m.group(2)]
+        m = re.fullmatch(r"/nodes/[^/]+/(qemu|lxc)/(\d+)/(.+)", path)
+        guest = c.by_vmid.get(int(m.group(2))) if m else None
+        if guest is None:
+            raise LookupError(path)
+        action = m.group(3)
+        if action == "status/current":
+            return c.status(guest)
+        if action == "config":
+            return c.config(guest)
+        if action == "rrddata":
+            return c.rrddata(guest, query.get("timeframe", "hour"))
+        if action == "agent/network-get-interfaces":
+            if guest["status"] != "running" or not guest["agent"]:
+                raise RuntimeError("QEMU guest agent is not running")
+            return {"result": [
+                {"name": "lo", "hardware-address": "00:00:00:00:00:00",
+                 "ip-addresses": [{"ip-address": "127.0.0.1", "ip-address-type": "ipv4"}]},
+                {"name": "eth0", "hardware-address": guest_mac(guest["vmid"]).lower(),
+                 "ip-addresses": [{"ip-address": guest_ip(guest["vmid"]), "ip-address-type": "ipv4"}]},
+            ]}
+        if action == "interfaces":
+            if guest["status"] != "running":
+                raise RuntimeError("CT is not running")
+            return [
+                {"name": "lo", "hwaddr": "00:00:00:00:00:00", "inet": "127.0.0.1/8"},
+                {"name": "eth0", "hwaddr": guest_mac(guest["vmid"]).lower(), "inet": f"{guest_ip(guest['vmid'])}/8"},
+            ]
+        raise LookupError(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "total": sum(self.requests.values()),
+                "endpoints": dict(self.requests),
+                "ssh": sum(self.ssh.commands.values()) if self.ssh else 0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            if self.ssh:
+                self.ssh.commands.clear()
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this,
+                # delayed ACKs would add ~40 ms to every response.
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                path, _, query = self.path.partition("?")
+                if path == STATS_PATH:
+                    if method == "POST":
+                        api.reset()
+                    self._reply(200, {"data": api.stats()})
+                    return
+                path = path.removeprefix("/api2/json")
+                with api._lock:
+                    api.requests[f"{method} {ID_SEGMENT.sub('/*', path)}"] += 1
+                delay = api.latency + random.uniform(-api.jitter, api.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+                params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+                try:
+                    self._reply(200, {"data": api.route(method, path, params)})
+                except LookupError:
+                    self._reply(404, {"data": None})
+                except RuntimeError as e:
+                    self._reply(500, {"data": None, "message": str(e)})
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class FakeSSH:
+    """SSH server accepting any password and answering the commands proxmon runs.
+
+    Batched commands (see SSHConnection.run_batch) are answered one by one.
+    """
+
+    BATCH_PART = re.compile(r"printf '\\n%s\\n' (\S+); \{ (.*?); \} 2>&1")
+    # sysfs files read by sensors.SYSFS_COMMAND, in grep -H output order.
+    SENSOR_FILES = (
+        ("/sys/class/thermal/thermal_zone0/type", "acpitz"),
+        ("/sys/class/thermal/thermal_zone1/type", "x86_pkg_temp"),
+        ("/sys/class/thermal/thermal_zone0/temp", "27800"),
+        ("/sys/class/thermal/thermal_zone1/temp", "45000"),
+        ("/sys/class/hwmon/hwmon0/name", "coretemp"),
+        ("/sys/class/hwmon/hwmon1/name", "nvme"),
+        ("/sys/class/hwmon/hwmon0/temp1_input", "45000"),
+        ("/sys/class/hwmon/hwmon0/temp2_input", "42000"),
+        ("/sys/class/hwmon/hwmon1/temp1_input", "38850"),
+        ("/sys/class/hwmon/hwmon0/temp1_label", "Package id 0"),
+        ("/sys/class/hwmon/hwmon0/temp2_label", "Core 0"),
+        ("/sys/class/hwmon/hwmon1/temp1_label", "Composite"),
+    )
+
+    def __init__(self, cluster, latency=0.0):
+        self.cluster = cluster
+        self.latency = latency
+        self.commands = Counter()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sock = None
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    def output(self, command):
+        self.commands[command] += 1
+        if command == "ip -j neigh":
+            return json.dumps(self.cluster.neighbors()), 0
+        if command.startswith("grep -sH . /sys/class/thermal/"):
+            return "\n".join(f"{path}:{value}" for path, value in self.SENSOR_FILES), 0
+        return f"sh: {command.split()[0] if command else ''}: not found", 127
+
+    def execute(self, channel, command):
+        # Answering before paramiko has acknowledged the exec request makes
+        # the client see a closed channel, so always wait a moment.
+        time.sleep(max(self.latency, 0.01))
+        parts = self.BATCH_PART.findall(command)
+        if parts:
+            out = "".join(f"\n{shlex.split(name)[0]}\n{self.output(cmd)[0]}" for name, cmd in parts)
+            status = 0
+        else:
+            out, status = self.output(command)
+        stream = channel.sendall if status == 0 else channel.sendall_stderr
+        stream(out.encode())
+        channel.send_exit_status(status)
+        channel.close()
+
+    def _serve(self):
+        fake = self
+
+        class Server(paramiko.ServerInterface):
+            def get_allowed_auths(self, username):
+                return "password"
+
+            def check_auth_password(self, username, password):
+                return paramiko.AUTH_SUCCESSFUL
+
+            def check_channel_request(self, kind, chanid):
+                if kind == "session":
+                    return paramiko.OPEN_SUCCEEDED
+                return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+            def check_channel_exec_request(self, channel, command):
+                threading.Thread(
+                    target=fake.execute, args=(channel, command.decode()), daemon=True
+                ).start()
+                return True
+
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=Server())
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(16)
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
@@ -0,0 +1,214 @@
+"""Fixed-capacity in-memory time-series store for guest metrics."""
+
+import os
+from array import array
+
+HISTORY_DEPTH = int(os.getenv("HISTORY_DEPTH", 1800))
+# Cumulative byte counters reported by Proxmox.
+COUNTERS = ("netin", "netout", "diskread", "diskwrite")
+GUEST_METRICS = ("cpu", "mem") + COUNTERS
+# Counter samples further apart than this (in seconds) give no rate.
+RATE_MAX_GAP = float(os.getenv("RATE_MAX_GAP", 300))
+MB = 1024 * 1024
+
+
+def guest_sample(data):
+    """Convert a guest status entry into chart units (%, MB; counters as cumulative MB)."""
+    sample = {
+        "cpu": data.get("cpu", data.get("maxcpu", 0)) * 100,
+        "mem": data.get("mem", data.get("maxmem", 0)) / MB,
+    }
+    for c in COUNTERS:
+        sample[c] = (data.get(c) or 0) / MB
+    return sample
+
+
+def rrd_samples(points):
+    """Convert Proxmox ``rrddata`` points into ``(ts, sample)`` pairs.
+
+    RRD network and disk values are average rates, so the counters come
+    out in MB/s like the live history.
+    """
+    samples = []
+    for point in sorted(points, key=lambda p: p["time"]):
+        if point.get("cpu") is None:
+            continue
+        samples.append((
+            float(point["time"]),
+            {
+                "cpu": point["cpu"] * 100,
+                "mem": point.get("mem", 0) / MB,
+                **{c: (point.get(c) or 0) / MB for c in COUNTERS},
+            },
+        ))
+    return samples
+
+
+def counter_rates(samples, counters=COUNTERS):
+    """Turn cumulative counter columns of ``(ts, sample)`` pairs into per-second rates.
+
+    Counter resets (a guest restart) yield a zero rate rather than a
+    negative one. The first sample has no predecessor and is dropped.
+    """
+    rates = []
+    for (prev_ts, prev), (ts, values) in zip(samples, samples[1:]):
+        elapsed = ts - prev_ts
+        if elapsed <= 0:
+            continue
+        values = dict(values)
+        for c in counters:
+            values[c] = max(values[c] - prev[c], 0.0) / elapsed
+        rates.append((ts, values))
+    return rates
+
+
+class CounterRates:
+    """Per-second rates of the guests' cumulative counters, in MB/s.
+
+    Keeps the previous counter values and timestamp of every guest, and
+    ``update`` turns a whole snapshot into rates in one pass. Samples not
+    newer than the previous one are skipped. A counter that went down
+    means the guest restarted and counted up from zero, over at most its
+    uptime. A guest's first sample, or one more than ``max_gap`` seconds
+    after the previous, has no rate yet.
+    """
+
+    def __init__(self, counters=COUNTERS, max_gap=RATE_MAX_GAP):
+        self.counters = tuple(counters)
+        self.max_gap = max_gap
+        self.rates = {}
+        self._previous = {}
+
+    def update(self, ts, items):
+        """Feed ``(key, guest)`` pairs sampled at ``ts``; returns ``{key: {counter: MB/s}}``."""
+        for key, data in items:
+            values = tuple(data.get(c) or 0 for c in self.counters)
+            previous = self._previous.get(key)
+            if previous is not None:
+                elapsed = ts - previous[0]
+                if elapsed <= 0:
+                    continue
+                if elapsed > self.max_gap:
+                    self.rates.pop(key, None)
+                else:
+                    since_restart = max(min(elapsed, data.get("uptime") or elapsed), 1.0)
+                    self.rates[key] = {
+                        c: (v - p) / elapsed / MB if v >= p else v / since_restart / MB
+                        for c, v, p in zip(self.counters, values, previous[1])
+                    }
+            self._previous[key] = (ts, values)
+        return self.rates
+
+    def retain(self, keys):
+        """Forget guests no longer present."""
+        keys = set(keys)
+        for key in self._previous.keys() - keys:
+            del self._previous[key]
+            self.rates.pop(key, None)
+
+
+class TimeSeries:
+    """Ring buffer of timestamped samples for a fixed set of columns.
+
+    Each column is an ``array('d')`` holding every value twice, at ``i``
+    and ``i + capacity``. That keeps the most recent ``n`` samples
+    contiguous at all times, so windows are returned as zero-copy
+    ``memoryview`` slices while appends stay O(1) and memory stays fixed.
+    """
+
+    __slots__ = ("capacity", "columns", "_data", "_head", "_size")
+
+    def __init__(self, columns, capacity=HISTORY_DEPTH):
+        self.capacity = capacity
+        self.columns = ("ts",) + tuple(columns)
+        self._data = {c: array("d", bytes(16 * capacity)) for c in self.columns}
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def last_timestamp(self):
+        return self._data["ts"][self._head - 1 + self.capacity] if self._size else None
+
+    def append(self, ts, values):
+        """Add one sample; ``values`` maps column names to numbers."""
+        head = self._head
+        mirror = head + self.capacity
+        self._data["ts"][head] = self._data["ts"][mirror] = ts
+        for column in self.columns[1:]:
+            value = float(values.get(column, 0.0))
+            data = self._data[column]
+            data[head] = data[mirror] = value
+        self._head = (head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def window(self, column, n=None):
+        """Return the last ``n`` values of a column, oldest first, without copying."""
+        n = self._size if n is None else min(n, self._size)
+        end = self._head + self.capacity
+        return memoryview(self._data[column])[end - n:end]
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+
+class HistoryStore:
+    """Per-guest TimeSeries for every guest seen, with a shared depth.
+
+    Counters are stored as MB/s rates (see CounterRates), not totals.
+    """
+
+    def __init__(self, columns=GUEST_METRICS, capacity=HISTORY_DEPTH):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self._series = {}
+
+    def __contains__(self, key):
+        return key in self._series
+
+    def series(self, key):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = TimeSeries(self.columns, self.capacity)
+        return series
+
+    def append(self, key, ts, values):
+        """Record a sample, ignoring ones older than the latest stored."""
+        series = self.series(key)
+        last = series.last_timestamp
+        if last is not None and ts <= last:
+            return False
+        series.append(ts, values)
+        return True
+
+    def backfill(self, key, samples):
+        """Seed a series with older samples, e.g. from Proxmox RRD data.
+
+        Only samples older than the first stored one are used.
+        """
+        series = self.series(key)
+        live = [
+            (ts, {c: v for c, v in zip(self.columns, values)})
+            for ts, *values in zip(*(series.window(c) for c in series.columns))
+        ]
+        if live:
+            samples = [s for s in samples if s[0] < live[0][0]]
+        if not samples:
+            return 0
+        series.clear()
+        for ts, values in (samples + live)[-series.capacity:]:
+            series.append(ts, values)
+        return len(samples)
+
+    def window(self, key, column, n=None):
+        if key not in self._series:
+            return memoryview(array("d"))
+        return self._series[key].window(column, n)
+
+    def retain(self, keys):
+        """Drop history for keys no longer present."""
+        for key in set(self._series) - set(keys):
+            del self._series[key]
@@ -0,0 +1,175 @@
+"""In-memory guest index for filtering, sorting and grouping the table.
+
+The index keeps every guest of every cluster together with lookup sets
+per status, type, node, cluster and tag, and a lowercase search text
+(vmid, name, tags, MAC and IPs). Snapshots update it incrementally: only
+guests that appeared, disappeared or changed touch the lookup sets.
+
+Queries are whitespace-separated terms that must all match. ``field:value``
+terms look up the index by value prefix (``status:run``, ``type:lxc``,
+``node:pve1``, ``tag:prod``, ``cluster:lab``); ``name:`` and ``ip:`` match a
+substring of that field, and any other term a substring of the search text. Results
+are memoised until the index, the rates or the query change.
+"""
+
+from collections import defaultdict
+
+INDEXED_FIELDS = ("status", "type", "node", "cluster", "tag")
+SUBSTRING_FIELDS = ("name", "ip")
+# Guest fields the lookup sets and search text are built from.
+GUEST_FIELDS = ("vmid", "name", "status", "type", "node", "cluster", "tags")
+GROUP_FIELDS = (None, "node", "status", "type", "cluster", "tag")
+# Columns sorted largest first when first selected.
+DESCENDING = {"cores", "cpu", "mem", "disk", "netin", "netout", "diskread", "diskwrite"}
+
+
+def guest_tags(guest):
+    tags = guest.get("tags") or ""
+    return [t for t in tags.replace(",", ";").replace(" ", ";").split(";") if t]
+
+
+def _ip_sort_key(ip):
+    try:
+        return (0, tuple(int(part) for part in ip.split(".")))
+    except ValueError:
+        return (1, ip)
+
+
+class GuestIndex:
+    """Guests of all clusters, indexed by ``key(guest)``."""
+
+    def __init__(self, key):
+        self.key = key
+        self.guests = {}
+        self.addresses = {}
+        self.rates = {}
+        self.version = 0
+        self._clusters = defaultdict(set)
+        self._fields = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._entries = {}
+        self._text = {}
+        self._cache = None
+
+    def _entry(self, key):
+        guest = self.guests[key]
+        ip_info = self.addresses.get(key, {})
+        ips = [ip for nic in ip_info.get("interfaces", {}).values() for ip in nic.get("ips", ())]
+        if ip_info.get("ip") and ip_info["ip"] not in ips:
+            ips.append(ip_info["ip"])
+        return {
+            "status": {guest.get("status", "")},
+            "type": {guest.get("type", "").lower()},
+            "node": {guest.get("node", "").lower()},
+            "cluster": {guest.get("cluster", "").lower()},
+            "tag": {t.lower() for t in guest_tags(guest)},
+            "name": guest.get("name", "").lower(),
+            "ip": " ".join(ips),
+            "mac": ip_info.get("mac", "").lower(),
+        }
+
+    def _reindex(self, key):
+        """Refresh a guest's lookup sets and search text; False if nothing changed."""
+        entry = self._entry(key) if key in self.guests else None
+        old = self._entries.get(key)
+        if entry == old:
+            return False
+        for field in INDEXED_FIELDS:
+            for value in old[field] if old else ():
+                self._fields[field][value].discard(key)
+            for value in entry[field] if entry else ():
+                self._fields[field][value].add(key)
+        if entry is None:
+            self._entries.pop(key, None)
+            self._text.pop(key, None)
+        else:
+            self._entries[key] = entry
+            vmid = str(self.guests[key]["vmid"])
+            self._text[key] = " ".join((vmid, entry["name"], *entry["tag"], entry["mac"], entry["ip"]))
+        return True
+
+    def update(self, cluster, guests):
+        """Replace the guests of one cluster; returns the keys reindexed."""
+        current = {self.key(g): g for g in guests}
+        changed = set()
+        for key in self._clusters[cluster] - current.keys():
+            del self.guests[key]
+            self._reindex(key)
+            changed.add(key)
+        for key, guest in current.items():
+            old = self.guests.get(key)
+            self.guests[key] = guest
+            # Usage counters change all the time; only these affect the index.
+            if old is None or any(old.get(f) != guest.get(f) for f in GUEST_FIELDS):
+                changed.add(key)
+                self._reindex(key)
+        self._clusters[cluster] = set(current)
+        self.version += 1
+        return changed
+
+    def set_addresses(self, addresses):
+        """Replace the address table (``{key: ip_info}``) and reindex guests whose addresses changed."""
+        previous, self.addresses = self.addresses, addresses
+        for key in self.guests.keys() & (previous.keys() | addresses.keys()):
+            if previous.get(key) != addresses.get(key):
+                self._reindex(key)
+        self.version += 1
+
+    def set_rates(self, rates):
+        """Use ``{key: {counter: MB/s}}`` for sorting by throughput."""
+        self.rates = rates
+        self.version += 1
+
+    def match(self, query):
+        """Keys of the guests matching every term of ``query``."""
+        candidates = None
+        scans = []
+        for term in query.lower().split():
+            field, sep, value = term.partition(":")
+            if sep and field in INDEXED_FIELDS:
+                found = set().union(*(
+                    keys for indexed, keys in self._fields[field].items() if indexed.startswith(value)
+                ))
+                candidates = found if candidates is None else candidates & found
+            elif sep and field in SUBSTRING_FIELDS:
+                scans.append((field, value))
+            else:
+                scans.append((None, term))
+        keys = self.guests.keys() if candidates is None else candidates
+        for field, value in scans:
+            if field is None:
+                keys = [k for k in keys if value in self._text[k]]
+            else:
+                keys = [k for k in keys if value in self._entries[k][field]]
+        return keys
+
+    def sort_key(self, column):
+        """Function mapping a key to its sort value for a table column."""
+        guests, rates, addresses = self.guests, self.rates, self.addresses
+        if column in ("netin", "netout", "diskread", "diskwrite"):
+            return lambda k: rates.get(k, {}).get(column, -1.0)
+        if column == "ip":
+            return lambda k: _ip_sort_key(addresses.get(k, {}).get("ip", ""))
+        if column == "mac":
+            return lambda k: addresses.get(k, {}).get("mac", "")
+        if column in ("status", "type", "node", "name"):
+            return lambda k: (str(guests[k].get(column, "")).lower(), guests[k]["vmid"])
+        field = {"id": "vmid", "cores": "cpus", "mem": "maxmem", "disk": "maxdisk"}.get(column, column)
+        return lambda k: guests[k].get(field) or 0
+
+    def query(self, query="", sort="id", reverse=False, group=None):
+        """Return ``[(group label or None, [keys])]`` for the table, filtered and sorted."""
+        cache_key = (self.version, query, sort, reverse, group)
+        if self._cache is not None and self._cache[0] == cache_key:
+            return self._cache[1]
+        keys = sorted(self.match(query), key=self.sort_key(sort), reverse=reverse)
+        if group is None:
+            result = [(None, keys)]
+        else:
+            groups = defaultdict(list)
+            for key in keys:
+                # Guests with several tags are listed under the first one.
+                labels = sorted(self._entries[key][group])
+                groups[labels[0] if labels else "(none)"].append(key)
+            result = sorted(groups.items())
+        self._cache = (cache_key, result)
+        return result
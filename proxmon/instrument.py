@@ -0,0 +1,137 @@
+"""Self-instrumentation: latency histograms, error and in-flight counts.
+
+API requests, SSH commands, scheduler polls and UI render callbacks are
+timed under names like ``api GET /nodes/*/status`` or ``render table``.
+Each name keeps its call and error counts, the number of calls currently
+in flight, and the most recent durations for percentiles. The data is
+shown in the TUI's debug panel and can be exported as JSON.
+"""
+
+import functools
+import json
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLES = 1024
+ID_SEGMENT = re.compile(r"/(\d+|UPID[^/]*)(?=/|$)")
+NODE_SEGMENT = re.compile(r"^/nodes/[^/]+")
+
+
+def endpoint(path):
+    """API path with node names, ids and task UPIDs replaced by ``*``, so
+    requests group per endpoint."""
+    path = path.split("?")[0].split("/api2/json", 1)[-1]
+    return ID_SEGMENT.sub("/*", NODE_SEGMENT.sub("/nodes/*", path))
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    """Durations of one operation; percentiles cover the last ``SAMPLES`` calls."""
+
+    __slots__ = ("count", "errors", "in_flight", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(ordered, 0.50) * 1000,
+            "p95_ms": percentile(ordered, 0.95) * 1000,
+            "p99_ms": percentile(ordered, 0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Instrumentation:
+    """Thread-safe registry of histograms."""
+
+    def __init__(self):
+        self.enabled = True
+        self.started = time.time()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name, duration, error=False):
+        """Record a finished call that was not timed with ``timer``."""
+        with self._lock:
+            histogram = self._histogram(name)
+            histogram.count += 1
+            histogram.errors += error
+            histogram.total += duration
+            histogram.max = max(histogram.max, duration)
+            histogram.samples.append(duration)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block; exceptions count as errors and propagate."""
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            self._histogram(name).in_flight += 1
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self._histogram(name).in_flight -= 1
+            self.record(name, duration, error)
+
+    def timed(self, name):
+        """Decorator form of ``timer``."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Return ``{name: summary}``, sorted by name."""
+        with self._lock:
+            return {name: h.summary() for name, h in sorted(self._histograms.items())}
+
+    def to_json(self):
+        return json.dumps(
+            {"started": self.started, "exported": time.time(), "metrics": self.snapshot()},
+            indent=2,
+        )
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = Instrumentation()
+timer = registry.timer
+timed = registry.timed
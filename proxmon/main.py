@@ -1,68 +1,92 @@
+import argparse
 import json
 import os
+import sys
+import tempfile
+import threading
 import time
-import re
 import logging
-import requests
-import paramiko
-import psutil
-from dotenv import load_dotenv
+from textual import work
 from textual.app import App, ComposeResult
-from textual.containers import Horizontal, VerticalScroll, Container
-from textual.widgets import Header, Footer, DataTable, Static, Log, RichLog
-from textual.widgets import Pretty
+from textual.message import Message
+from textual.containers import VerticalScroll, Container
+from textual.widgets import Header, Footer, DataTable, Input, Static
 from textual.timer import Timer
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.table import Table
 from rich import box
 from rich.text import Text
+from rich.markup import escape
+
+from functools import partial
 
 from .utils import (
-    get_cpu_temperature,
-    get_data_from_proxapi,
-    get_vmids,
-    get_vm_data,
-    find_vm_ip_address,
-    get_rrd_data,
-    get_vm_config,
-    draw_vertical_bar_chart,
+    CLUSTERS,
+    SSH_NODE,
+    get_client,
+    guest_key,
 )
+from .charts import ChartRenderer
+from .history import COUNTERS, CounterRates, HistoryStore, counter_rates, guest_sample, rrd_samples
+from .index import DESCENDING, GROUP_FIELDS, GuestIndex
+from .store import FLUSH_INTERVAL, open_store
+from .collector import (
+    GuestListSnapshot,
+    AddressSnapshot,
+    NodeSnapshot,
+    TemperatureSnapshot,
+    GuestDetailSnapshot,
+    NodeDetailSnapshot,
+    collect_guests,
+    collect_addresses,
+    collect_nodes,
+    collect_temperature,
+    collect_guest_detail,
+    collect_node_detail,
+    snapshot_from_dict,
+    snapshot_to_dict,
+)
+from .scheduler import Scheduler
+from .events import POLL_GUESTS_FALLBACK, follow_guests, followers, rebase
+from .actions import FAILED, TIMEOUT, BulkAction, action_path, resolve_action
+from .alerts import FIRING, AlertEngine, dispatch, guest_metrics, load_rules, node_metrics
+from .instrument import registry as instrumentation, timed
+from .ssh import close_all as close_ssh_connections
 
-# Configure logging
-logging.basicConfig(level=logging.ERROR)
-# Use a more appropriate log path that works across different systems
-import tempfile
-
-log_file_path = os.path.join(tempfile.gettempdir(), "proxmon.log")
-file_handler = logging.FileHandler(log_file_path)
-file_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
-logging.getLogger().addHandler(file_handler)
-
-# Load environment variables
-load_dotenv()
-
-# Proxmox API configuration
-PROXMOX_API_URL = os.getenv("PROXMOX_HOST")
-API_TOKEN_ID = os.getenv("TOKEN_ID")
-API_TOKEN_SECRET = os.getenv("TOKEN_SECRET")
-NODE = os.getenv("NODE")
-SSH_HOST = os.getenv("SSH_HOST")
-SSH_PORT = int(os.getenv("SSH_PORT", 22))
-SSH_USER = os.getenv("SSH_USER")
-SSH_PASSWORD = os.getenv("SSH_PASSWORD")
-NO_SSL_CHECK = os.getenv("NO_SSL_CHECK", "false").lower() in ("true", "1", "yes", "on")
-
-from .utils import ssh_execute_command
-
-# Disable warnings for unverified HTTPS requests
-requests.packages.urllib3.disable_warnings(
-    requests.packages.urllib3.exceptions.InsecureRequestWarning
+LOG_LEVEL = os.getenv("LOG_LEVEL", "ERROR").upper()
+# Last snapshots are saved here on exit and shown at launch with --cached.
+SNAPSHOT_CACHE = os.getenv("SNAPSHOT_CACHE") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "proxmon", "snapshot.json"
 )
 
-HEADERS = {"Authorization": f"PVEAPIToken={API_TOKEN_ID}={API_TOKEN_SECRET}"}
+
+def setup_logging():
+    """Log to stderr and to proxmon.log in the temp directory."""
+    logging.basicConfig(level=LOG_LEVEL)
+    file_handler = logging.FileHandler(os.path.join(tempfile.gettempdir(), "proxmon.log"))
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logging.getLogger().addHandler(file_handler)
+
+CHART_WIDTH = 90
+# "live" charts local history (seeded from the hour RRD), the others
+# chart the server's pre-aggregated RRD data directly.
+ZOOM_LEVELS = ("live", "day", "week")
+ZOOM_SPANS = {"day": 86400, "week": 7 * 86400}
+RRD_REFRESH_INTERVAL = 60
+SCHEDULER_TICK = 0.25
+# The event loop is expected to run this timer on time; any delay is
+# recorded as "ui loop lag", i.e. time the UI was unresponsive.
+LAG_PROBE_INTERVAL = 0.5
+CHARTS = (
+    ("cpu", "CPU Usage", {"color": "green", "agg": "max"}),
+    ("mem", "Memory Usage", {"color": "cyan", "decimal_places": 0}),
+    ("netin", "Network In", {"color": "yellow", "style": "braille", "decimal_places": 2}),
+    ("netout", "Network Out", {"color": "dodger_blue2", "style": "braille", "decimal_places": 2}),
+    ("diskread", "Disk Read", {"color": "magenta", "style": "braille", "decimal_places": 2}),
+    ("diskwrite", "Disk Write", {"color": "red", "style": "braille", "decimal_places": 2}),
+)
 
 # Global variables
 TABLE_CURSOR = dict()
@@ -71,50 +95,258 @@ selected_vm = {
     "type": None,
     "name": None,
     "status": None,
+    "node": None,
+    "cluster": None,
 }
 
 
 def toggle_vm(self):
-    """Start or stop the selected VM or LXC."""
+    """Start or stop the selected VM or LXC; returns the UPID of the task."""
     global selected_vm
     if selected_vm["vmid"] is None:
         self.notify("Select a VM/LXC first!", severity="warning")
         return
 
-    vmid = selected_vm["vmid"]
-    vm_type = selected_vm["type"]
-    vm_status = selected_vm["status"].split(" ")[1].lower()
-    data = get_vm_data(selected_vm["vmid"], selected_vm["type"])
-    vm_status = data["status"]
+    action = resolve_action(selected_vm, "toggle")
     vm_name = selected_vm["name"]
-    guesttype = "qemu" if vm_type == "vm" else "lxc"
-    if vm_status == "running":
+    vm_type = selected_vm["type"]
+    if action == "shutdown":
         self.notify(f"{vm_name} {vm_type} Shutting down!")
-        url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/status/shutdown"
     else:
         self.notify(f"{vm_name} {vm_type} Starting!")
-        url = (
-            f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/status/start"
+    return get_client(selected_vm["cluster"]).post(action_path(selected_vm, action))
+
+
+TABLE_COLUMNS = (
+    ("mark", " "),
+    ("id", "ID"),
+    ("status", "Status"),
+    ("type", "Type"),
+    ("node", "Node"),
+    ("name", "Name"),
+    ("cores", "Core"),
+    ("cpu", "CPU (%)"),
+    ("mem", "RAM (MB)"),
+    ("disk", "Disk (GB)"),
+    ("netin", "NetIN (MB/s)"),
+    ("netout", "NetOUT (MB/s)"),
+    ("diskread", "DiskR (MB/s)"),
+    ("diskwrite", "DiskW (MB/s)"),
+    ("mac", "MAC"),
+    ("ip", "IP"),
+)
+
+
+def row_key(guest):
+    """DataTable row key of a guest."""
+    cluster, vmid = guest_key(guest)
+    return f"{cluster}/{vmid}"
+
+
+def guest_row(data, ip_info, marked=False, rates=None, alerting=False):
+    """Format a guest status entry as table cells, in TABLE_COLUMNS order.
+
+    ``rates`` holds the guest's counter rates in MB/s (see CounterRates);
+    they show as "-" until two samples were seen. Guests with a firing
+    alert get a highlighted name.
+    """
+    mem_usage = (data.get("maxmem", 0)) / (1024 * 1024) if data.get("mem", 0) != 0 else 0
+    return (
+        "●" if marked else "",
+        str(data["vmid"]),
+        "🟢 Running" if data["status"] == "running" else "🔴 Stopped",
+        data["type"],
+        data["node"] if len(CLUSTERS) == 1 else f"{data['cluster']}/{data['node']}",
+        f"[bold white on red]⚠ {escape(data['name'])}[/]" if alerting else data["name"],
+        "  " + str(data["cpus"]),
+        str(round(data.get("cpu", 0) * 100, 2)),
+        str(round(mem_usage, 0)),
+        str(round(data.get("maxdisk", 0) / (1024 * 1024 * 1024), 0)),
+        *(f"{rates[c]:.2f}" if rates else "-" for c in COUNTERS),
+        ip_info.get("mac", "N/A"),
+        ip_info.get("ip", "N/A"),
+    )
+
+
+def format_bytes(value):
+    """Human-readable size of a byte count."""
+    value = float(value or 0)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if value < 1024 or unit == "TiB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value:.0f} B"
+        value /= 1024
+
+
+def node_detail_tables(detail, sensors=None, sensor_history=None):
+    """Rich tables for a NodeDetailSnapshot: storage, disks, network, guest
+    interfaces, and the node's temperature ``sensors`` if known, with the
+    range of each in ``sensor_history`` (a HistoryStore keyed by sensor)."""
+    storage = Table(title="Storage", box=box.SIMPLE, expand=True)
+    for column in ("Storage", "Type", "Content", "Used", "Total", "Use %", "Status"):
+        storage.add_column(column, justify="right" if column in ("Used", "Total", "Use %") else "left")
+    for pool in sorted(detail.storage, key=lambda p: p.get("storage", "")):
+        total = pool.get("total") or 0
+        used = pool.get("used") or 0
+        storage.add_row(
+            pool.get("storage", ""),
+            pool.get("type", ""),
+            pool.get("content", ""),
+            format_bytes(used),
+            format_bytes(total),
+            f"{used / total * 100:.0f}" if total else "-",
+            "active" if pool.get("active") else "[red]inactive[/red]",
+        )
+
+    disks = Table(title="Disks", box=box.SIMPLE, expand=True)
+    for column in ("Device", "Type", "Model", "Size", "Used by", "Health", "Wearout"):
+        disks.add_column(column, justify="right" if column in ("Size", "Wearout") else "left")
+    for disk in sorted(detail.disks, key=lambda d: d.get("devpath", "")):
+        health = str(disk.get("health", ""))
+        disks.add_row(
+            disk.get("devpath", ""),
+            disk.get("type", ""),
+            disk.get("model", ""),
+            format_bytes(disk.get("size")),
+            str(disk.get("used", "")),
+            health if health in ("PASSED", "OK", "") else f"[red]{health}[/red]",
+            str(disk.get("wearout", "")),
+        )
+
+    network = Table(title="Network", box=box.SIMPLE, expand=True)
+    for column in ("Interface", "Type", "Active", "Address", "Ports/Slaves"):
+        network.add_column(column)
+    for iface in sorted(detail.network, key=lambda i: i.get("iface", "")):
+        network.add_row(
+            iface.get("iface", ""),
+            iface.get("type", ""),
+            "yes" if iface.get("active") else "no",
+            iface.get("cidr") or iface.get("address", ""),
+            iface.get("bridge_ports") or iface.get("slaves", ""),
         )
-    response = requests.post(url, headers=HEADERS, verify=not NO_SSL_CHECK)
-    response.raise_for_status()
-    return response.json()
+
+    netstat = Table(title="Guest interfaces", box=box.SIMPLE, expand=True)
+    for column in ("VMID", "Device", "In", "Out"):
+        netstat.add_column(column, justify="right" if column in ("In", "Out") else "left")
+    def traffic(iface):
+        return int(iface.get("in") or 0) + int(iface.get("out") or 0)
+
+    for iface in sorted(detail.netstat, key=traffic, reverse=True):
+        netstat.add_row(
+            str(iface.get("vmid", "")), iface.get("dev", ""),
+            format_bytes(iface.get("in")), format_bytes(iface.get("out")),
+        )
+
+    layout = Table.grid(expand=True)
+    layout.add_column(ratio=1)
+    layout.add_column(ratio=1)
+    layout.add_row(storage, disks)
+    layout.add_row(network, netstat)
+    if sensors:
+        table = Table(title="Sensors", box=box.SIMPLE, expand=True)
+        table.add_column("Sensor")
+        for column in ("°C", "Min", "Max"):
+            table.add_column(column, justify="right")
+        for name, value in sensors.items():
+            if name == "CPU":
+                continue
+            window = sensor_history.window(name, "temp") if sensor_history is not None else ()
+            low, high = (f"{min(window):.1f}", f"{max(window):.1f}") if len(window) else ("-", "-")
+            table.add_row(escape(name), f"{float(value):.1f}", low, high)
+        layout.add_row(table, "")
+    return layout
+
+
+def group_row(label, count):
+    """Separator row shown above each group when the table is grouped."""
+    cells = [""] * len(TABLE_COLUMNS)
+    cells[[key for key, _ in TABLE_COLUMNS].index("name")] = f"── {label} ({count}) ──"
+    return tuple(cells)
+
+
+class SnapshotReady(Message):
+    """Posted by a collector worker when a fresh snapshot is available."""
+
+    def __init__(self, snapshot, cached=False) -> None:
+        self.snapshot = snapshot
+        # True for snapshots restored from the cache at launch.
+        self.cached = cached
+        super().__init__()
 
 
 class ProxmonApp(App):
     CSS_PATH = "styles.tcss"
+    AUTO_FOCUS = "#vm_table"
     BINDINGS = [
         ("up", "prev_entry", "Up"),
         ("down", "next_entry", "Down"),
         ("enter", "select", "Select"),
+        ("space", "mark", "Mark"),
         ("s", "toggle_vm", "Start/Stop"),
+        ("r", "reboot_vm", "Reboot"),
+        ("slash", "search", "Filter"),
+        ("o", "sort", "Sort"),
+        ("O", "reverse_sort", "Reverse"),
+        ("g", "group", "Group"),
+        ("escape", "clear_search", "Clear filter"),
+        ("z", "zoom", "Zoom"),
+        ("n", "toggle_node_detail", "Node"),
+        ("d", "toggle_debug", "Debug"),
+        ("x", "export_metrics", "Export metrics"),
         ("ctrl+q", "quit", "Quit"),
     ]
 
     timer: Timer
-    timer_rrd: Timer
     layout = Layout()
-    vm_stats = {}
+
+    def __init__(self, *args, attach=None, cached=False, record=None, replay=None, speed=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Address of a ``proxmon collect`` daemon to take snapshots from
+        # instead of polling; "" means the default socket.
+        self.attach = attach
+        self.cached = cached
+        self._daemon = None
+        # Recording to write the snapshots to, and one to show instead of
+        # polling; a replay never touches the network or the history DB.
+        self.record = record
+        self.replay = replay
+        self.speed = speed
+        self._recorder = None
+        self._replay_stop = threading.Event()
+        self.history = HistoryStore()
+        # Temperatures of the sensor node, keyed by sensor name.
+        self.sensor_history = HistoryStore(columns=("temp",))
+        self.store = open_store() if replay is None else None
+        self.zoom = 0
+        self._seeded = set()
+        self._rrd_cache = {}
+        self._rows = {}
+        self._guest_lists = {}
+        self._live_clusters = set()
+        self._guests_by_key = {}
+        # Row keys of the guests marked for a bulk action.
+        self._marked = set()
+        self.index = GuestIndex(guest_key)
+        self.rates = CounterRates()
+        # Detail snapshots come from status/current rather than the guest
+        # list, so their counters are tracked separately.
+        self._detail_rates = CounterRates()
+        self.search_text = ""
+        self.sort_column = "id"
+        self.sort_reverse = False
+        self.group_by = None
+        self._order = []
+        # Rules are loaded in on_mount, where errors can be shown.
+        self.alerts = AlertEngine(())
+        self._ip_table = {}
+        self._node_stats = {}
+        self._node_details = {}
+        self._temperature = None
+        self._followers = {}
+        self.scheduler = Scheduler(self._submit)
+        self.charts = {
+            name: ChartRenderer(height=8, width=CHART_WIDTH, **options)
+            for name, _, options in CHARTS
+        }
 
     def compose(self) -> ComposeResult:
         yield Header("Proxmox Monitor")
@@ -123,15 +355,263 @@ class ProxmonApp(App):
             id="topbar_container",
             classes="topbar_container",
         )
+        yield Input(
+            placeholder="Filter: text, status:running, type:lxc, node:, tag:, cluster:, name:, ip:",
+            id="search",
+        )
         yield VerticalScroll(DataTable(id="vm_table"), id="vm_table_vs")
+        yield VerticalScroll(Static(id="node_detail_panel"), id="node_detail")
+        yield VerticalScroll(Static(id="debug_panel"), id="debug")
         yield VerticalScroll(Static(id="stats", expand=True))
         yield Footer()
 
     def update_node_stats(self):
-        """Update and display node statistics."""
-        temp = get_cpu_temperature()
-        url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/status"
-        node_data = get_data_from_proxapi(url)
+        """Poll node statistics of every cluster as soon as possible."""
+        for cluster in CLUSTERS:
+            self.scheduler.trigger(f"node:{cluster}")
+
+    def update_table(self):
+        """Poll the VM and LXC list of every cluster as soon as possible."""
+        for cluster in CLUSTERS:
+            self.scheduler.trigger(f"guests:{cluster}")
+
+    def update_rrd_data(self):
+        """Poll the selected VM or LXC as soon as possible."""
+        if self.replay is not None:
+            return
+        if self.attach is not None:
+            self.watch_with_history()
+        else:
+            self.scheduler.trigger("detail")
+
+    def watch_selected(self):
+        """Tell the collector daemon which guest's details to send."""
+        if self._daemon is None or selected_vm["vmid"] is None:
+            return
+        key = (selected_vm["cluster"], selected_vm["vmid"])
+        try:
+            self._daemon.watch({
+                "cluster": key[0],
+                "vmid": key[1],
+                "type": selected_vm["type"],
+                "name": selected_vm["name"],
+                "node": selected_vm["node"],
+                "zoom": ZOOM_LEVELS[self.zoom],
+                "seeded": key in self._seeded,
+            })
+        except OSError:
+            logging.exception("Sending watch request failed")
+
+    @work(thread=True, group="daemon", exit_on_error=False)
+    def read_daemon(self) -> None:
+        """Relay snapshots from the collector daemon to the UI thread."""
+        from .daemon import SnapshotClient
+
+        try:
+            self._daemon = SnapshotClient(self.attach or None)
+        except OSError as e:
+            self.notify(f"Cannot attach to collector: {e}", severity="error", timeout=30)
+            return
+        self.call_from_thread(self.watch_selected)
+        try:
+            for snapshot in self._daemon:
+                self.post_message(SnapshotReady(snapshot))
+        except (OSError, ValueError):
+            logging.exception("Reading from collector failed")
+        self.notify("Collector connection closed", severity="error", timeout=30)
+
+    @work(thread=True, group="replay", exit_on_error=False)
+    def play_recording(self) -> None:
+        """Post the snapshots of a recording to the UI thread at the chosen speed."""
+        from .recording import replay
+
+        try:
+            count = replay(
+                self.replay, lambda snapshot: self.post_message(SnapshotReady(snapshot)),
+                speed=self.speed, stop=self._replay_stop,
+            )
+        except OSError as e:
+            self.notify(f"Cannot replay {self.replay}: {e}", severity="error", timeout=30)
+            return
+        if not self._replay_stop.is_set():
+            self.notify(f"Replay finished: {count} snapshots", timeout=30)
+
+    def _follow_tasks(self, cluster):
+        """Scheduler job re-fetching the guests touched by new tasks (see events.py)."""
+        # A list restored from the cache is no base for partial updates.
+        guest_list = self._guest_lists.get(cluster) if cluster in self._live_clusters else None
+        return follow_guests(
+            self._followers[cluster], guest_list, partial(self.scheduler.trigger, f"guests:{cluster}")
+        )
+
+    @work(thread=True, group="stored", exit_on_error=False)
+    def watch_with_history(self) -> None:
+        """Apply the selected guest's stored history, then tell the collector
+        daemon which guest to send, so it skips RRD data the store has."""
+        if selected_vm["vmid"] is not None:
+            key = (selected_vm["cluster"], selected_vm["vmid"])
+            stored = self.stored_history(key, ZOOM_LEVELS[self.zoom])
+            if stored:
+                self.call_from_thread(self.apply_stored_history, key, stored)
+        self.call_from_thread(self.watch_selected)
+
+    def _collect_detail(self):
+        """Scheduler job for the selected VM or LXC."""
+        vmid = selected_vm["vmid"]
+        if vmid is None:
+            return None
+        key = (selected_vm["cluster"], vmid)
+        zoom = ZOOM_LEVELS[self.zoom]
+        stored = self.stored_history(key, zoom)
+        if stored:
+            self.call_from_thread(self.apply_stored_history, key, stored)
+        rrd_timeframe = None
+        if key not in self._seeded:
+            rrd_timeframe = "hour"
+        elif zoom != "live" and zoom not in stored:
+            fetched, _ = self._rrd_cache.get((key, zoom), (0, []))
+            if time.time() - fetched > RRD_REFRESH_INTERVAL:
+                rrd_timeframe = zoom
+        return collect_guest_detail(
+            vmid,
+            selected_vm["type"],
+            selected_vm["name"],
+            rrd_timeframe,
+            node=selected_vm["node"],
+            cluster=selected_vm["cluster"],
+        )
+
+    def _collect_addresses(self):
+        """Scheduler job resolving IPs for the latest guest list."""
+        if not self._guests_by_key:
+            return None
+        return collect_addresses(tuple(self._guests_by_key.values()))
+
+    def _submit(self, source):
+        """Start a scheduler source on a worker thread."""
+        self.run_worker(
+            lambda: self._run_source(source),
+            thread=True,
+            group=source.name,
+            exit_on_error=False,
+        )
+
+    def _run_source(self, source):
+        self.scheduler.run(source, lambda snapshot: self.post_message(SnapshotReady(snapshot)))
+
+    def on_snapshot_ready(self, message: SnapshotReady) -> None:
+        """Render the latest snapshot; runs on the UI thread."""
+        snapshot = message.snapshot
+        if isinstance(snapshot, GuestListSnapshot):
+            # Guests not re-fetched after task events stay as currently shown.
+            snapshot = rebase(snapshot, self._guest_lists.get(snapshot.cluster))
+        if self._recorder is not None and not message.cached:
+            self._recorder.record(snapshot)
+        if isinstance(snapshot, GuestListSnapshot):
+            if message.cached:
+                if snapshot.cluster in self._live_clusters:
+                    return
+            elif snapshot.cluster not in self._live_clusters:
+                self._live_clusters.add(snapshot.cluster)
+                self.scheduler.trigger("addresses")
+                if self._live_clusters >= CLUSTERS.keys() and self.replay is None:
+                    self.sub_title = ""
+            self.render_table(snapshot)
+        elif isinstance(snapshot, AddressSnapshot):
+            if message.cached and self._ip_table:
+                return
+            self._ip_table = snapshot.ip_table
+            self.index.set_addresses(self._ip_table)
+            self.render_table()
+        elif isinstance(snapshot, NodeSnapshot):
+            if message.cached and (snapshot.cluster, snapshot.node) in self._node_stats:
+                return
+            self.render_node_stats(snapshot)
+            if not message.cached:
+                self.evaluate_node_alerts(snapshot.timestamp)
+        elif isinstance(snapshot, TemperatureSnapshot):
+            self._temperature = snapshot.temperature
+            self.record_sensors(snapshot)
+            self.render_node_stats()
+            self.evaluate_node_alerts(snapshot.timestamp)
+        elif isinstance(snapshot, GuestDetailSnapshot):
+            self.render_guest_detail(snapshot)
+        elif isinstance(snapshot, NodeDetailSnapshot):
+            self._node_details[(snapshot.cluster, snapshot.node)] = snapshot
+            self.render_node_detail()
+
+    def evaluate_node_alerts(self, ts):
+        """Check node rules against the online nodes; the temperature belongs to the SSH node."""
+        if not self.alerts.wants("node"):
+            return
+        sensor_node = self.sensor_node()
+        items = [
+            (key, node_metrics(n.status, self._temperature if n.node == sensor_node else None))
+            for key, n in self._node_stats.items()
+            if n.online
+        ]
+        self.alerts.retain("node", [key for key, _ in items])
+        self.announce_alerts(self.alerts.evaluate(ts, "node", items))
+
+    def sensor_node(self):
+        """Name of the node the temperatures belong to: SSH_NODE, or the only node."""
+        if SSH_NODE is None and len(self._node_stats) == 1:
+            return next(iter(self._node_stats))[1]
+        return SSH_NODE
+
+    def record_sensors(self, snapshot):
+        """Keep per-sensor history in memory and, once the sensor node's
+        cluster is known, in the store."""
+        if not snapshot.temperature:
+            return
+        for sensor, value in snapshot.temperature.items():
+            self.sensor_history.append(sensor, snapshot.timestamp, {"temp": value})
+        node = self.sensor_node()
+        cluster = next((c for c, n in self._node_stats if n == node), None)
+        if self.store is not None and cluster is not None:
+            self.store.record_sensors(cluster, node, snapshot.timestamp, snapshot.temperature)
+
+    def announce_alerts(self, events):
+        """Toast fired and resolved alerts and run their hooks."""
+        for event in events:
+            rule = event.rule
+            if rule.scope == "node":
+                label = f"node {event.key[-1]}"
+            else:
+                guest = self.index.guests.get(event.key, {})
+                label = f"{guest.get('name', '')} ({event.key[1]})"
+            if event.state == FIRING:
+                self.notify(f"{label}: {rule.describe(event.value)}", title=rule.name,
+                            severity=rule.severity, timeout=10)
+            else:
+                self.notify(f"{label}: {rule.metric} back to normal", title=f"{rule.name} resolved")
+            if self.replay is None:
+                dispatch(event, label)
+
+    def on_app_focus(self) -> None:
+        self.scheduler.idle = False
+
+    def on_app_blur(self) -> None:
+        self.scheduler.idle = True
+
+    def displayed_node(self):
+        """The node shown in the top bar: the selected guest's, else the first one."""
+        key = (selected_vm["cluster"], selected_vm["node"])
+        if key in self._node_stats and self._node_stats[key].online:
+            return self._node_stats[key]
+        return next((n for n in self._node_stats.values() if n.online), None)
+
+    @timed("render node stats")
+    def render_node_stats(self, snapshot: NodeSnapshot | None = None):
+        """Display statistics of the displayed node."""
+        if snapshot is not None:
+            self._node_stats[(snapshot.cluster, snapshot.node)] = snapshot
+        node = self.displayed_node()
+        if node is None:
+            return
+        temp = (self._temperature if node.node == self.sensor_node() else None) or {}
+        cpu_temp = f"{float(temp['CPU']):.1f}" if temp.get("CPU") is not None else "N/A"
+        node_data = node.status
         free_memory = node_data.get("memory").get("free", 0) / (1024 * 1024 * 1024)
         total_memory = node_data.get("memory").get("total", 0) / (1024 * 1024 * 1024)
         used_memory = round(total_memory - free_memory, 0)
@@ -146,256 +626,566 @@ class ProxmonApp(App):
         disk_total = node_data.get("rootfs").get("total") / (1024 * 1024 * 1024)
         disk_used = node_data.get("rootfs").get("used") / (1024 * 1024 * 1024)
 
+        online = sum(1 for n in self._node_stats.values() if n.online)
         text = (
-            f"  {node_data.get('pveversion')} "
+            (f"  {node.node} ({online}/{len(self._node_stats)} nodes up) " if len(self._node_stats) > 1 else "")
+            + f"  {node_data.get('pveversion')} "
             f"｜  CPU: {node_data.get('cpuinfo').get('model')} "
             f"｜  Cores: {node_data.get('cpuinfo').get('cores')} "
             f"｜  Load: {cpu_load:.0f}% "
-            f"｜ Temp:{str(temp.get('CPU', 'N/A'))} °C "
+            f"｜ Temp:{cpu_temp} °C "
             f"｜  RAM: {used_memory:.0f}/{total_memory:.0f} GB "
             f"｜  Disk: {disk_used:.0f}/{disk_total:.0f} GB "
             f"｜  Uptime: {formatted_uptime} "
         )
         self.query_one("#topbar", Static).update(Text(text, justify="full", style=""))
+        self.render_node_detail()
 
     def on_mount(self):
         """Initialize the app and set up timers."""
         global selected_vm
         table = self.query_one("#vm_table", DataTable)
-        table.add_columns(
-            "ID",
-            "Status",
-            "Type",
-            "Name",
-            "Core",
-            "CPU (%)",
-            "RAM (MB)",
-            "Disk (GB)",
-            "NetIN (MB)",
-            "NetOUT (MB)",
-            "MAC",
-            "IP",
-        )
+        for key, label in TABLE_COLUMNS:
+            table.add_column(label, key=key)
         table.cursor_type = "row"
         table.zebra_stripes = False
         table.border = True
-        self.update_table()
-        self.update_node_stats()
+        try:
+            self.alerts = AlertEngine(load_rules())
+        except ValueError as e:
+            self.notify(f"Alert rules not loaded: {e}", severity="error", timeout=30)
+        if self.record:
+            from .recording import SnapshotRecorder
+
+            try:
+                self._recorder = SnapshotRecorder(self.record)
+            except OSError as e:
+                self.notify(f"Cannot record to {self.record}: {e}", severity="error", timeout=30)
+        if self.replay is not None:
+            self.sub_title = f"replay of {self.replay}" + (f" at {self.speed:g}x" if self.speed else "")
+            self.play_recording()
+        elif self.attach is not None:
+            self.read_daemon()
+        else:
+            # With task events, the full guest list is only a fallback.
+            self._followers = followers()
+            for cluster in CLUSTERS:
+                self.scheduler.add(
+                    f"guests:{cluster}", partial(collect_guests, cluster),
+                    interval=POLL_GUESTS_FALLBACK if self._followers else None,
+                )
+                self.scheduler.add(f"node:{cluster}", partial(collect_nodes, cluster))
+                if cluster in self._followers:
+                    self.scheduler.add(f"events:{cluster}", partial(self._follow_tasks, cluster))
+            self.scheduler.add("addresses", self._collect_addresses)
+            self.scheduler.add("temperature", collect_temperature)
+            self.scheduler.add("detail", self._collect_detail).active = False
+        # Polled directly even when attached: it is only fetched while the
+        # drilldown is open.
+        self.scheduler.add("nodedetail", self._collect_node_detail).active = False
+        if self.store is not None:
+            self.scheduler.add("store", self.flush_store, interval=FLUSH_INTERVAL)
 
-        self.timer = self.set_interval(10, self.update_table)
-        self.timer_node_stats = self.set_interval(10, self.update_node_stats)
-        self.timer_rrd = self.set_interval(2, self.update_rrd_data)
+        # Nothing above blocks: the first frame is painted right away and
+        # the table fills in as the pollers, started by the first tick on
+        # worker threads, deliver their snapshots.
+        table.loading = True
+        if self.cached:
+            self.load_cached_snapshot()
+        self.timer = self.set_interval(SCHEDULER_TICK, self.scheduler.tick)
+        self.call_after_refresh(self.scheduler.tick)
+        self._lag_due = time.perf_counter() + LAG_PROBE_INTERVAL
+        self.set_interval(LAG_PROBE_INTERVAL, self.probe_loop_lag)
+        self.set_interval(1, self.render_debug)
 
-    def on_key(self, event) -> None:
-        """Handle key events."""
-        if event.key == "s":
-            toggle_vm(self)
-            self.update_table()
+    def probe_loop_lag(self):
+        now = time.perf_counter()
+        instrumentation.record("ui loop lag", max(now - self._lag_due, 0.0))
+        self._lag_due = now + LAG_PROBE_INTERVAL
 
-    def update_table(self):
-        """Update the VM and LXC table."""
-        global TABLE_CURSOR
+    def render_debug(self):
+        """Show the instrumentation histograms while the debug panel is open."""
+        panel = self.query_one("#debug")
+        if not panel.has_class("visible"):
+            return
+        table = Table(box=box.SIMPLE, expand=True)
+        for column in ("operation", "count", "errors", "in flight", "p50 ms", "p95 ms", "p99 ms", "max ms"):
+            table.add_column(column, justify="left" if column == "operation" else "right")
+        for name, m in instrumentation.snapshot().items():
+            table.add_row(
+                name,
+                str(m["count"]),
+                f"[red]{m['errors']}[/red]" if m["errors"] else "0",
+                str(m["in_flight"]),
+                f"{m['p50_ms']:.1f}",
+                f"{m['p95_ms']:.1f}",
+                f"{m['p99_ms']:.1f}",
+                f"{m['max_ms']:.1f}",
+            )
+        self.query_one("#debug_panel", Static).update(
+            Panel(table, title="Instrumentation", border_style="yellow")
+        )
+
+    def _collect_node_detail(self):
+        """Scheduler job for the node drilldown; idle while it is hidden or replaying."""
+        if self.replay is not None or not self.scheduler.sources["nodedetail"].active:
+            return None
+        node = self.displayed_node()
+        if node is None:
+            return None
+        cached = self._node_details.get((node.cluster, node.node))
+        if cached is not None and time.time() - cached.timestamp < self.scheduler.intervals["nodedetail"]:
+            return None
+        return collect_node_detail(node.cluster, node.node)
+
+    def action_toggle_node_detail(self) -> None:
+        """Show or hide storage, disks and network of the displayed node."""
+        panel = self.query_one("#node_detail")
+        panel.toggle_class("visible")
+        self.scheduler.set_active("nodedetail", panel.has_class("visible"))
+        self.render_node_detail()
+
+    @timed("render node detail")
+    def render_node_detail(self):
+        """Display the cached drilldown of the displayed node."""
+        if not self.query_one("#node_detail").has_class("visible"):
+            return
+        node = self.displayed_node()
+        detail = self._node_details.get((node.cluster, node.node)) if node else None
+        if detail is None:
+            # The displayed node changed, or the drilldown was just opened.
+            self.scheduler.trigger("nodedetail")
+            body = Text("Loading node details…")
+            title = f"Node {node.node}" if node else "Node"
+        else:
+            sensors = self._temperature if detail.node == self.sensor_node() else None
+            body = node_detail_tables(detail, sensors, self.sensor_history)
+            updated = time.strftime("%H:%M:%S", time.localtime(detail.timestamp))
+            title = f"Node {detail.node} (updated {updated})"
+        self.query_one("#node_detail_panel", Static).update(
+            Panel(body, title=title, border_style="green")
+        )
+
+    def action_toggle_debug(self) -> None:
+        self.query_one("#debug").toggle_class("visible")
+        self.render_debug()
+
+    def action_export_metrics(self) -> None:
+        """Write the instrumentation data to a JSON file in the temp directory."""
+        path = os.path.join(tempfile.gettempdir(), f"proxmon-metrics-{int(time.time())}.json")
+        try:
+            with open(path, "w") as f:
+                f.write(instrumentation.to_json())
+        except OSError as e:
+            self.notify(f"Export failed: {e}", severity="error")
+            return
+        self.notify(f"Metrics exported to {path}")
+
+    def on_unmount(self) -> None:
+        self._replay_stop.set()
+        if self._daemon is not None:
+            self._daemon.close()
+        if self._recorder is not None:
+            self._recorder.close()
+        if self.store is not None:
+            self.store.close()
+        if self.replay is None:
+            self.save_snapshot()
+
+    def save_snapshot(self):
+        """Save the latest guest lists, node statuses and addresses for --cached."""
+        if not SNAPSHOT_CACHE or not self._guest_lists:
+            return
+        snapshots = [*self._guest_lists.values(), *self._node_stats.values()]
+        if self._ip_table:
+            snapshots.append(AddressSnapshot(ip_table=self._ip_table))
+        try:
+            os.makedirs(os.path.dirname(SNAPSHOT_CACHE), exist_ok=True)
+            with open(SNAPSHOT_CACHE, "w") as f:
+                json.dump([snapshot_to_dict(s) for s in snapshots], f)
+        except (OSError, TypeError, ValueError):
+            logging.exception("Saving snapshot cache failed")
+
+    def load_cached_snapshot(self):
+        """Show the snapshot saved on the last exit until live data replaces it."""
+        try:
+            with open(SNAPSHOT_CACHE) as f:
+                snapshots = [snapshot_from_dict(s) for s in json.load(f)]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        for snapshot in snapshots:
+            if isinstance(snapshot, GuestListSnapshot) and snapshot.cluster not in CLUSTERS:
+                continue
+            self.post_message(SnapshotReady(snapshot, cached=True))
+        if snapshots:
+            saved = time.strftime("%H:%M:%S", time.localtime(snapshots[0].timestamp))
+            self.sub_title = f"cached snapshot from {saved}"
+
+    def record_sample(self, key, ts, data, rates):
+        """Add a guest status to the live history and, if enabled, the on-disk store.
+
+        The store keeps the cumulative counters, the live history their
+        ``rates``; without rates yet, only the store gets the sample.
+        """
+        sample = guest_sample(data)
+        if rates is not None:
+            self.history.append(key, ts, {**sample, **rates})
+        if self.store is not None:
+            self.store.record(key, ts, sample)
+
+    def flush_store(self):
+        """Scheduler job writing the store's queued samples; it yields no snapshot."""
+        self.store.flush()
+
+    def stored_history(self, key, zoom):
+        """Read what the store has for a guest's charts; runs on a worker
+        thread, as store reads wait for a running flush.
+
+        Returns ``{"hour": (samples, covered)}`` to seed the live history
+        of a guest not seeded yet, and ``{zoom: samples}`` when the store
+        covers the zoomed range and the chart data is stale.
+        """
+        stored = {}
+        if self.store is None:
+            return stored
+        now = time.time()
+        if key not in self._seeded:
+            since = now - 3600
+            stored["hour"] = (counter_rates(self.store.load(key, since)), self.store.covers(key, since))
+        if zoom != "live":
+            fetched, _ = self._rrd_cache.get((key, zoom), (0, []))
+            since = now - ZOOM_SPANS[zoom]
+            if now - fetched > RRD_REFRESH_INTERVAL and self.store.covers(key, since):
+                stored[zoom] = counter_rates(self.store.load(key, since))
+        return stored
+
+    def apply_stored_history(self, key, stored):
+        """Seed the live history and zoomed chart data from stored_history()."""
+        for timeframe, data in stored.items():
+            if timeframe != "hour":
+                self._rrd_cache[(key, timeframe)] = (time.time(), data)
+            elif key not in self._seeded:
+                samples, covered = data
+                self.history.backfill(key, samples)
+                if covered:
+                    # No need to backfill from the RRD hour data.
+                    self._seeded.add(key)
+
+    def action_mark(self) -> None:
+        """Mark or unmark the guest under the cursor for a bulk action."""
         table = self.query_one("#vm_table", DataTable)
+        if not table.row_count:
+            return
+        key = table.coordinate_to_cell_key((table.cursor_row, 0)).row_key.value
+        self._marked ^= {key}
+        self.render_table()
 
-        # Store the current cursor position
-        selected_row = table.cursor_row
+    def action_toggle_vm(self) -> None:
+        """Start stopped and shut down running guests among the marked or selected ones."""
+        self.apply_action("toggle")
 
-        table.clear()
+    def action_reboot_vm(self) -> None:
+        """Reboot the marked or selected guests."""
+        self.apply_action("reboot")
 
-        vm_data = []
-        for vmid in get_vmids()["vm"]:
-            json_data = get_vm_data(vmid, type="vm")
-            json_data["type"] = "VM"
-            vm_data.append(json_data)
+    def apply_action(self, action):
+        """Apply ``action`` to the marked guests, or the selected one if none are marked."""
+        if self.replay is not None:
+            self.notify("Actions are not available in a replay", severity="warning")
+            return
+        keys = list(self._marked)
+        if not keys and selected_vm["vmid"] is not None:
+            keys = [f"{selected_vm['cluster']}/{selected_vm['vmid']}"]
+        guests = [self._guests_by_key[key] for key in keys if key in self._guests_by_key]
+        if not guests:
+            self.notify("Select or mark a VM/LXC first!", severity="warning")
+            return
+        self._marked.clear()
+        self.render_table()
+        self.bulk_action(guests, action)
 
-        for vmid in get_vmids()["lxc"]:
-            json_data = get_vm_data(vmid, type="lxc")
-            json_data["type"] = "LXC"
-            vm_data.append(json_data)
+    @work(thread=True, group="actions", exit_on_error=False)
+    def bulk_action(self, guests, action) -> None:
+        """Submit a bulk action and follow its tasks without blocking the UI."""
+        bulk = BulkAction(guests, action)
+        if len(guests) == 1:
+            task = bulk.tasks[0]
+            self.notify(f"{task.label}: {task.action}")
+        else:
+            self.notify(f"{action}: {len(guests)} guests")
+        try:
+            bulk.run(on_update=lambda b: self.call_from_thread(self.show_action_progress, b))
+        except Exception as e:
+            logging.exception("Bulk %s failed", action)
+            self.notify(f"Action failed: {e}", severity="error")
+            return
+        finally:
+            self.call_from_thread(self.update_table)
+        failed = [t for t in bulk.tasks if t.state in (FAILED, TIMEOUT)]
+        for task in failed:
+            self.notify(f"{task.label} {task.action}: {task.error or task.state}", severity="error")
+        self.notify(bulk.summary(), severity="warning" if failed else "information")
 
-        vm_data = sorted(vm_data, key=lambda d: d["vmid"])
-        ip_data = find_vm_ip_address()
+    def show_action_progress(self, bulk):
+        self.sub_title = "" if bulk.done else bulk.summary()
 
-        for idx, data in enumerate(vm_data):
-            mem_usage = (
-                (data.get("maxmem", 0)) / (1024 * 1024)
-                if data.get("mem", 0) != 0
-                else 0
-            )
-            table.add_row(
-                str(data["vmid"]),
-                "🟢 Running" if data["status"] == "running" else "🔴 Stopped",
-                data["type"],
-                data["name"],
-                "  " + str(data["cpus"]),
-                str(round(data.get("cpu", 0) * 100, 2)),
-                str(round(mem_usage, 0)),
-                str(round(data.get("maxdisk", 0) / (1024 * 1024 * 1024), 0)),
-                str(round(data["netin"] / (1024 * 1024), 2)),
-                str(round(data["netout"] / (1024 * 1024), 2)),
-                ip_data.get(data["vmid"]).get("mac", "N/A"),
-                ip_data.get(data["vmid"]).get("ip", "N/A"),
-            )
+    @timed("render table")
+    def render_table(self, snapshot: GuestListSnapshot | None = None):
+        """Display the merged VM and LXC table of all clusters.
+
+        ``snapshot`` replaces the guest list of its cluster in the guest
+        index, and its counters are turned into rates in one batch; for a
+        partial snapshot only the re-fetched guests are sampled. Only
+        guests matching the filter become rows, in the index's sort and
+        group order. Rows are keyed by cluster and vmid and diffed against
+        the previous render, so only changed cells are updated, rows are
+        only added or removed when guests appear, disappear or stop
+        matching, and rows are only reordered when the order changed.
+        """
+        table = self.query_one("#vm_table", DataTable)
+        if snapshot is not None:
+            self._guest_lists[snapshot.cluster] = snapshot
+            sampled = snapshot.guests
+            if snapshot.changed is not None:
+                changed = set(snapshot.changed)
+                sampled = [g for g in snapshot.guests if g["vmid"] in changed]
+            rates = self.rates.update(snapshot.timestamp, ((guest_key(g), g) for g in sampled))
+            for data in sampled:
+                key = guest_key(data)
+                self.record_sample(key, snapshot.timestamp, data, rates.get(key))
+            self.index.update(snapshot.cluster, snapshot.guests)
+            self.index.set_rates(rates)
+            keys = self.index.guests.keys()
+            self.history.retain(keys)
+            self.rates.retain(keys)
+            self._detail_rates.retain(keys)
+            self.alerts.retain("guest", keys)
+            if snapshot.cluster in self._live_clusters:
+                # Not for snapshots restored from the cache.
+                self.announce_alerts(self.alerts.evaluate(
+                    snapshot.timestamp, "guest",
+                    ((guest_key(g), guest_metrics(g, rates.get(guest_key(g)))) for g in sampled),
+                    select=self.index.match,
+                ))
+        guests = self.index.guests
+        self._guests_by_key = {row_key(g): g for g in guests.values()}
+        self._marked &= self._guests_by_key.keys()
+        ip_data = self._ip_table
+        rates = self.index.rates
+        alerting = self.alerts.firing_keys("guest")
+
+        # Remember which guest the cursor is on, not just the row index
+        cursor_key = None
+        if table.row_count:
+            cursor_key = table.coordinate_to_cell_key((table.cursor_row, 0)).row_key
+
+        groups = self.index.query(self.search_text, self.sort_column, self.sort_reverse, self.group_by)
+        rows = {}
+        for label, keys in groups:
+            if label is not None:
+                rows[f"group:{label}"] = group_row(label, len(keys))
+            for key in keys:
+                data = guests[key]
+                rows[row_key(data)] = guest_row(
+                    data, ip_data.get(key, {}), row_key(data) in self._marked, rates.get(key),
+                    key in alerting,
+                )
+        for key in self._rows.keys() - rows.keys():
+            table.remove_row(key)
+        for key, cells in rows.items():
+            previous = self._rows.get(key)
+            if previous is None:
+                table.add_row(*cells, key=key)
+                continue
+            for (column, _), old, new in zip(TABLE_COLUMNS, previous, cells):
+                if old != new:
+                    table.update_cell(key, column, new)
+        order = list(rows)
+        if order != self._order:
+            # DataTable.sort only passes cell values to the key function;
+            # every row's cells are unique (vmid and node or group label).
+            position = {cells: i for i, cells in enumerate(rows.values())}
+            table.sort(key=position.__getitem__)
+            self._order = order
+        first_render = not self._rows and bool(rows)
+        table.loading = False
+        self._rows = rows
+        self.update_table_title(len(guests), sum(len(keys) for _, keys in groups))
+
+        if cursor_key is not None and cursor_key.value in rows:
+            table.move_cursor(row=table.get_row_index(cursor_key))
+        if first_render and self.focused is None:
+            table.focus()
+
+    def update_table_title(self, total, shown):
+        """Show the guest count, sort order, grouping and filter on the table border."""
+        label = dict(TABLE_COLUMNS)[self.sort_column]
+        parts = [f"{shown}/{total} guests" if shown != total else f"{total} guests"]
+        parts.append(f"sort: {label} {'↓' if self.sort_reverse else '↑'}")
+        if self.group_by is not None:
+            parts.append(f"group: {self.group_by}")
+        if self.search_text:
+            parts.append(f"filter: {self.search_text}")
+        self.query_one("#vm_table", DataTable).border_title = " · ".join(parts)
 
-        # Restore the cursor position
-        if selected_row is not None and selected_row < len(table.rows):
-            table.move_cursor(row=selected_row)
+    def action_search(self) -> None:
+        """Show the filter input."""
+        search = self.query_one("#search", Input)
+        search.add_class("visible")
+        search.focus()
+
+    def action_clear_search(self) -> None:
+        """Clear the filter and hide its input."""
+        search = self.query_one("#search", Input)
+        if not search.has_class("visible") and not self.search_text:
+            return
+        search.value = ""
+        search.remove_class("visible")
+        self.search_text = ""
+        self.render_table()
+        self.query_one("#vm_table", DataTable).focus()
 
-        table.focus()
+    def on_input_changed(self, event: Input.Changed) -> None:
+        """Filter the table while typing."""
+        if event.input.id == "search":
+            self.search_text = event.value.strip()
+            self.render_table()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """Keep the filter and go back to the table."""
+        if event.input.id == "search":
+            if not self.search_text:
+                event.input.remove_class("visible")
+            self.query_one("#vm_table", DataTable).focus()
+
+    def set_sort(self, column, reverse=None):
+        self.sort_column = column
+        self.sort_reverse = column in DESCENDING if reverse is None else reverse
+        self.render_table()
+
+    def action_sort(self) -> None:
+        """Sort by the next column."""
+        columns = [key for key, _ in TABLE_COLUMNS if key != "mark"]
+        self.set_sort(columns[(columns.index(self.sort_column) + 1) % len(columns)])
+
+    def action_reverse_sort(self) -> None:
+        self.set_sort(self.sort_column, not self.sort_reverse)
+
+    def on_data_table_header_selected(self, event: DataTable.HeaderSelected) -> None:
+        """Sort by the clicked column; clicking it again reverses the order."""
+        column = event.column_key.value
+        if column == "mark":
+            return
+        if column == self.sort_column:
+            self.set_sort(column, not self.sort_reverse)
+        else:
+            self.set_sort(column)
+
+    def action_group(self) -> None:
+        """Cycle the grouping between none, node, status, type, cluster and tag."""
+        self.group_by = GROUP_FIELDS[(GROUP_FIELDS.index(self.group_by) + 1) % len(GROUP_FIELDS)]
+        self.render_table()
 
     def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
         """Handle row selection in the data table."""
         global selected_vm
         global TABLE_CURSOR
-        table = self.query_one("#vm_table", DataTable)
-        row_key = event.row_key
-        row_data = table.get_row(row_key)
-
-        # selected_vm.update({
-        #     "name": row_data[3],
-        #     "vmid": row_data[0],
-        #     "type": row_data[2].lower(),
-        #     "status": row_data[1],
-        # })
-        selected_vm["name"] = row_data[3]
-        selected_vm["vmid"] = row_data[0]
-        selected_vm["type"] = row_data[2].lower()
-        selected_vm["status"] = row_data[1]
+        guest = self._guests_by_key.get(event.row_key.value)
+        if guest is None:
+            return
+
+        selected_vm["name"] = guest["name"]
+        selected_vm["vmid"] = guest["vmid"]
+        selected_vm["type"] = guest["type"].lower()
+        selected_vm["status"] = guest["status"]
+        selected_vm["node"] = guest["node"]
+        selected_vm["cluster"] = guest["cluster"]
 
         TABLE_CURSOR = {"cursor_row": event.cursor_row, "row_key": event.row_key}
+        if "detail" in self.scheduler.sources:
+            self.scheduler.set_active("detail", True)
         self.update_rrd_data()
+        self.render_node_stats()
 
-    def update_rrd_data(self):
-        """Update RRD data for the selected VM or LXC."""
-        global selected_vm
-        if selected_vm["vmid"] is None:
+    @timed("render guest detail")
+    def render_guest_detail(self, snapshot: GuestDetailSnapshot):
+        """Display stats and charts for the selected VM or LXC."""
+        if (snapshot.cluster, snapshot.vmid) != (selected_vm["cluster"], selected_vm["vmid"]):
+            # Selection changed while this snapshot was being collected.
             return
 
-        vmid = selected_vm["vmid"]
-        vm_type = selected_vm["type"]
-        vm_name = selected_vm["name"]
-        # rrd_data = get_rrd_data(vmid=vmid, vm_type=vm_type)
-        # rrd_data = sorted(rrd_data, key=lambda d: d['time'])
-
-        data = get_vm_data(vmid, vm_type)
-        ts = time.time()
-        cpu = data.get("cpu", data.get("maxcpu", 0)) * 100
-        mem = data.get("mem", data.get("maxmem", 0)) / (1024 * 1024)
-        netin = data.get("netin", 0) / (1024 * 1024)
-        netout = data.get("netout", 0) / (1024 * 1024)
-
-        if vmid not in self.vm_stats:
-            self.vm_stats[vmid] = {
-                "ts": [],
-                "cpu": [],
-                "mem": [],
-                "netin": [],
-                "netout": [],
-            }
-
-        # Update stats and keep only the last 100 values
-        self.vm_stats[vmid]["ts"].append(ts)
-        self.vm_stats[vmid]["ts"] = self.vm_stats[vmid]["ts"][-100:]
-
-        self.vm_stats[vmid]["cpu"].append(cpu)
-        self.vm_stats[vmid]["cpu"] = self.vm_stats[vmid]["cpu"][-100:]
-
-        self.vm_stats[vmid]["mem"].append(mem)
-        self.vm_stats[vmid]["mem"] = self.vm_stats[vmid]["mem"][-100:]
-
-        self.vm_stats[vmid]["netin"].append(netin)
-        self.vm_stats[vmid]["netin"] = self.vm_stats[vmid]["netin"][-100:]
-
-        self.vm_stats[vmid]["netout"].append(netout)
-        self.vm_stats[vmid]["netout"] = self.vm_stats[vmid]["netout"][-100:]
+        key = (snapshot.cluster, snapshot.vmid)
+        vmid = snapshot.vmid
+        vm_type = snapshot.vm_type
+        vm_name = snapshot.name
+
+        data = snapshot.data
+        ts = snapshot.timestamp
+        sample = guest_sample(data)
+        cpu, mem = sample["cpu"], sample["mem"]
+        rates = self._detail_rates.update(ts, ((key, data),)).get(key)
+        self.record_sample(key, ts, data, rates)
+        events = self.alerts.evaluate(ts, "guest", ((key, guest_metrics(data, rates)),), select=self.index.match)
+        if events:
+            self.announce_alerts(events)
+            self.render_table()
+        throughput = (
+            "  ".join(
+                f"{label}: {rates[c]:.2f} MB/s"
+                for label, c in zip(("NetIn", "NetOut", "DiskR", "DiskW"), COUNTERS)
+            )
+            if rates else "NetIn/NetOut/Disk: - MB/s"
+        )
+        if snapshot.rrd_timeframe == "hour" and key not in self._seeded:
+            self.history.backfill(key, rrd_samples(snapshot.rrd))
+            self._seeded.add(key)
+        elif snapshot.rrd_timeframe:
+            self._rrd_cache[(key, snapshot.rrd_timeframe)] = (ts, rrd_samples(snapshot.rrd))
 
         layout = self.stats_layout()
         vm_type_icon = "" if vm_type == "lxc" else ""
         layout["stat_header"].update(
             Panel(
                 f"VMID: {vmid} Type: {vm_type_icon}  {vm_type.upper()}"
-                + f" Name: {vm_name} CPU:  {cpu:.1f} % Mem:   {mem:.1f} MB  NetIn:   MB {netin:.1f}  Netout:   {netout:.1f} MB",
+                + f" Name: {vm_name} CPU:  {cpu:.1f} % Mem:   {mem:.1f} MB  {throughput}",
                 title="Stats",
                 border_style="blue",
             )
         )
 
-        if data.get("status") == "running":
-            layout["cpu"].update(
-                Panel(
-                    draw_vertical_bar_chart(
-                        self.vm_stats[vmid]["cpu"],
-                        height=8,
-                        chart_width=90,
-                        color="green",
-                    ),
-                    title="CPU Usage",
-                    border_style="blue",
-                )
-            )
-            layout["mem"].update(
-                Panel(
-                    draw_vertical_bar_chart(
-                        self.vm_stats[vmid]["mem"],
-                        height=8,
-                        chart_width=90,
-                        color="cyan",
-                        decimal_places=0,
-                    ),
-                    title="Memory Usage",
-                    border_style="blue",
-                )
-            )
-            layout["netin"].update(
-                Panel(
-                    draw_vertical_bar_chart(
-                        self.vm_stats[vmid]["netin"],
-                        height=8,
-                        chart_width=90,
-                        color="yellow",
-                        decimal_places=1,
-                        char=".",
-                    ),
-                    title="Network In",
-                    border_style="blue",
-                )
-            )
-            layout["netout"].update(
-                Panel(
-                    draw_vertical_bar_chart(
-                        self.vm_stats[vmid]["netout"],
-                        height=8,
-                        chart_width=90,
-                        color="dodger_blue2",
-                        decimal_places=1,
-                        char=".",
-                    ),
-                    title="Network Out",
-                    border_style="blue",
-                )
-            )
-        else:
-            layout["cpu"].update(
-                Panel("VM/LXC Not Running!", title="CPU Usage", border_style="blue")
-            )
-            layout["mem"].update(
-                Panel("VM/LXC Not Running!", title="Memory Usage", border_style="blue")
-            )
-            layout["netin"].update(
-                Panel("VM/LXC Not Running!", title="Network In", border_style="blue")
-            )
-            layout["netout"].update(
-                Panel("VM/LXC Not Running!", title="Network Out", border_style="blue")
-            )
+        zoom = ZOOM_LEVELS[self.zoom]
+        for name, title, _ in CHARTS:
+            if data.get("status") != "running":
+                body = "VM/LXC Not Running!"
+            else:
+                body = self.charts[name].render(self.chart_series(key, name, zoom))
+            details = [zoom] if zoom != "live" else []
+            if name in COUNTERS:
+                details.append("MB/s")
+            if details:
+                title = f"{title} ({', '.join(details)})"
+            layout[name].update(Panel(body, title=title, border_style="blue"))
 
-        self.query_one("#stats", Static).update(layout)
-        # layout["misc"].update(Panel(str(get_vm_config(vmid, vm_type)), border_style="blue"))
         layout["misc"].update(
             Panel(
-                json.dumps(get_vm_config(vmid, vm_type), indent=4, sort_keys=True),
+                json.dumps(snapshot.config, indent=4, sort_keys=True),
                 border_style="magenta",
             )
         )
+        self.query_one("#stats", Static).update(layout)
+
+    def chart_series(self, key, metric, zoom):
+        """Values to chart: live history, or server-side RRD data when zoomed out."""
+        if zoom == "live":
+            return self.history.window(key, metric)
+        _, samples = self._rrd_cache.get((key, zoom), (0, []))
+        return [values[metric] for _, values in samples]
+
+    def action_zoom(self) -> None:
+        """Cycle the chart timeframe between live history and RRD day/week."""
+        self.zoom = (self.zoom + 1) % len(ZOOM_LEVELS)
+        self.notify(f"Chart timeframe: {ZOOM_LEVELS[self.zoom]}")
+        self.update_rrd_data()
 
     def stats_layout(self):
         """Define the layout for statistics display."""
@@ -408,6 +1198,7 @@ class ProxmonApp(App):
         layout["main"].split_column(
             Layout(name="process"),
             Layout(name="network"),
+            Layout(name="disk"),
         )
         layout["process"].split_row(
             Layout(name="cpu"),
@@ -417,13 +1208,73 @@ class ProxmonApp(App):
             Layout(name="netin"),
             Layout(name="netout"),
         )
+        layout["disk"].split_row(
+            Layout(name="diskread"),
+            Layout(name="diskwrite"),
+        )
         return layout
 
 
 def main():
     """Main entry point for the application."""
-    app = ProxmonApp()
-    app.run()
+    parser = argparse.ArgumentParser(prog="proxmon", description="Proxmox monitoring TUI")
+    parser.add_argument(
+        "command", nargs="?", choices=("tui", "collect", "bench"), default="tui",
+        help="run the TUI (default), a headless collector daemon or the benchmarks "
+        "(see 'proxmon bench --help')",
+    )
+    parser.add_argument(
+        "--listen", metavar="ADDR",
+        help="collect: Unix socket path or host:port to publish snapshots on",
+    )
+    parser.add_argument(
+        "--attach", nargs="?", const="", metavar="ADDR",
+        help="tui: show snapshots from a running collector instead of polling",
+    )
+    parser.add_argument(
+        "--exporter", nargs="?", const="", metavar="HOST:PORT",
+        help="serve OpenMetrics on HOST:PORT/metrics instead of running the TUI",
+    )
+    parser.add_argument(
+        "--cached", action="store_true",
+        help="tui: show the snapshot saved on the last exit until fresh data arrives",
+    )
+    parser.add_argument(
+        "--record", metavar="FILE",
+        help="tui, collect: append every snapshot to FILE (gzip-compressed if it ends in .gz)",
+    )
+    parser.add_argument(
+        "--replay", metavar="FILE",
+        help="tui: show a recording made with --record instead of polling",
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0,
+        help="replay speed factor; 0 replays as fast as possible (default 1)",
+    )
+    args, extra = parser.parse_known_args()
+    if args.command == "bench":
+        from .bench import main as bench_main
+
+        sys.exit(bench_main(extra))
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    setup_logging()
+    try:
+        if args.exporter is not None:
+            from .exporter import MetricsExporter
+
+            MetricsExporter(args.exporter or None).run()
+        elif args.command == "collect":
+            from .daemon import CollectorDaemon
+
+            CollectorDaemon(args.listen, record=args.record).run()
+        else:
+            ProxmonApp(
+                attach=args.attach, cached=args.cached, record=args.record,
+                replay=args.replay, speed=args.speed,
+            ).run()
+    finally:
+        close_ssh_connections()
 
 
 if __name__ == "__main__":
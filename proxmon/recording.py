@@ -0,0 +1,110 @@
+"""Snapshot recordings for after-the-fact debugging and offline replay.
+
+A recording uses the collector daemon's wire format: one compact JSON
+snapshot per line, with guest lists after the first one per cluster
+stored as ``GuestListDelta`` messages, so an idle cluster costs a few
+bytes per poll. Files ending in ``.gz`` are gzip-compressed. Recording
+appends, so one file can span several sessions.
+
+``replay`` feeds a recording back at its original pace divided by
+``speed``; speed 0 replays as fast as the consumer keeps up, which makes
+a recording a repeatable load for profiling the render path.
+"""
+
+import gzip
+import logging
+import os
+import queue
+import threading
+
+from .collector import SNAPSHOT_TYPES, GuestListSnapshot, snapshot_to_dict
+from .daemon import encode, guest_list_delta, read_messages
+
+logger = logging.getLogger(__name__)
+
+# Longer pauses in a recording (e.g. the collector was stopped) are
+# replayed as this many seconds.
+REPLAY_MAX_GAP = float(os.getenv("REPLAY_MAX_GAP", 10))
+
+
+def open_recording(path, mode):
+    path = os.path.expanduser(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "b")
+    return open(path, mode + "b")
+
+
+class SnapshotRecorder:
+    """Append snapshots to a recording from a background thread."""
+
+    def __init__(self, path):
+        self._file = open_recording(path, "a")
+        self._queue = queue.SimpleQueue()
+        self._guest_lists = {}
+        self._thread = threading.Thread(target=self._write, name="proxmon-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, snapshot):
+        """Queue a snapshot; encoding and compression happen off the caller's thread.
+
+        Anything that is not a snapshot (e.g. a job's bookkeeping result)
+        is ignored.
+        """
+        if type(snapshot) in SNAPSHOT_TYPES.values():
+            self._queue.put(snapshot)
+
+    def _write(self):
+        while (snapshot := self._queue.get()) is not None:
+            try:
+                if isinstance(snapshot, GuestListSnapshot):
+                    message = guest_list_delta(self._guest_lists.get(snapshot.cluster), snapshot)
+                else:
+                    message = snapshot_to_dict(snapshot)
+                self._file.write(encode(message))
+                if isinstance(snapshot, GuestListSnapshot):
+                    self._guest_lists[snapshot.cluster] = snapshot
+                if self._queue.empty():
+                    # Keep the file readable up to here if proxmon is killed.
+                    self._file.flush()
+            except Exception:
+                # One bad snapshot must not stop the recording.
+                logger.exception("Recording %s failed", type(snapshot).__name__)
+        self._file.close()
+
+    def close(self):
+        """Write the queued snapshots and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def read_recording(path):
+    """Yield the snapshots of a recording in order, up to a truncated end."""
+    with open_recording(path, "r") as f:
+        try:
+            yield from read_messages(f)
+        except (EOFError, ValueError):
+            logger.warning("Recording %s ends with an incomplete frame", path)
+
+
+def replay(path, emit, speed=1.0, stop=None):
+    """Call ``emit`` with each snapshot of a recording, paced by ``speed``.
+
+    Returns the number of snapshots replayed, early if ``stop`` (a
+    threading.Event) is set.
+    """
+    stop = stop or threading.Event()
+    count = 0
+    previous = None
+    for snapshot in read_recording(path):
+        if stop.is_set():
+            break
+        if speed > 0 and previous is not None:
+            delay = min(snapshot.timestamp - previous, REPLAY_MAX_GAP) / speed
+            if delay > 0 and stop.wait(delay):
+                break
+        # Snapshots are recorded in arrival order, which for slow sources
+        # is not quite timestamp order; never wait for those twice.
+        previous = snapshot.timestamp if previous is None else max(previous, snapshot.timestamp)
+        emit(snapshot)
+        count += 1
+    return count
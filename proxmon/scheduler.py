@@ -0,0 +1,151 @@
+"""Adaptive polling scheduler for the data sources."""
+
+import logging
+import os
+import threading
+import time
+import types
+
+from .instrument import timer
+
+logger = logging.getLogger(__name__)
+
+# Base poll interval per data source, in seconds.
+POLL_INTERVALS = {
+    "guests": float(os.getenv("POLL_GUESTS", 10)),
+    "events": float(os.getenv("POLL_EVENTS", 1)),
+    "detail": float(os.getenv("POLL_DETAIL", 2)),
+    "node": float(os.getenv("POLL_NODE", 10)),
+    "nodedetail": float(os.getenv("POLL_NODE_DETAIL", 60)),
+    "addresses": float(os.getenv("POLL_ADDRESSES", 30)),
+    "temperature": float(os.getenv("POLL_TEMPERATURE", 10)),
+}
+MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 120))
+# Sources whose panel is hidden, or all sources while the terminal is
+# unfocused, poll this many times slower.
+IDLE_FACTOR = float(os.getenv("POLL_IDLE_FACTOR", 3))
+
+
+class Source:
+    """Scheduling state of one data source."""
+
+    def __init__(self, name, interval, job, max_interval=MAX_INTERVAL):
+        self.name = name
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max(max_interval, interval)
+        self.job = job
+        self.active = True
+        self.in_flight = False
+        self.pending = False
+        self.failures = 0
+        self.last_duration = 0.0
+        self.next_due = 0.0
+
+    def effective_interval(self, idle):
+        interval = self.interval
+        if idle or not self.active:
+            interval *= IDLE_FACTOR
+        return min(interval, self.max_interval)
+
+
+class Scheduler:
+    """Decides when each source is polled.
+
+    Every source has its own interval. A source is never started while a
+    previous run is still in flight, so slow requests cannot pile up.
+    After errors the interval backs off exponentially, and when a run
+    takes longer than half its interval the interval is stretched to
+    twice the observed duration; both recover once runs are fast and
+    healthy again. Inactive sources, or all of them while ``idle``, are
+    polled ``IDLE_FACTOR`` times slower.
+
+    ``submit(source)`` is called from ``tick`` to start a run; whoever
+    runs the job must report back through ``done``.
+    """
+
+    def __init__(self, submit, intervals=None):
+        self.submit = submit
+        self.intervals = dict(POLL_INTERVALS, **(intervals or {}))
+        self.sources = {}
+        self.idle = False
+        self._lock = threading.Lock()
+
+    def add(self, name, job, interval=None):
+        """Register a source; ``name`` may carry a ``:qualifier`` (e.g. a cluster)."""
+        interval = interval if interval is not None else self.intervals[name.split(":")[0]]
+        self.sources[name] = Source(name, interval, job)
+        return self.sources[name]
+
+    def set_active(self, name, active):
+        with self._lock:
+            source = self.sources[name]
+            if active and not source.active:
+                # Catch up immediately when a panel becomes visible.
+                source.next_due = 0.0
+            source.active = active
+
+    def trigger(self, name):
+        """Poll a source as soon as it is not in flight; unknown names are ignored."""
+        with self._lock:
+            source = self.sources.get(name)
+            if source is None:
+                return
+            source.next_due = 0.0
+            source.pending = source.in_flight
+
+    def tick(self, now=None):
+        """Start every source that is due and not already running."""
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            for source in self.sources.values():
+                if source.in_flight or now < source.next_due:
+                    continue
+                source.in_flight = True
+                due.append(source)
+        for source in due:
+            self.submit(source)
+
+    def run(self, source, emit):
+        """Run a source's job, pass its results to ``emit`` and record the outcome.
+
+        A job returns one result, None, or a generator yielding several
+        results, which are emitted as soon as each is ready.
+        """
+        start = time.monotonic()
+        ok = False
+        try:
+            with timer(f"poll {source.name}"):
+                result = source.job()
+                if isinstance(result, types.GeneratorType):
+                    for item in result:
+                        emit(item)
+                elif result is not None:
+                    emit(result)
+            ok = True
+        except Exception:
+            logger.exception("Polling %s failed", source.name)
+        finally:
+            self.done(source.name, time.monotonic() - start, ok)
+
+    def done(self, name, duration, ok):
+        with self._lock:
+            source = self.sources[name]
+            source.in_flight = False
+            source.last_duration = duration
+            if ok:
+                source.failures = 0
+                source.interval = max(source.base_interval, min(source.interval, duration * 2))
+                if duration > source.interval / 2:
+                    source.interval = min(duration * 2, source.max_interval)
+            else:
+                source.failures += 1
+                source.interval = min(
+                    source.base_interval * 2 ** source.failures, source.max_interval
+                )
+            if source.pending:
+                source.pending = False
+                source.next_due = 0.0
+            else:
+                source.next_due = time.monotonic() + source.effective_interval(self.idle)
@@ -0,0 +1,165 @@
+"""Temperature sensors of the SSH node.
+
+All thermal zones and hwmon temperature inputs are read in one call:
+with psutil when proxmon runs on the node itself, otherwise with a single
+``grep`` over sysfs on the persistent SSH connection, so a poll costs one
+channel on an open transport rather than one command per sensor.
+
+Readings are ``{sensor: °C}``. Thermal zones are named by their type
+(``x86_pkg_temp``, ``acpitz``), hwmon inputs by chip and label
+(``coretemp Package id 0``, ``nvme Composite``). ``CPU`` repeats the
+reading that best represents the CPU package.
+
+The Proxmox API has no sensor endpoint, so without SSH access, or
+proxmon running on the node itself, there are no temperatures.
+"""
+
+import os
+import re
+import socket
+from collections import defaultdict
+
+from .instrument import timer
+from .ssh import get_connection
+from .utils import SSH_HOST, SSH_NODE, SSH_PASSWORD, SSH_PORT, SSH_USER
+
+# auto: psutil if this machine is the node, else SSH; or force local or ssh.
+SENSOR_SOURCE = os.getenv("SENSOR_SOURCE", "auto").lower()
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# One "path:value" line per readable file; missing globs and unreadable
+# inputs (-s) are skipped rather than reported.
+SYSFS_COMMAND = (
+    "grep -sH . /sys/class/thermal/thermal_zone*/type /sys/class/thermal/thermal_zone*/temp "
+    "/sys/class/hwmon/hwmon*/name /sys/class/hwmon/hwmon*/temp*_input /sys/class/hwmon/hwmon*/temp*_label"
+)
+SYSFS_LINE = re.compile(
+    r"^/sys/class/(?:thermal/(thermal_zone\d+)/(type|temp)"
+    r"|hwmon/(hwmon\d+)/(name|temp(\d+)_input|temp(\d+)_label)):(.*)$"
+)
+# Readings that stand for the CPU package, best first; otherwise the
+# first thermal zone, like the single zone read of earlier versions.
+CPU_SENSORS = (
+    "coretemp Package id 0", "k10temp Tctl", "k10temp Tdie", "x86_pkg_temp", "cpu_thermal", "soc_thermal",
+)
+
+
+def _short(host):
+    return host.split(".")[0].lower()
+
+
+def is_local():
+    """Whether the sensors to read are this machine's: True, False (read
+    over SSH) or None when neither applies (no SSH_HOST, not on a node).
+
+    A workstation's own sensors must not pass for the node's, so without
+    SSH_HOST this machine counts only if it runs Proxmox (``/etc/pve``)
+    or is named like SSH_NODE.
+    """
+    if SENSOR_SOURCE in ("local", "ssh"):
+        return SENSOR_SOURCE == "local"
+    hostname = _short(socket.gethostname())
+    on_node = os.path.isdir("/etc/pve") or (SSH_NODE is not None and _short(SSH_NODE) == hostname)
+    host = (SSH_HOST or "").lower()
+    if not host:
+        return True if on_node else None
+    if _short(host) == hostname:
+        return True
+    # A loopback SSH_HOST may as well be a tunnel to another machine.
+    return host in LOOPBACK_HOSTS and on_node
+
+
+def _name(chip, label, ordinal, count):
+    if label:
+        return f"{chip} {label}"
+    return chip if count == 1 else f"{chip} {ordinal}"
+
+
+def _unique(pairs):
+    """Dict of the (name, value) pairs, numbering repeated names (two nvme chips)."""
+    readings = {}
+    seen = defaultdict(int)
+    for name, value in pairs:
+        seen[name] += 1
+        readings[name if seen[name] == 1 else f"{name} #{seen[name]}"] = value
+    return readings
+
+
+def with_cpu(readings):
+    """Add the ``CPU`` entry to sensor readings; None if there are none."""
+    if not readings:
+        return None
+    cpu = next((readings[name] for name in CPU_SENSORS if name in readings), None)
+    if cpu is None:
+        cpu = next(iter(readings.values()))
+    return {"CPU": cpu, **readings}
+
+
+def parse_sysfs(output):
+    """Sensor readings from SYSFS_COMMAND output; lines that are not readings are ignored."""
+    zones = defaultdict(dict)
+    chips = defaultdict(lambda: {"inputs": {}, "labels": {}})
+    for line in output.splitlines():
+        match = SYSFS_LINE.match(line.strip())
+        if match is None:
+            continue
+        zone, zone_file, chip, chip_file, input_no, label_no, value = match.groups()
+        value = value.strip()
+        if zone:
+            zones[zone][zone_file] = value
+        elif chip_file == "name":
+            chips[chip]["name"] = value
+        elif input_no:
+            chips[chip]["inputs"][int(input_no)] = value
+        else:
+            chips[chip]["labels"][int(label_no)] = value
+    pairs = []
+    for zone in sorted(zones, key=lambda z: int(z[len("thermal_zone"):])):
+        try:
+            pairs.append((zones[zone].get("type") or zone, int(zones[zone]["temp"]) / 1000))
+        except (KeyError, ValueError):
+            continue
+    for chip in sorted(chips, key=lambda c: int(c[len("hwmon"):])):
+        info = chips[chip]
+        inputs = sorted(info["inputs"].items())
+        for ordinal, (number, raw) in enumerate(inputs, 1):
+            try:
+                value = int(raw) / 1000
+            except ValueError:
+                continue
+            name = _name(info.get("name", chip), info["labels"].get(number), ordinal, len(inputs))
+            pairs.append((name, value))
+    return _unique(pairs)
+
+
+def read_local():
+    """Readings of this machine through psutil."""
+    import psutil
+
+    if not hasattr(psutil, "sensors_temperatures"):
+        return {}
+    pairs = []
+    for chip, entries in psutil.sensors_temperatures().items():
+        for ordinal, entry in enumerate(entries, 1):
+            pairs.append((_name(chip, entry.label, ordinal, len(entries)), float(entry.current)))
+    return _unique(pairs)
+
+
+def read_ssh():
+    """Readings of the SSH node in one command.
+
+    SSH errors propagate, so the scheduler backs off and the last
+    readings stay on screen. The read may share its exec with the
+    neighbour table read; error text in the output matches no reading.
+    """
+    with timer("ssh sensors"):
+        output = get_connection(SSH_HOST, SSH_USER, SSH_PASSWORD, SSH_PORT).run_shared(SYSFS_COMMAND)
+    return parse_sysfs(output)
+
+
+def read_sensors():
+    """Current readings of the SSH node, with ``CPU``; None when unavailable."""
+    local = is_local()
+    if local is None:
+        return None
+    return with_cpu(read_local() if local else read_ssh())
@@ -0,0 +1,198 @@
+"""Long-lived SSH connections to Proxmox nodes.
+
+A single authenticated transport is kept per host and every command runs
+on its own channel over it, so repeated reads only pay for a channel open
+instead of a full TCP connect and key exchange.
+
+Reads issued from several threads at about the same time (the sensor and
+neighbour table polls start in the same scheduler tick when their
+intervals line up) go through ``run_shared`` and share one exec round
+trip via ``run_batch``.
+"""
+
+import logging
+import os
+import shlex
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+BATCH_MARKER = "__PROXMON_BATCH__"
+# How long the first of several concurrent reads waits for others to join it.
+SSH_BATCH_WINDOW = float(os.getenv("SSH_BATCH_WINDOW", 0.05))
+
+
+class SSHConnection:
+    """Persistent, self-healing SSH transport that multiplexes channels."""
+
+    def __init__(self, host, username, password, port=22, timeout=10, keepalive=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self._client = None
+        self._lock = threading.Lock()
+        # {command: Future} of the reads waiting to share the next exec.
+        self._batch = None
+        self._batch_lock = threading.Lock()
+
+    def connect(self):
+        """(Re)establish the underlying transport and return its client.
+
+        Callers use the returned client rather than ``self._client``, which
+        another thread's reconnect may replace or clear at any time.
+        """
+        # paramiko is slow to import; defer it until SSH is actually used.
+        import paramiko
+
+        with self._lock:
+            if self.is_alive():
+                return self._client
+            self._close_client()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
+                self.host,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                timeout=self.timeout,
+            )
+            client.get_transport().set_keepalive(self.keepalive)
+            self._client = client
+            return client
+
+    def is_alive(self):
+        """Health check: True if the transport is up and answering."""
+        import paramiko
+
+        transport = self._client.get_transport() if self._client else None
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except (paramiko.SSHException, EOFError, OSError):
+            return False
+        return True
+
+    def run(self, command, timeout=None):
+        """Run a command on a new channel and return (stdout, stderr).
+
+        If the channel cannot be opened because the connection went away,
+        the transport is rebuilt once and the command retried.
+        """
+        import paramiko
+
+        for attempt in (1, 2):
+            client = None
+            try:
+                client = self.connect()
+                _, stdout, stderr = client.exec_command(
+                    command, timeout=timeout or self.timeout
+                )
+                return (
+                    stdout.read().decode().strip(),
+                    stderr.read().decode().strip(),
+                )
+            except (paramiko.SSHException, EOFError, OSError):
+                if attempt == 2:
+                    raise
+                logger.info("SSH connection to %s lost, reconnecting", self.host)
+                with self._lock:
+                    # Another thread may have reconnected already.
+                    if client is None or self._client is client:
+                        self._close_client()
+
+    def run_batch(self, commands, timeout=None):
+        """Run several commands in one exec round trip.
+
+        ``commands`` maps a name to a shell command. Returns a dict mapping
+        each name to the combined stdout/stderr of its command.
+        """
+        script = "; ".join(
+            f"printf '\\n%s\\n' {shlex.quote(BATCH_MARKER + name)}; {{ {command}; }} 2>&1"
+            for name, command in commands.items()
+        )
+        output, _ = self.run(script, timeout=timeout)
+        results = dict.fromkeys(commands, "")
+        current = None
+        lines = []
+        for line in output.splitlines() + [BATCH_MARKER]:
+            if line.startswith(BATCH_MARKER):
+                if current in results:
+                    results[current] = "\n".join(lines).strip()
+                current = line[len(BATCH_MARKER):]
+                lines = []
+            else:
+                lines.append(line)
+        return results
+
+    def run_shared(self, command, timeout=None, window=None):
+        """Run a command and return its combined stdout/stderr, sharing one
+        exec with the commands other threads issue within ``window``
+        seconds (SSH_BATCH_WINDOW by default). SSH errors propagate to
+        every command of the batch.
+        """
+        with self._batch_lock:
+            leader = self._batch is None
+            if leader:
+                self._batch = {}
+            future = self._batch.setdefault(command, Future())
+        if not leader:
+            return future.result()
+        time.sleep(SSH_BATCH_WINDOW if window is None else window)
+        with self._batch_lock:
+            batch, self._batch = self._batch, None
+        try:
+            if len(batch) == 1:
+                results = {command: "\n".join(filter(None, self.run(command, timeout=timeout)))}
+            else:
+                names = dict(zip(map(str, range(len(batch))), batch))
+                output = self.run_batch(names, timeout=timeout)
+                results = {names[name]: text for name, text in output.items()}
+        except Exception as e:
+            for waiting in batch.values():
+                waiting.set_exception(e)
+        else:
+            for cmd, waiting in batch.items():
+                waiting.set_result(results[cmd])
+        return future.result()
+
+    def _close_client(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def close(self):
+        with self._lock:
+            self._close_client()
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(host, username, password, port=22):
+    """Return the shared connection for a host, creating it on first use."""
+    key = (host, port, username)
+    with _connections_lock:
+        conn = _connections.get(key)
+        if conn is None or conn.password != password:
+            conn = SSHConnection(host, username, password, port=port)
+            _connections[key] = conn
+        return conn
+
+
+def close_all():
+    """Close every pooled connection."""
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
@@ -0,0 +1,195 @@
+"""Optional on-disk metrics history.
+
+Samples are kept in SQLite, one table per resolution tier:
+
+* raw: every sample as it was collected (2 s for the selected guest,
+  the guest list interval for the others),
+* 1m and 1h: roll-ups of the tier below, averaging gauges and keeping
+  the last value of cumulative counters.
+
+Node sensor temperatures go through the same tiers in ``sensors_<tier>``
+tables, one row per sensor reading.
+
+Each tier has its own retention. Writes are buffered and flushed in one
+transaction, and tables are clustered on ``(cluster, vmid, ts)`` and read
+through SQLite's memory-mapped I/O, so loading a day of data for a chart
+is one sequential range scan.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .history import COUNTERS, GUEST_METRICS
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB = os.getenv("HISTORY_DB")
+# (tier, bucket seconds, retention seconds); bucket 0 stores raw samples.
+TIERS = (
+    ("raw", 0, float(os.getenv("HISTORY_RETENTION_RAW", 6 * 3600))),
+    ("1m", 60, float(os.getenv("HISTORY_RETENTION_1M", 8 * 86400))),
+    ("1h", 3600, float(os.getenv("HISTORY_RETENTION_1H", 400 * 86400))),
+)
+FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", 30))
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class MetricsStore:
+    """Tiered guest metric history in a SQLite file."""
+
+    def __init__(self, path, columns=GUEST_METRICS, tiers=TIERS):
+        self.path = os.path.expanduser(path)
+        self.columns = tuple(columns)
+        self.tiers = tiers
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []
+        self._pending_sensors = []
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        metrics = ", ".join(f"{c} REAL" for c in self.columns)
+        for tier, _, _ in self.tiers:
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS samples_{tier} ("
+                f"cluster TEXT, vmid INTEGER, ts REAL, {metrics}, "
+                "PRIMARY KEY (cluster, vmid, ts)) WITHOUT ROWID"
+            )
+            # Databases written by older versions lack newer metric columns.
+            existing = {row[1] for row in self._db.execute(f"PRAGMA table_info(samples_{tier})")}
+            for column in self.columns:
+                if column not in existing:
+                    self._db.execute(f"ALTER TABLE samples_{tier} ADD COLUMN {column} REAL DEFAULT 0")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS sensors_{tier} ("
+                "cluster TEXT, node TEXT, sensor TEXT, ts REAL, value REAL, "
+                "PRIMARY KEY (cluster, node, sensor, ts)) WITHOUT ROWID"
+            )
+        self._db.execute("CREATE TABLE IF NOT EXISTS rollups (tier TEXT PRIMARY KEY, until REAL)")
+
+    def record(self, key, ts, values):
+        """Queue a sample for the next flush."""
+        cluster, vmid = key
+        with self._pending_lock:
+            self._pending.append((cluster, vmid, ts, *(values.get(c, 0.0) for c in self.columns)))
+
+    def record_sensors(self, cluster, node, ts, readings):
+        """Queue the ``{sensor: value}`` readings of a node for the next flush."""
+        with self._pending_lock:
+            self._pending_sensors.extend(
+                (cluster, node, sensor, ts, float(value)) for sensor, value in readings.items()
+            )
+
+    def flush(self, now=None):
+        """Write queued samples, roll up finished buckets and apply retention."""
+        now = time.time() if now is None else now
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            sensors, self._pending_sensors = self._pending_sensors, []
+        placeholders = ", ".join("?" * (3 + len(self.columns)))
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO samples_raw VALUES ({placeholders})", pending
+                )
+                self._db.executemany("INSERT OR REPLACE INTO sensors_raw VALUES (?, ?, ?, ?, ?)", sensors)
+                for (source, _, _), (tier, bucket, _) in zip(self.tiers, self.tiers[1:]):
+                    self._rollup(source, tier, bucket, now)
+                for tier, _, retention in self.tiers:
+                    self._db.execute(f"DELETE FROM samples_{tier} WHERE ts < ?", (now - retention,))
+                    self._db.execute(f"DELETE FROM sensors_{tier} WHERE ts < ?", (now - retention,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(pending)
+
+    def _rollup(self, source, tier, bucket, now):
+        row = self._db.execute("SELECT until FROM rollups WHERE tier = ?", (tier,)).fetchone()
+        start = row[0] if row else 0.0
+        end = now // bucket * bucket
+        if end <= start:
+            return
+        aggregates = ", ".join(
+            f"max({c})" if c in COUNTERS else f"avg({c})" for c in self.columns
+        )
+        self._db.execute(
+            f"INSERT OR REPLACE INTO samples_{tier} "
+            f"SELECT cluster, vmid, CAST(ts / {bucket} AS INTEGER) * {bucket}, {aggregates} "
+            f"FROM samples_{source} WHERE ts >= ? AND ts < ? GROUP BY 1, 2, 3",
+            (start // bucket * bucket, end),
+        )
+        self._db.execute(
+            f"INSERT OR REPLACE INTO sensors_{tier} "
+            f"SELECT cluster, node, sensor, CAST(ts / {bucket} AS INTEGER) * {bucket}, avg(value) "
+            f"FROM sensors_{source} WHERE ts >= ? AND ts < ? GROUP BY 1, 2, 3, 4",
+            (start // bucket * bucket, end),
+        )
+        self._db.execute("INSERT OR REPLACE INTO rollups VALUES (?, ?)", (tier, end))
+
+    def tier_for(self, since, now=None):
+        """The finest tier whose retention reaches back to ``since``."""
+        age = (time.time() if now is None else now) - since
+        for tier, bucket, retention in self.tiers:
+            if retention >= age:
+                return tier, bucket
+        return self.tiers[-1][:2]
+
+    def load(self, key, since, now=None):
+        """Return ``[(ts, values)]`` for a guest since ``since``, oldest first."""
+        tier, _ = self.tier_for(since, now)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT ts, {', '.join(self.columns)} FROM samples_{tier} "
+                "WHERE cluster = ? AND vmid = ? AND ts >= ? ORDER BY ts",
+                (*key, since),
+            ).fetchall()
+        return [(ts, dict(zip(self.columns, values))) for ts, *values in rows]
+
+    def load_sensors(self, cluster, node, since, now=None):
+        """Return ``{sensor: [(ts, value)]}`` for a node since ``since``, oldest first."""
+        tier, _ = self.tier_for(since, now)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT sensor, ts, value FROM sensors_{tier} "
+                "WHERE cluster = ? AND node = ? AND ts >= ? ORDER BY sensor, ts",
+                (cluster, node, since),
+            ).fetchall()
+        history = {}
+        for sensor, ts, value in rows:
+            history.setdefault(sensor, []).append((ts, value))
+        return history
+
+    def covers(self, key, since, now=None):
+        """Whether stored history for a guest reaches back to ``since``."""
+        tier, bucket = self.tier_for(since, now)
+        with self._lock:
+            (oldest,) = self._db.execute(
+                f"SELECT min(ts) FROM samples_{tier} WHERE cluster = ? AND vmid = ?", key
+            ).fetchone()
+        return oldest is not None and oldest <= since + max(bucket, 60)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._db.close()
+
+
+def open_store(path=HISTORY_DB):
+    """Open the configured store, or return None when persistence is off."""
+    if not path:
+        return None
+    try:
+        return MetricsStore(path)
+    except (OSError, sqlite3.Error):
+        logger.exception("Cannot open history database %s", path)
+        return None
@@ -1,12 +1,19 @@
-import requests
+from functools import partial
+import logging
 import os
-import re
-import paramiko
-import psutil
 from dotenv import load_dotenv
 
+from .api import ProxmoxClient, AsyncProxmoxClient
+from .ssh import get_connection
+from .cache import ConfigCache
+from .discovery import GuestAgentProvider, IPDiscovery, LxcInterfacesProvider, NeighborProvider
+from .charts import ChartRenderer
+from .instrument import timer
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Proxmox API configuration
 PROXMOX_API_URL = os.getenv("PROXMOX_HOST")
 API_TOKEN_ID = os.getenv("TOKEN_ID")
@@ -17,8 +24,54 @@ SSH_PORT = int(os.getenv("SSH_PORT", 22))
 SSH_USER = os.getenv("SSH_USER")
 SSH_PASSWORD = os.getenv("SSH_PASSWORD")
 NO_SSL_CHECK = os.getenv("NO_SSL_CHECK", "false").lower() in ("true", "1", "yes", "on")
+# Node that SSH_HOST belongs to; the temperature is only reported for it.
+SSH_NODE = os.getenv("SSH_NODE") or (NODE.split(",")[0].strip() if NODE else None)
+
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", 3.05))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", 10))
+API_RETRIES = int(os.getenv("API_RETRIES", 3))
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", 600))
+COLLECT_PARALLELISM = int(os.getenv("COLLECT_PARALLELISM", 8))
+
+DEFAULT_CLUSTER = "default"
 
-HEADERS = {"Authorization": f"PVEAPIToken={API_TOKEN_ID}={API_TOKEN_SECRET}"}
+def _truthy(value):
+    return str(value).lower() in ("true", "1", "yes", "on")
+
+def _load_clusters():
+    """Read cluster settings from the environment.
+
+    The unprefixed PROXMOX_HOST/TOKEN_ID/TOKEN_SECRET/NODE/NO_SSL_CHECK
+    variables describe the default cluster. Further clusters are listed in
+    CLUSTERS (comma separated) and configured with the same variables
+    prefixed by the upper-cased cluster name, e.g. LAB_PROXMOX_HOST.
+    NODE may list several nodes; when empty, every node is monitored.
+    """
+    clusters = {}
+    if PROXMOX_API_URL:
+        clusters[DEFAULT_CLUSTER] = {
+            "host": PROXMOX_API_URL,
+            "token_id": API_TOKEN_ID,
+            "token_secret": API_TOKEN_SECRET,
+            "verify": not NO_SSL_CHECK,
+            "nodes": [n.strip() for n in (NODE or "").split(",") if n.strip()],
+        }
+    for name in filter(None, (c.strip() for c in os.getenv("CLUSTERS", "").split(","))):
+        prefix = name.upper().replace("-", "_") + "_"
+        clusters[name] = {
+            "host": os.getenv(prefix + "PROXMOX_HOST"),
+            "token_id": os.getenv(prefix + "TOKEN_ID"),
+            "token_secret": os.getenv(prefix + "TOKEN_SECRET"),
+            "verify": not _truthy(os.getenv(prefix + "NO_SSL_CHECK", "false")),
+            "nodes": [n.strip() for n in os.getenv(prefix + "NODE", "").split(",") if n.strip()],
+        }
+    return clusters or {DEFAULT_CLUSTER: {"host": None, "token_id": None, "token_secret": None, "verify": True, "nodes": []}}
+
+CLUSTERS = _load_clusters()
+
+_clients = {}
+_config_caches = {}
+_ip_discoveries = {}
 
 # Global variables
 TABLE_CURSOR = dict()
@@ -30,61 +83,14 @@ selected_vm = {
 }
 
 def ssh_execute_command(host, username, password, command, port=22):
-    """SSH into a Proxmox node and execute a command."""
+    """Execute a command on a Proxmox node over a persistent SSH connection,
+    sharing the exec with other reads due at the same time (see ssh.py)."""
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(host, port=port, username=username, password=password, timeout=10)
-        stdin, stdout, stderr = client.exec_command(command)
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-        client.close()
-        return output if output else error
+        with timer(f"ssh {command.split()[0] if command else ''}"):
+            return get_connection(host, username, password, port).run_shared(command)
     except Exception as e:
         return f"SSH Connection failed: {str(e)}"
 
-# Fetch data from Proxmox API
-def get_data_from_proxapi(url):
-    """Fetch data from Proxmox API"""
-    response = requests.get(url, headers=HEADERS, verify=not NO_SSL_CHECK)
-    response.raise_for_status()
-    return response.json()['data']
-
-def get_vm_config(vmid,vm_type):
-    """Fetch vm/lxc config"""
-    if vm_type == "vm":
-        guesttype = "qemu"
-    else:
-        guesttype = "lxc"
-    url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/config"
-    return get_data_from_proxapi(url)
-
-def get_vmids():
-    vmids = {"vm": [], "lxc": []}
-    vm_data = get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/qemu")
-    vmids["vm"].extend([vm["vmid"] for vm in vm_data])
-    lxc_data = get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/lxc")
-    vmids["lxc"].extend([lxc["vmid"] for lxc in lxc_data])
-    return vmids
-
-def get_vm_data(vmid, type="vm"):
-    if type == "vm":
-        url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/qemu/{vmid}/status/current"
-    elif type == "lxc":
-        url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/lxc/{vmid}/status/current"
-    else:
-        return None
-    # url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/qemu/{vmid}/status/current"
-    return get_data_from_proxapi(url)
-
-def get_rrd_data(vmid, type="vm"):
-    if type == "vm":
-        guesttype = "qemu"
-    else:
-        guesttype = "lxc"
-    url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/rrddata?timeframe=hour"
-    return get_data_from_proxapi(url)
-
 def draw_vertical_bar_chart(data, height=10, value_width=5, 
                             decimal_places=1, chart_width=None,
                             color = "white", char="░",
@@ -92,122 +98,267 @@ def draw_vertical_bar_chart(data, height=10, value_width=5,
     """
     Draws a vertical bar chart with consistent padding and adjustable width.
 
+    Kept for compatibility; new code should hold a charts.ChartRenderer
+    per panel so buffers are reused between frames.
+
     Args:
-        data: A list of numerical values to chart.
+        data: A sequence of numerical values to chart.
         height: The height of the chart.
         value_width: The total width of the formatted numerical value.
         decimal_places: The number of decimal places to display.
         chart_width: The width of the bars in the chart. If None, it defaults to the length of the data.
+        char: Fill character, or "blocks"/"braille" for sub-cell resolution.
         max_output_width: Maximum width of the output string.
     Returns:
         A string representation of the chart.
     """
     if chart_width is None:
         chart_width = len(data)
+    chart_width = max(min(chart_width, max_output_width - value_width - 3), 1)
+    return ChartRenderer(
+        height=height,
+        width=chart_width,
+        value_width=value_width,
+        decimal_places=decimal_places,
+        color=color,
+        style=char,
+    ).render(data)
+
+def get_client(cluster=None):
+    """Return the shared, pooled Proxmox API client of a cluster."""
+    cluster = cluster or default_cluster()
+    client = _clients.get(cluster)
+    if client is None:
+        settings = CLUSTERS[cluster]
+        client = _clients[cluster] = ProxmoxClient(
+            settings["host"],
+            settings["token_id"],
+            settings["token_secret"],
+            verify=settings["verify"],
+            timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT),
+            retries=API_RETRIES,
+        )
+    return client
+
+def get_async_client(cluster=None):
+    """Return an asyncio front-end sharing the pooled client's connections."""
+    return AsyncProxmoxClient(get_client(cluster))
+
+def default_cluster():
+    return next(iter(CLUSTERS))
+
+def default_node(cluster=None):
+    """The first configured node of a cluster, for single-node helpers."""
+    nodes = CLUSTERS[cluster or default_cluster()]["nodes"]
+    return nodes[0] if nodes else None
+
+def guest_key(guest):
+    """Key identifying a guest across clusters."""
+    return (guest.get("cluster", default_cluster()), guest["vmid"])
 
-    max_value = max(data)
-    min_value = min(data)
-    range_value = max_value - min_value
-
-    chart = [[' ' for _ in range(chart_width)] for _ in range(height)]
-
-    for i, value in enumerate(data):
-        normalized_value = int((value - min_value) / range_value * (height - 1)) if range_value > 0 else 0
-        if i < chart_width:
-            for h in range(normalized_value + 1):
-                if h < height:
-                    chart[height - 1 - h][i] = f'{char}'
-
-    chart_str = ""
-    format_string = f">{value_width}.{decimal_places}f"
-    for h in range(height):
-        value_at_height = min_value + (range_value * (height - 1 - h) / (height - 1)) if range_value > 0 else min_value
-        formatted_value = f"{value_at_height:{format_string}}"
-        chart_str += f"{formatted_value} ┤ " + ''.join(chart[h]) + "\n"
-
-    chart_str += f"{' ' * value_width} ╰" + '─' * chart_width + "\n"
-    # chart_str += "    " + ' '.join(str(i) for i in range(len(data))) + "\n"
-
-    # Limit the output width
-    lines = chart_str.splitlines()
-    truncated_lines = []
-    for line in lines:
-        if len(line) > max_output_width:
-            truncated_lines.append(line[:max_output_width] + "...")
-        else:
-            truncated_lines.append(line)
-    chart_str = "\n".join(truncated_lines)
-
-    return f"[{color}]{chart_str}[/{color}]"
-
-def get_data_from_proxapi(url):
-    """Fetch data from Proxmox API."""
-    response = requests.get(url, headers=HEADERS, verify=not NO_SSL_CHECK)
-    response.raise_for_status()
-    return response.json()['data']
+def get_data_from_proxapi(url, cluster=None):
+    """Fetch data from Proxmox API (accepts a full URL or an API path)."""
+    return get_client(cluster).get(url)
+
+def get_vm_config(vmid, vm_type, node=None, cluster=None):
+    """Fetch vm/lxc config"""
+    guesttype = "qemu" if vm_type == "vm" else "lxc"
+    url = f"/nodes/{node or default_node(cluster)}/{guesttype}/{vmid}/config"
+    return get_data_from_proxapi(url, cluster)
+
+def _config_path(vmid, guesttype, node):
+    return f"/nodes/{node}/{guesttype}/{vmid}/config"
+
+def get_config_cache(cluster=None):
+    """Return the config cache of a cluster; entries are keyed by vmid."""
+    cluster = cluster or default_cluster()
+    cache = _config_caches.get(cluster)
+    if cache is None:
+        cache = _config_caches[cluster] = ConfigCache(
+            get_client(cluster).get_many, ttl=CONFIG_CACHE_TTL
+        )
+    return cache
+
+def get_cached_vm_config(vmid, vm_type, node=None, cluster=None):
+    """Fetch vm/lxc config, served from the config cache when possible."""
+    guesttype = "qemu" if vm_type == "vm" else "lxc"
+    path = _config_path(vmid, guesttype, node or default_node(cluster))
+    return get_config_cache(cluster).get(int(vmid), path)
 
 def get_vmids():
     """Retrieve VM and LXC IDs from Proxmox."""
     vmids = {"vm": [], "lxc": []}
-    vm_data = get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/qemu")
+    vm_data = get_data_from_proxapi(f"/nodes/{default_node()}/qemu")
     vmids["vm"].extend([vm["vmid"] for vm in vm_data])
-    lxc_data = get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/lxc")
+    lxc_data = get_data_from_proxapi(f"/nodes/{default_node()}/lxc")
     vmids["lxc"].extend([lxc["vmid"] for lxc in lxc_data])
     return vmids
 
 def get_vmids_dict():
     """Retrieve VM and LXC IDs as a dictionary."""
     vmids = {}
-    for vm in get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/qemu"):
+    for vm in get_data_from_proxapi(f"/nodes/{default_node()}/qemu"):
         vmids[vm["vmid"]] = {"type": "qemu"}
-    for lxc in get_data_from_proxapi(f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/lxc"):
+    for lxc in get_data_from_proxapi(f"/nodes/{default_node()}/lxc"):
         vmids[lxc["vmid"]] = {"type": "lxc"}
     return vmids
 
-def get_vm_data(vmid, type="vm"):
+def get_cluster_resources(resource_type="vm", cluster=None):
+    """Retrieve cluster-wide resources of one type in a single request."""
+    url = f"/cluster/resources?type={resource_type}"
+    return get_data_from_proxapi(url, cluster)
+
+def get_nodes(cluster=None):
+    """List the monitored nodes of a cluster (all nodes unless NODE filters them)."""
+    wanted = CLUSTERS[cluster or default_cluster()]["nodes"]
+    nodes = get_data_from_proxapi("/nodes", cluster)
+    return [n for n in nodes if not wanted or n["node"] in wanted]
+
+def _normalize_guest(data, guest_type, cluster):
+    """Give list/resource entries the same shape as status/current."""
+    data["type"] = "VM" if guest_type == "qemu" else "LXC"
+    data["vmid"] = int(data["vmid"])
+    data["cluster"] = cluster
+    data.setdefault("cpus", data.get("maxcpu", 0))
+    data.setdefault("name", "")
+    return data
+
+def get_guests_snapshot(node=None, cluster=None):
+    """Retrieve status data for every VM and LXC of a cluster.
+
+    Uses the single /cluster/resources?type=vm call, which already carries
+    cpu/mem/disk/net and the node of every guest. Falls back to the
+    per-node list endpoints, fetched concurrently, if the token is not
+    allowed to read cluster resources. Only ``node``, or the cluster's
+    configured nodes, are returned.
+    """
+    from requests import HTTPError
+
+    cluster = cluster or default_cluster()
+    wanted = [node] if node else CLUSTERS[cluster]["nodes"]
+    try:
+        resources = get_cluster_resources("vm", cluster)
+    except HTTPError:
+        online = [n["node"] for n in get_nodes(cluster) if n.get("status") == "online"]
+        nodes = [n for n in wanted if n in online] if wanted else online
+        pairs = [(n, t) for n in nodes for t in ("qemu", "lxc")]
+        results = get_client(cluster).get_many(
+            (f"/nodes/{n}/{t}" for n, t in pairs), return_exceptions=True
+        )
+        guests = []
+        for (n, guesttype), items in zip(pairs, results):
+            if isinstance(items, Exception):
+                # Only this node's guests are missing from the list.
+                logger.warning("Listing %s guests of node %s failed: %s", guesttype, n, items)
+                continue
+            for item in items:
+                if item.get("template"):
+                    continue
+                item["node"] = n
+                guests.append(_normalize_guest(item, guesttype, cluster))
+        return sorted(guests, key=lambda d: d["vmid"])
+
+    guests = [
+        _normalize_guest(item, item["type"], cluster)
+        for item in resources
+        if item.get("type") in ("qemu", "lxc")
+        and not item.get("template")
+        and (not wanted or item.get("node") in wanted)
+    ]
+    return sorted(guests, key=lambda d: d["vmid"])
+
+def get_guest_statuses(guests, cluster=None):
+    """Re-fetch status/current of some guests concurrently, as guest list entries.
+
+    Each result is the guest's previous entry updated with its current
+    status, or the exception raised fetching it.
+    """
+    cluster = cluster or default_cluster()
+    guests = list(guests)
+    paths = (
+        f"/nodes/{g['node']}/{'qemu' if g['type'] == 'VM' else 'lxc'}/{g['vmid']}/status/current"
+        for g in guests
+    )
+    results = []
+    for guest, status in zip(guests, get_client(cluster).get_many(paths, return_exceptions=True)):
+        if isinstance(status, Exception):
+            results.append(status)
+            continue
+        entry = dict(guest, **status)
+        entry["vmid"] = guest["vmid"]
+        results.append(_normalize_guest(entry, "qemu" if guest["type"] == "VM" else "lxc", cluster))
+    return results
+
+def get_vm_data(vmid, type="vm", node=None, cluster=None):
     """Retrieve data for a specific VM or LXC."""
     guesttype = "qemu" if type == "vm" else "lxc"
-    url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/status/current"
-    return get_data_from_proxapi(url)
+    url = f"/nodes/{node or default_node(cluster)}/{guesttype}/{vmid}/status/current"
+    return get_data_from_proxapi(url, cluster)
 
-def get_rrd_data(vmid, vm_type="vm"):
-    """Retrieve RRD data for a specific VM or LXC."""
+def get_rrd_data(vmid, vm_type="vm", timeframe="hour", cf="AVERAGE", node=None, cluster=None):
+    """Retrieve RRD data for a specific VM or LXC.
+
+    ``timeframe`` is one of hour, day, week, month or year; the server
+    returns roughly 70 pre-aggregated points for each.
+    """
     guesttype = "qemu" if vm_type == "vm" else "lxc"
-    url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{guesttype}/{vmid}/rrddata?timeframe=hour"
-    return get_data_from_proxapi(url)
+    url = f"/nodes/{node or default_node(cluster)}/{guesttype}/{vmid}/rrddata?timeframe={timeframe}&cf={cf}"
+    return get_data_from_proxapi(url, cluster)
 
-def get_pve_subnets():
+def get_pve_subnets(node=None, cluster=None):
     """Retrieve Proxmox subnets."""
-    url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/network/"
-    data = get_data_from_proxapi(url)
+    url = f"/nodes/{node or default_node(cluster)}/network/"
+    data = get_data_from_proxapi(url, cluster)
     return [item['cidr'] for item in data if 'cidr' in item]
 
-def find_vm_ip_address():
-    """Find IP addresses of VMs based on their MAC addresses."""
+def get_ip_discovery(cluster=None):
+    """Return the IP discovery engine of a cluster, creating it on first use."""
+    cluster = cluster or default_cluster()
+    if cluster not in _ip_discoveries:
+        client = get_client(cluster)
+        providers = [GuestAgentProvider(client), LxcInterfacesProvider(client)]
+        if SSH_HOST:
+            providers.append(NeighborProvider(
+                partial(ssh_execute_command, SSH_HOST, SSH_USER, SSH_PASSWORD, "ip -j neigh", SSH_PORT)
+            ))
+        _ip_discoveries[cluster] = IPDiscovery(providers)
+    return _ip_discoveries[cluster]
+
+def find_vm_ip_address(guests=None):
+    """Find the IP addresses of every NIC of the guests.
+
+    ``guests`` may be a snapshot from get_guests_snapshot(); passing it
+    avoids listing the guests again. NICs come from the cached guest
+    configs, addresses from the guest agent, the LXC interfaces endpoint
+    or the node's neighbour table (see discovery.py). The result is keyed
+    by guest_key().
+    """
+    if guests is None:
+        guests = [
+            {"vmid": vmid, "type": "VM" if info["type"] == "qemu" else "LXC", "node": default_node()}
+            for vmid, info in get_vmids_dict().items()
+        ]
+    by_cluster = {}
+    for g in guests:
+        by_cluster.setdefault(g.get("cluster", default_cluster()), []).append(g)
     ip_table = {}
-    neigh_data = ssh_execute_command(SSH_HOST, SSH_USER, SSH_PASSWORD, "arp -a", SSH_PORT)
-    pattern = re.compile(r"\(\s*(\d+\.\d+\.\d+\.\d+)\s*\) at (\S+)")
-    matches = pattern.findall(neigh_data)
-    mac_to_ip = {mac.upper(): ip for ip, mac in matches}
-
-    vmid_data = get_vmids_dict()
-    for vmid, info in vmid_data.items():
-        url = f"{PROXMOX_API_URL}/api2/json/nodes/{NODE}/{info['type']}/{vmid}/config"
-        config_data = get_data_from_proxapi(url)
-        net_config = config_data.get("net0", "")
-        mac_match = re.search(r"(?:hwaddr=)?([0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5})", net_config)
-        mac_address = mac_match.group(1) if mac_match else None
-        if mac_address:
-            ip_table[vmid] = {"mac": mac_address, "ip": mac_to_ip.get(mac_address, "N/A")}
+    for cluster, members in by_cluster.items():
+        cache = get_config_cache(cluster)
+        cache.sync(members)
+        entries = cache.get_many(
+            (g["vmid"], _config_path(g["vmid"], "qemu" if g["type"] == "VM" else "lxc", g["node"]))
+            for g in members
+        )
+        lookup = [
+            {
+                **g,
+                "status": g.get("status", "running"),
+                "config": entries[g["vmid"]]["config"],
+                "macs": entries[g["vmid"]]["macs"],
+            }
+            for g in members
+            if g["vmid"] in entries and entries[g["vmid"]]["macs"]
+        ]
+        for vmid, entry in get_ip_discovery(cluster).discover(lookup).items():
+            ip_table[(cluster, vmid)] = entry
     return ip_table
-
-def get_cpu_temperature():
-    """Get the CPU temperature using psutil or SSH command."""
-    # if hasattr(psutil, "sensors_temperatures"):
-    #     temps = psutil.sensors_temperatures()
-    #     if "coretemp" in temps:
-    #         return {entry.label or "CPU": entry.current for entry in temps["coretemp"]}
-    #     elif "cpu_thermal" in temps:
-    #         return {"CPU": temps["cpu_thermal"][0].current}
-    temp = ssh_execute_command(SSH_HOST, SSH_USER, SSH_PASSWORD, "cat /sys/class/thermal/thermal_zone0/temp", SSH_PORT)
-    return {"CPU": "%.1f" % (float(temp) / 1000)} if temp else None
\ No newline at end of file